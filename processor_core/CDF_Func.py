@@ -1,14 +1,69 @@
 import logging
 import time
+import sys
+import gzip
+import json
+import ctypes
+import threading
 import concurrent.futures
+from collections import deque
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from os import path, makedirs
+from os import path, makedirs, listdir
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # resource module is not available on Windows (see get_peak_memory_mb)
+    resource = None
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    # pyarrow is optional - only required for zstd compressed .csv files and reading the partitioned dataset
+    pa = None
+    ds = None
+
+
+class LogRecordCapture(logging.Filter):
+    """ Logger filter that holds back the log records of threads that have started a capture.
+
+    Log records of a capturing thread are added to the capture list instead of being handled by the logger, so they
+    can be handled later in a set order (see CDFfunc.get_log_record_capture). Log records of other threads pass
+    through as normal.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.thread_data = threading.local()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record_ls = getattr(self.thread_data, 'record_ls', None)
+        if record_ls is None:
+            return True
+        record_ls.append(record)
+        return False
+
+    @contextmanager
+    def capture(self) -> list:
+        """ Capture the log records of the current thread for the duration of the with block.
+
+        Returns:
+            List object. The captured log records (in the order they were logged).
+        """
+        prev_record_ls = getattr(self.thread_data, 'record_ls', None)
+        record_ls = []
+        self.thread_data.record_ls = record_ls
+        try:
+            yield record_ls
+        finally:
+            self.thread_data.record_ls = prev_record_ls
 
 
 class CDFfunc:
 
-    version: str = "1.2.1"
+    version: str = "1.11.0"
 
     @staticmethod
     def get_unique_list(*input_lists: list) -> list:
@@ -111,6 +166,283 @@ class CDFfunc:
 
         return output_df
 
+    @staticmethod
+    def get_last_track_idx(track_keys, track_seqs, query_keys, query_seqs) -> np.ndarray:
+        """ Get the index of the last track item at or before each query.
+
+        A track is a set of items, each with a key (i.e. entity uid) and a sequence value (i.e. time). For each query
+        the index of the last track item with the same key and a sequence value at or before the query sequence value
+        is returned. Where several track items have the same key and sequence value the last of them in the input
+        order is used. Null keys never match.
+
+        Args:
+            track_keys: Key for each track item (array-like).
+            track_seqs: Sequence value for each track item (array-like, numeric).
+            query_keys: Key for each query (array-like).
+            query_seqs: Sequence value for each query (array-like, numeric).
+
+        Returns:
+            Numpy array. Index of the matching track item for each query, -1 where there is no matching track item.
+        """
+        track_keys = np.asarray(track_keys, dtype=object)
+        query_keys = np.asarray(query_keys, dtype=object)
+        num_track = len(track_keys)
+        if num_track == 0:
+            return np.full(len(query_keys), -1, dtype='int64')
+
+        # integer code the keys and rank the sequence values so that both can be combined into a single sort key
+        key_codes, _ = pd.factorize(np.concatenate([track_keys, query_keys]))
+        seq_vals, seq_ranks = np.unique(np.concatenate([np.asarray(track_seqs, dtype=float),
+                                                        np.asarray(query_seqs, dtype=float)]), return_inverse=True)
+        seq_ranks = seq_ranks.reshape(-1)
+        sort_keys = key_codes.astype('int64') * (len(seq_vals) + 1) + seq_ranks
+
+        track_codes = key_codes[:num_track]
+        track_order = np.argsort(sort_keys[:num_track], kind='stable')
+        track_sort_keys = sort_keys[:num_track][track_order]
+
+        # find the last track item with a sort key at or before the query and check the key matches
+        pos = np.searchsorted(track_sort_keys, sort_keys[num_track:], side='right') - 1
+        query_codes = key_codes[num_track:]
+        match_mask = (pos >= 0) & (query_codes >= 0)
+        match_mask[match_mask] = track_codes[track_order[pos[match_mask]]] == query_codes[match_mask]
+
+        return np.where(match_mask, track_order[np.maximum(pos, 0)], -1)
+
+    @staticmethod
+    def get_merge_order(sorted_keys, sorted_sub_keys, insert_keys, insert_sub_keys) -> np.ndarray:
+        """ Get the order that merges a set of insert items into a set of sorted items.
+
+        Both sets of items must be sorted by key (i.e. time, null keys last) and then by sub key (i.e. event type and
+        entity order). Each insert item is placed after the sorted items with a lower or the same key and sub key and
+        the sorted items are not reordered, so the merge only searches the sorted items rather than sorting them.
+
+        Args:
+            sorted_keys: Key for each sorted item (array-like, numeric).
+            sorted_sub_keys: Sub key for each sorted item (array-like, non-negative integers).
+            insert_keys: Key for each insert item (array-like, numeric).
+            insert_sub_keys: Sub key for each insert item (array-like, non-negative integers).
+
+        Returns:
+            Numpy array. Index of each item of the merged items in the sorted items followed by the insert items.
+
+        Raises:
+            ValueError: if the merged items are not sorted by key and sub key, i.e. either set of items is not sorted
+        """
+        sorted_keys = np.asarray(sorted_keys, dtype=float)
+        sorted_sub_keys = np.asarray(sorted_sub_keys, dtype='int64')
+        insert_keys = np.asarray(insert_keys, dtype=float)
+        insert_sub_keys = np.asarray(insert_sub_keys, dtype='int64')
+        num_sorted = len(sorted_keys)
+        num_insert = len(insert_keys)
+
+        # position of each insert item in the sorted items by key - items with a key already in the sorted items are
+        # then placed by sub key among the block of sorted items with that key, using the position of the start of
+        # each block and the sub key as a single integer sort value
+        first_pos_arr = np.searchsorted(sorted_keys, insert_keys, side='left')
+        in_block_mask = np.searchsorted(sorted_keys, insert_keys, side='right') > first_pos_arr
+        insert_pos_arr = first_pos_arr
+        if in_block_mask.any():
+            num_sub_keys = int(max(sorted_sub_keys.max(), insert_sub_keys.max())) + 1
+            block_val_arr = np.searchsorted(sorted_keys, sorted_keys, side='left') * num_sub_keys + sorted_sub_keys
+            insert_pos_arr[in_block_mask] = np.searchsorted(
+                block_val_arr, first_pos_arr[in_block_mask] * num_sub_keys + insert_sub_keys[in_block_mask],
+                side='right')
+
+        merge_pos_arr = insert_pos_arr + np.arange(num_insert)
+        insert_mask = np.zeros(num_sorted + num_insert, dtype=bool)
+        insert_mask[merge_pos_arr] = True
+        merge_order_arr = np.empty(num_sorted + num_insert, dtype='int64')
+        merge_order_arr[insert_mask] = np.arange(num_sorted, num_sorted + num_insert)
+        merge_order_arr[~insert_mask] = np.arange(num_sorted)
+
+        # check the merged items are in order (null keys equal to each other and after all other keys)
+        merged_keys = np.concatenate([sorted_keys, insert_keys])[merge_order_arr]
+        merged_sub_keys = np.concatenate([sorted_sub_keys, insert_sub_keys])[merge_order_arr]
+        prev_keys, next_keys = merged_keys[:-1], merged_keys[1:]
+        prev_null_mask, next_null_mask = np.isnan(prev_keys), np.isnan(next_keys)
+        key_before_mask = (prev_keys < next_keys) | (~prev_null_mask & next_null_mask)
+        key_equal_mask = (prev_keys == next_keys) | (prev_null_mask & next_null_mask)
+        if not np.all(key_before_mask | (key_equal_mask & (merged_sub_keys[:-1] <= merged_sub_keys[1:]))):
+            raise ValueError("items to merge are not sorted by key and sub key")
+
+        return merge_order_arr
+
+    @staticmethod
+    def denormalise_cdf_events(events_df: pd.DataFrame, entity_df: pd.DataFrame, entity_cols_dict: dict = None,
+                               prim_id_col: str = 'primary_entity_id', sec_id_col: str = 'secondary_entity_id',
+                               entity_id_col: str = 'id') -> pd.DataFrame:
+        """ Add the primary and secondary entity detail columns to a normalised CDF events Dataframe.
+
+        The entity details are joined from the CDF entity table using the primary and secondary entity ids. Where an
+        id appears more than once in the entity table the last entry is used. Events with an unrecognised primary
+        entity id get null values and events with no (or an unrecognised) secondary entity get blank strings for the
+        secondary entity details (null for level), as in a denormalised CDF events file. Detail columns already in
+        the events Dataframe are left unchanged.
+
+        Args:
+            events_df: The normalised CDF events Dataframe (i.e. read from a CDF events file).
+            entity_df: The CDF entity table Dataframe.
+            entity_cols_dict: Dictionary of entity table column: (primary detail column, secondary detail column)
+                (optional, default the CDF events file entity detail columns).
+            prim_id_col: The primary entity id column of the events Dataframe.
+            sec_id_col: The secondary entity id column of the events Dataframe.
+            entity_id_col: The entity id column of the entity table.
+
+        Returns:
+            Dataframe. The CDF events Dataframe with the entity detail columns after each entity id column.
+        """
+        if entity_cols_dict is None:
+            entity_cols_dict = {'name': ('primary_entity_name', 'secondary_entity_name'),
+                                'type': ('primary_entity_type', 'secondary_entity_type'),
+                                'commander_id': ('primary_entity_commander', 'secondary_entity commander'),
+                                'level': ('primary_entity_level', 'secondary_entity_level'),
+                                'affiliation': ('primary_entity_affiliation', 'secondary_entity_affiliation'),
+                                'force': ('primary_entity_force', 'secondary_entity_force')}
+
+        output_df = events_df.copy()
+        entity_df = entity_df.drop_duplicates(subset=entity_id_col, keep='last')
+        entity_id_idx = pd.Index(entity_df[entity_id_col])
+
+        for col_pos, id_col in enumerate([prim_id_col, sec_id_col]):
+            code_arr = entity_id_idx.get_indexer(output_df[id_col])
+            insert_loc = output_df.columns.get_loc(id_col)
+            for entity_col, detail_cols in entity_cols_dict.items():
+                detail_col = detail_cols[col_pos]
+                if detail_col in output_df.columns:
+                    continue
+                detail_ser = pd.Series(pd.api.extensions.take(entity_df[entity_col].to_numpy(dtype=object), code_arr,
+                                                              allow_fill=True), index=output_df.index)
+                if entity_col == 'level':
+                    detail_ser = pd.to_numeric(detail_ser, errors='coerce').astype(float)
+                elif id_col == sec_id_col:
+                    detail_ser = detail_ser.fillna('')
+                insert_loc += 1
+                output_df.insert(insert_loc, detail_col, detail_ser)
+
+        return output_df
+
+    @staticmethod
+    def write_csv_batches(output_df: pd.DataFrame, file_path: str, columns: list = None, batch_rows: int = 100000,
+                          compression: str = None, compression_threads: int = 4) -> int:
+        """ Write a Dataframe to a .csv file a batch of rows at a time.
+
+        The file is the same as writing the whole Dataframe with DataFrame.to_csv(file_path, columns=columns,
+        index=False), the Dataframe is written in batches of batch_rows rows so the .csv text of the whole Dataframe
+        is not held in memory at once. An empty Dataframe is written as the header row only.
+
+        If compression is set each batch is compressed as a separate block (a gzip member or zstd frame) on a pool of
+        compression_threads threads while the next batches are formatted, and the blocks are written in order. The
+        blocks of a file decompress as a single stream to the uncompressed .csv file.
+
+        Args:
+            output_df: Dataframe to write
+            file_path: path of the .csv file to write
+            columns: columns to write (default None - all columns)
+            batch_rows: number of rows written at a time (default 100000)
+            compression: compression codec - 'gzip' or 'zstd' (default None - not compressed, zstd requires pyarrow)
+            compression_threads: number of threads compressing batches at the same time (default 4)
+
+        Returns:
+            Number of rows written.
+        """
+        batch_rows = max(1, int(batch_rows))
+        # an empty Dataframe is written as a single empty batch (header row only)
+        batch_iter = (output_df.iloc[batch_start:batch_start + batch_rows]
+                      for batch_start in range(0, max(len(output_df), 1), batch_rows))
+
+        num_rows = 0
+        header = True
+        if compression is None:
+            with open(file_path, "w", newline="", encoding="utf-8") as csv_file:
+                for batch_df in batch_iter:
+                    batch_df.to_csv(csv_file, columns=columns, header=header, index=False)
+                    header = False
+                    num_rows += len(batch_df)
+
+            return num_rows
+
+        if compression == 'gzip':
+            def compress_block(block):
+                return gzip.compress(block, compresslevel=6, mtime=0)
+        elif compression == 'zstd':
+            if pa is None:
+                raise ImportError("pyarrow is required to write zstd compressed .csv files")
+            zstd_codec = pa.Codec('zstd')
+
+            def compress_block(block):
+                return zstd_codec.compress(block, asbytes=True)
+        else:
+            raise ValueError(f"compression {compression} not recognised (valid codecs are gzip and zstd)")
+
+        # batches are formatted in this thread while the compression threads (which release the GIL) compress the
+        # previous batches, at most compression_threads blocks are held waiting to be written
+        compression_threads = max(1, int(compression_threads))
+        block_future_queue = deque()
+        with open(file_path, "wb") as csv_file, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=compression_threads) as compress_executor:
+            for batch_df in batch_iter:
+                block = batch_df.to_csv(columns=columns, header=header, index=False).encode("utf-8")
+                block_future_queue.append(compress_executor.submit(compress_block, block))
+                header = False
+                num_rows += len(batch_df)
+                while len(block_future_queue) > compression_threads:
+                    csv_file.write(block_future_queue.popleft().result())
+            while len(block_future_queue) > 0:
+                csv_file.write(block_future_queue.popleft().result())
+
+        return num_rows
+
+    @staticmethod
+    def read_cdf_dataset(dataset_path: str, filters: dict = None, columns: list = None) -> pd.DataFrame:
+        """ Read a CDF output from a hive partitioned .parquet dataset written by the Dataset output_partitioned
+        option (i.e. the CDF_Events folder of the dataset) into a Dataframe. Requires pyarrow.
+
+        The partition columns (case, rep and event_type if partitioned by event type) are read as strings from the
+        folder names and the columns are returned in the order of the CDF output files. Filters on the partition
+        columns only read the matching partitions.
+
+        Args:
+            dataset_path: path of the CDF output folder in the partitioned dataset
+            filters: dictionary of column label - value or list of values, only rows with one of the values in each
+                column are read (default None - all rows)
+            columns: columns to read (default None - all columns)
+
+        Returns:
+            Dataframe of the CDF output rows.
+        """
+        if ds is None:
+            raise ImportError("pyarrow is required to read the partitioned .parquet dataset")
+
+        # get the partition columns from the folder names of the first partition
+        partition_col_ls = []
+        folder_path = dataset_path
+        while True:
+            partition_folder_ls = sorted(folder_name for folder_name in listdir(folder_path)
+                                         if "=" in folder_name and path.isdir(path.join(folder_path, folder_name)))
+            if len(partition_folder_ls) == 0:
+                break
+            partition_col_ls.append(partition_folder_ls[0].split("=", 1)[0])
+            folder_path = path.join(folder_path, partition_folder_ls[0])
+
+        partitioning = ds.partitioning(pa.schema([(col_lbl, pa.string()) for col_lbl in partition_col_ls]),
+                                       flavor='hive')
+        cdf_dataset = ds.dataset(dataset_path, format='parquet', partitioning=partitioning)
+        filter_exp = None
+        for col_lbl, filter_vals in (filters or {}).items():
+            filter_vals = filter_vals if isinstance(filter_vals, (list, tuple, set)) else [filter_vals]
+            col_exp = ds.field(col_lbl).isin([str(val) if col_lbl in partition_col_ls else val
+                                              for val in filter_vals])
+            filter_exp = col_exp if filter_exp is None else filter_exp & col_exp
+        cdf_df = cdf_dataset.to_table(columns=columns, filter=filter_exp).to_pandas()
+
+        # put the columns in the order of the CDF output files
+        if cdf_dataset.schema.metadata is not None and b'cdf_columns' in cdf_dataset.schema.metadata:
+            cdf_col_ls = json.loads(cdf_dataset.schema.metadata[b'cdf_columns'])
+            cdf_df = cdf_df[[col_lbl for col_lbl in cdf_col_ls if col_lbl in cdf_df.columns] +
+                            [col_lbl for col_lbl in cdf_df.columns if col_lbl not in cdf_col_ls]]
+        return cdf_df
+
     @staticmethod
     def get_time_val(input_time_str: str, zero_hr: float = 0, unit: str = "hrs") -> float:
         """ Get elapsed time value from a time string.
@@ -310,6 +642,58 @@ class CDFfunc:
 
         return output_df
 
+    @staticmethod
+    def get_peak_memory_mb():
+        """ Get the peak resident memory (resident set size / working set) of the current process.
+
+        Returns:
+            Float. Peak resident memory in MB, None if it cannot be read on this operating system.
+        """
+        if resource is not None:
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in bytes on macOS and kilobytes on Linux
+            peak_bytes = peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+            return round(peak_bytes / 1e6, 1)
+
+        try:
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            process_handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process_handle, ctypes.byref(counters), counters.cb):
+                return round(counters.PeakWorkingSetSize / 1e6, 1)
+        except (AttributeError, OSError):
+            pass
+        return None
+
+    @staticmethod
+    def get_log_record_capture(logger: logging.Logger) -> LogRecordCapture:
+        """ Get the log record capture filter of a logger, adding one if the logger does not have one.
+
+        Captured log records can be handled later with logger.handle, i.e. to keep the log order of work run on
+        several threads the same as if it were run in sequence.
+
+        Args:
+            logger: Logger object.
+
+        Returns:
+            LogRecordCapture object. Use "with log_record_capture.capture() as record_ls:" to capture the log records
+            of the current thread.
+        """
+        for log_filter in logger.filters:
+            if isinstance(log_filter, LogRecordCapture):
+                return log_filter
+        log_record_capture = LogRecordCapture()
+        logger.addFilter(log_record_capture)
+        return log_record_capture
+
     @staticmethod
     def setup_logger(name: str, date_time_str: str = None,
                      output_folder=None, log_file: bool = True, log_stream: bool = True) -> logging.Logger:
@@ -485,6 +869,10 @@ class CDFfunc:
     @staticmethod
     def batch_run_processor(model_processor, config_file: str, multiprocess: bool = True) -> None:
         """ run every line of a configuration file (config_file) through a model processor function (model_processor)
+
+        Lines with the shards option set above 1 are run through the model processor once for each shard (with
+        shard_index set in the configuration), each shard run finalises its own share of the data and the CDF
+        Dataframes of the shard runs are then merged and exported by DataSet.run_shard_merge.
         
         Args:
             model_processor
@@ -499,6 +887,14 @@ class CDFfunc:
             # function to extract serial, case and replication from a configuration dict as a summary sttring
             return f"serial {config_dict['serial']} - case: {config_dict['case']}, rep: {config_dict['replication']}"
 
+        def get_num_shards(config_dict: dict) -> int:
+            # function to get the number of shard runs for a configuration dict (1 if not set or not an integer > 1)
+            try:
+                num_shards = float(config_dict.get('shards', 1))
+            except (TypeError, ValueError):
+                return 1
+            return int(num_shards) if num_shards.is_integer() and num_shards > 1 else 1
+
         # start the timer and set up a batch logger for the run
         start_time = time.perf_counter()
         batch_logger = CDFfunc.setup_logger("Batch_log")
@@ -534,20 +930,63 @@ class CDFfunc:
             else:
                 process_type_str = "sequential processing"
             batch_logger.info(f"starting {process_type_str} of configurations")
-            
+
+            # split configurations with shards set into a run for each shard (with the index of the shard set) and
+            # keep the index of the configuration for each run
+            run_config_ls = []
+            run_config_idx_ls = []
+            for config_idx, configuration in enumerate(configuration_dict_ls):
+                num_shards = get_num_shards(configuration)
+                if num_shards > 1:
+                    batch_logger.info(f"{get_config_str(configuration)} - processing as {num_shards} shards")
+                    for shard_index in range(num_shards):
+                        run_config_ls.append(dict(configuration, shard_index=shard_index))
+                        run_config_idx_ls.append(config_idx)
+                else:
+                    run_config_ls.append(configuration)
+                    run_config_idx_ls.append(config_idx)
+            merge_config_idx_ls = [config_idx for config_idx, configuration in enumerate(configuration_dict_ls)
+                                   if get_num_shards(configuration) > 1]
+            merge_config_ls = [configuration_dict_ls[config_idx] for config_idx in merge_config_idx_ls]
+            if len(merge_config_ls) > 0:
+                # imported here as the Dataset module imports CDFfunc
+                from processor_core.Dataset import DataSet
+                merge_func = DataSet.run_shard_merge
+
+            run_results_ls = []
+            merge_results_ls = []
             if multiprocess:
                 # if multi processing then process the configurations using the process pool executor
                 with concurrent.futures.ProcessPoolExecutor() as executor:
-                    # executor.map runs the function (model_processor) with each item of the iterable (configuration_dict_ls) 
+                    # executor.map runs the function (model_processor) with each item of the iterable (run_config_ls) 
                     # and returns the results, in the order they were started, as a generator object
-                    config_results_gen = executor.map(model_processor, configuration_dict_ls)
-                # extract the results from the generator object into the results list
-                for result in config_results_gen:
-                    config_results_ls.append(result)
+                    run_results_gen = executor.map(model_processor, run_config_ls)
+                    # extract the results from the generator object into the results list
+                    for result in run_results_gen:
+                        run_results_ls.append(result)
+                    # then merge the shard runs of the configurations with shards set
+                    if len(merge_config_ls) > 0:
+                        for result in executor.map(merge_func, merge_config_ls):
+                            merge_results_ls.append(result)
             else:
                 # otherwise process the configurations sequentially in a loop and add results to the results list as they are completed
-                for configuration in configuration_dict_ls:
-                    config_results_ls.append(model_processor(configuration))
+                for run_config in run_config_ls:
+                    run_results_ls.append(model_processor(run_config))
+                for merge_config in merge_config_ls:
+                    merge_results_ls.append(merge_func(merge_config))
+
+            # the result for a configuration with shards set is the merge result (with the shard run results if the
+            # merge failed)
+            for config_idx in range(len(configuration_dict_ls)):
+                shard_results_ls = [result for run_idx, result in enumerate(run_results_ls)
+                                    if run_config_idx_ls[run_idx] == config_idx]
+                if config_idx in merge_config_idx_ls:
+                    merge_result = merge_results_ls[merge_config_idx_ls.index(config_idx)]
+                    if merge_result != "complete":
+                        merge_result = f"{merge_result} - shard results: {shard_results_ls}"
+                    config_results_ls.append(merge_result)
+                else:
+                    config_results_ls.append(shard_results_ls[0])
                 
             # add the outcome for each configuration processed to the batch log  
             batch_logger.info("outcome for each configuration processed:")
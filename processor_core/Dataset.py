@@ -1,9 +1,25 @@
 import yaml
+import json
+import pickle
+import hashlib
+import shutil
+from urllib.parse import quote
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from time import perf_counter
 from .CDF_Func import CDFfunc
 from .Entity import Entity
-from os import path, makedirs, listdir
+from os import path, makedirs, listdir, remove, replace, rmdir
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    # pyarrow is optional - only required for the parquet and feather outputs and the partitioned dataset
+    pa = None
+    ds = None
 
 
 class DataSet:
@@ -19,7 +35,7 @@ class DataSet:
     Attributes:
         instance count: Count of Dataset class instances created.
     """
-    version: str = "1.6.3"
+    version: str = "1.23.1"
 
     def __init__(self, dataset_config: dict, log_file: bool = True, log_stream: bool = True) -> None:
         """ Dataset class init method.
@@ -34,6 +50,11 @@ class DataSet:
                 - replication:(parameter) replication number for inclusion in CDF outputs
                 - input_location: (parameter) location that processor will read files from
                 - output_location: (parameter) location to save CDF output files and log files in
+                - output_csv: (option) export the CDF output files in .csv format
+                - output_parquet: (option) export the CDF output files in .parquet format
+                - output_feather: (option) export the CDF output files in .feather (Arrow IPC) format
+                - output_partitioned: (option) export the CDF output files into a hive partitioned .parquet dataset
+                  shared by the configurations of a study (see partitioned_location and partition_by)
                 - model_name: (parameter) Name of the model that generated the output data
                 - data_name: (parameter) Name of the data set
                 - data_date: (parameter) Date the data set was generated
@@ -49,6 +70,39 @@ class DataSet:
                 - drop_seen_events: (option) drop seen by secondary events from CDF events output
                 - drop_spot_events: (option) drop spotted by secondary events from CDF events output
                 - drop_shot_events: (option) drop shot events from CDF events output
+                - validation_level: (option) level of CDF output checks run by finalise_data (full, sampled or off)
+                - memory_optimised_dtypes: (option) use categorical, arrow string and 32 bit integer column types in
+                  the CDF Dataframes
+                - normalised_events_export: (option) leave the entity detail columns (mapped from the entity table) out
+                  of exported CDF events files
+                - incremental_finalise: (option) on repeat calls to finalise_data only regenerate and check the CDF
+                  output rows affected by entities and events changed since the last finalise
+                - finalise_executor: (option) how finalise_data runs its generate and check stages (serial or thread)
+                - finalise_checkpoints: (option) save the CDF Dataframes generated by finalise_data as checkpoint files
+                  (off, parquet or feather) so that a failed finalise or export can resume from the last good stage
+                - shards: (option) number of worker processes (shard runs) that CDFfunc.batch_run_processor splits the
+                  entities of the replication across, each shard finalises its own share and the CDF Dataframes of
+                  the shards are merged into one Dataset to export
+                - shard_index: (parameter) index of the shard processed by this instance, set by
+                  CDFfunc.batch_run_processor for each shard run (-1 - not a shard run)
+                - parquet_compression: (option) compression codec for .parquet output files (snappy, zstd or none)
+                - parquet_compression_level: (option) zstd compression level for .parquet output files (1 to 22)
+                - parquet_row_group_rows: (option) number of rows in each row group of .parquet output files
+                  (0 - pyarrow default)
+                - parquet_dictionary_columns: (option) columns dictionary encoded in .parquet output files (all, none or
+                  column labels separated by ;)
+                - parquet_statistics: (option) write min / max column statistics for each row group of .parquet output
+                  files
+                - feather_compression: (option) compression codec for .feather output files (uncompressed, lz4 or
+                  zstd)
+                - csv_compression: (option) compression codec for .csv output files (none, gzip - .csv.gz or zstd -
+                  .csv.zst)
+                - partitioned_location: (parameter) location of the partitioned .parquet dataset (output_partitioned
+                  option, default - CDF_Dataset folder in output_location)
+                - partition_by: (option) partitions of the partitioned .parquet dataset (case_rep - case=/rep= or
+                  event_type - CDF events in event_type=/case=/rep=)
+                - export_executor: (option) how export_data writes the CDF output files (thread - at the same time on
+                  a thread pool or serial - one after another)
             log_file: generate a dataset log file (default True)
             log_stream: print dataset log entries (default True)
         """
@@ -61,6 +115,8 @@ class DataSet:
         self.output_location = 'Output'
         self.output_csv = True
         self.output_parquet = False
+        self.output_feather = False
+        self.output_partitioned = False
         self.model_name = 'not defined'
         self.data_name = 'not defined'
         self.data_date = 'not defined'
@@ -76,8 +132,34 @@ class DataSet:
         self.drop_spot_events = False
         self.drop_seen_events = False
         self.drop_shot_events = False
-
-        location_param_ls = ['input_location', 'output_location']
+        self.validation_level = 'full'
+        self.memory_optimised_dtypes = False
+        self.normalised_events_export = False
+        self.incremental_finalise = False
+        self.finalise_executor = 'serial'
+        self.finalise_checkpoints = 'off'
+        self.shards = 1
+        self.shard_index = -1
+        self.parquet_compression = 'snappy'
+        self.parquet_compression_level = None
+        self.parquet_row_group_rows = 0
+        self.parquet_dictionary_columns = 'all'
+        self.parquet_statistics = True
+        self.feather_compression = 'uncompressed'
+        self.export_executor = 'thread'
+        self.csv_compression = 'none'
+        self.partitioned_location = None
+        self.partition_by = 'case_rep'
+
+        location_param_ls = ['input_location', 'output_location', 'partitioned_location']
+        # opt-in performance and export options - the defaults leave the CDF outputs as they are without the option so
+        # they are logged at debug level rather than warned about if not in the config
+        optional_param_ls = ['output_feather', 'output_partitioned', 'validation_level', 'memory_optimised_dtypes',
+                             'normalised_events_export', 'incremental_finalise', 'finalise_executor',
+                             'finalise_checkpoints', 'shards', 'shard_index',
+                             'parquet_compression', 'parquet_compression_level', 'parquet_row_group_rows',
+                             'parquet_dictionary_columns', 'parquet_statistics', 'feather_compression',
+                             'export_executor', 'csv_compression', 'partitioned_location', 'partition_by']
 
         # go through parameters, check if there is a value in dataset_config and set accordingly, warn if not
         default_param_ls = []
@@ -108,8 +190,13 @@ class DataSet:
         if self.split_files_by_type:
             log_location = path.join(log_location, self.dataset_log_folder)
 
+        # shard runs (shards option) log to a Dataset log file for each shard
+        log_name = f'{self.dataset_log_folder}_S{self.serial}'
+        if str(self.shard_index).strip().isdigit():
+            log_name = f'{log_name}_shard{str(self.shard_index).strip()}'
+
         # set up the logger
-        self.logger = CDFfunc.setup_logger(name=f'{self.dataset_log_folder}_S{self.serial}',
+        self.logger = CDFfunc.setup_logger(name=log_name,
                                            date_time_str=self.init_date_time_str,
                                            output_folder=log_location,
                                            log_file=self.log_file,
@@ -121,20 +208,92 @@ class DataSet:
         self.logger.info(f"Using CDF functions version {CDFfunc.version}")
 
         self.logger.info("Setting Dataset parameters")
-        # confirm all settings in the log and warn about any default values
-        num_default_vals = len(default_param_ls)
+        # confirm all settings in the log and warn about any default values (other than for opt-in options)
+        warn_default_param_ls = [parameter for parameter in default_param_ls if parameter not in optional_param_ls]
+        num_default_vals = len(warn_default_param_ls)
         if num_default_vals > 0:
             self.logger.warning(f"Values for {num_default_vals} Parameters not in config, "
-                                f"parameters {default_param_ls} all set to Dataset default values")
+                                f"parameters {warn_default_param_ls} all set to Dataset default values")
         for setting in vars(self).items():
-            if setting[0] in default_param_ls:
+            if setting[0] in warn_default_param_ls:
                 self.logger.warning(f"{setting[0]} set as {setting[1]} (Dataset default value)")
+            elif setting[0] in default_param_ls:
+                self.logger.debug(f"{setting[0]} set as {setting[1]} (Dataset default value)")
             else:
                 self.logger.debug(f"{setting[0]} set as {setting[1]}")
 
-        # warn if output_csv and output_parquet set to false
-        if not self.output_csv and not self.output_parquet:
-            self.logger.warning("Config is not set to output csv or parquet - no CDF output files will be generated!")
+        # warn if output_csv, output_parquet, output_feather and output_partitioned set to false
+        if not self.output_csv and not self.output_parquet and not self.output_feather and not self.output_partitioned:
+            self.logger.warning("Config is not set to output csv, parquet, feather or a partitioned dataset - no CDF "
+                                "output files will be generated!")
+
+        # check the option settings and use the default for any that are not recognised (see check_config_setting)
+        self.validation_level_ls = ['full', 'sampled', 'off']
+        self.check_config_setting('validation_level', 'full', self.validation_level_ls,
+                                  default_desc="full validation will be used")
+        self.finalise_executor_ls = ['serial', 'thread']
+        self.check_config_setting('finalise_executor', 'serial', self.finalise_executor_ls,
+                                  default_desc="finalise stages will be run in sequence")
+        self.finalise_checkpoints_ls = ['off', 'parquet', 'feather']
+        self.check_config_setting('finalise_checkpoints', 'off', self.finalise_checkpoints_ls,
+                                  default_desc="finalise checkpoints will not be saved")
+        self.check_config_setting('shards', 1, lambda val: isinstance(val, int) and val >= 1,
+                                  valid_desc="must be an integer >= 1",
+                                  default_desc="the replication will be processed in a single process",
+                                  setting_type=int)
+        # the shard index is set by CDFfunc.batch_run_processor for each shard run
+        self.check_config_setting('shard_index', -1, lambda val: isinstance(val, int) and -1 <= val < self.shards,
+                                  valid_desc="must be -1 or an integer from 0 to shards - 1",
+                                  default_desc="the replication will not be processed as a shard", setting_type=int)
+        self.shard_run = self.shards > 1 and self.shard_index >= 0
+        self.parquet_compression_ls = ['snappy', 'zstd', 'none']
+        self.check_config_setting('parquet_compression', 'snappy', self.parquet_compression_ls,
+                                  default_desc="snappy compression will be used")
+        self.check_config_setting('parquet_compression_level', None,
+                                  lambda val: val is None or (isinstance(val, int) and 1 <= val <= 22 and
+                                                              self.parquet_compression == 'zstd'),
+                                  valid_desc="must be an integer from 1 to 22 with zstd compression",
+                                  default_desc="the default level will be used", setting_type=int)
+        self.check_config_setting('parquet_row_group_rows', 0, lambda val: isinstance(val, int) and val >= 0,
+                                  valid_desc="must be an integer >= 0",
+                                  default_desc="the pyarrow default row group size will be used", setting_type=int)
+        self.parquet_dictionary_columns = str(self.parquet_dictionary_columns).strip()
+        if self.parquet_dictionary_columns.lower() in ['all', 'none', '']:
+            self.parquet_dictionary_columns = self.parquet_dictionary_columns.lower() or 'none'
+        self.metadata_dict['parquet_dictionary_columns'] = self.parquet_dictionary_columns
+        self.feather_compression_ls = ['uncompressed', 'lz4', 'zstd']
+        self.check_config_setting('feather_compression', 'uncompressed', self.feather_compression_ls,
+                                  default_desc=".feather files will not be compressed")
+        self.export_executor_ls = ['thread', 'serial']
+        self.check_config_setting('export_executor', 'thread', self.export_executor_ls,
+                                  default_desc="CDF output files will be written on a thread pool")
+        self.csv_compression_ls = ['none', 'gzip', 'zstd']
+        self.check_config_setting('csv_compression', 'none', self.csv_compression_ls,
+                                  default_desc=".csv files will not be compressed")
+        self.partition_by_ls = ['case_rep', 'event_type']
+        self.check_config_setting('partition_by', 'case_rep', self.partition_by_ls,
+                                  default_desc="the partitioned dataset will be partitioned by case and replication")
+        # use the CDF_Dataset folder in the output location for the partitioned dataset if no location is set
+        self.partitioned_folder_name = "CDF_Dataset"
+        if self.partitioned_location is None:
+            self.update_config('partitioned_location', path.join(self.output_location, self.partitioned_folder_name))
+        # file extension of the CDF .csv files for each csv compression codec (csv_compression option)
+        self.csv_file_ext_dict = {'none': ".csv", 'gzip': ".csv.gz", 'zstd': ".csv.zst"}
+        # number of rows checked for each CDF output file when validation_level is sampled
+        self.validation_sample_size = 10000
+        # placeholder for the estimated time (seconds) saved by the validation level (set by finalise_data, None if
+        # not measured)
+        self.validation_time_saved = None
+        # placeholder for the peak resident memory (MB) of the process at the end of finalise_data
+        self.peak_memory_mb = None
+        # placeholder for the mode of the last finalise_data call - full or incremental (incremental_finalise option)
+        self.finalise_mode = None
+        # placeholder for the finalise stages loaded from checkpoint files by the last finalise_data call
+        # (finalise_checkpoints option)
+        self.finalise_resumed_stages = None
+        # placeholder for the run time (seconds) of each stage of the last finalise_data call (not recorded in the
+        # metadata so that repeat finalise calls give the same metadata)
+        self.finalise_stage_times = None
 
         # set up the split folder names (inc. one for log files) first so that the CDF file names will always match
         self.meta_folder_name = "CDF_Metadata"
@@ -145,6 +304,7 @@ class DataSet:
         # set up placeholders for the cdf file names and paths and then generate them by calling generate function
         self.cdf_file_date_time_str = None
         self.output_name_str = None
+        self.csv_file_ext = None
         self.metadata_filename = None
         self.entity_filename = None
         self.events_filename = None
@@ -156,9 +316,31 @@ class DataSet:
 
         self.generate_cdf_filenames_and_paths()
 
+        # placeholder for the layout of the exported CDF events file (set by export_data)
+        self.events_file_layout = None
+        # number of rows written to the CDF .csv files at a time (see CDFfunc.write_csv_batches)
+        self.csv_batch_rows = 100000
+        # maximum number of threads export_data writes the CDF output files on (export_executor option)
+        self.export_max_workers = 4
+        # number of threads compressing the batches of each compressed .csv file (csv_compression option)
+        self.csv_compression_threads = 4
+        # placeholder for the settings used to write the .parquet output files (set by export_data)
+        self.parquet_settings = None
+
         # set a default name for dataset save files
         self.save_file_name = "dataset_save.yaml"
 
+        # finalise checkpoint folder (in output_location), file and CDF Dataframe for each checkpointed finalise stage
+        # and the checkpoint manifest file name (finalise_checkpoints option)
+        self.checkpoint_folder_name = f"Finalise_checkpoint_S{self.serial}"
+        self.checkpoint_stage_dict = {'entity table': ('entity_table', 'CDF_entity_table_df'),
+                                      'events': ('events', 'CDF_events_df'),
+                                      'combat power': ('combat_power', 'CDF_combat_power_DF')}
+        self.checkpoint_manifest_name = "finalise_checkpoint.yaml"
+        # prefix of the file (in output_location) each shard run saves its CDF Dataframes to for the merge (shards
+        # option)
+        self.shard_file_prefix = f"Dataset_shard_S{self.serial}_"
+
         # labels for case and rep columns
         self.case_col_lbl = "case"
         self.rep_col_lbl = "rep"
@@ -189,6 +371,15 @@ class DataSet:
         self.evn_tbl_sec_x_col_lbl = "secondary_x"
         self.evn_tbl_sec_y_col_lbl = "secondary_y"
 
+        # primary and secondary entity detail columns mapped from the entity table (left out of exported CDF events
+        # files if normalised_events_export is set, see CDFfunc.denormalise_cdf_events)
+        self.evn_tbl_entity_detail_col_ls = [self.evn_tbl_prim_name_col_lbl, self.evn_tbl_prim_type_col_lbl,
+                                             self.evn_tbl_prim_comd_col_lbl, self.evn_tbl_prim_lvl_col_lbl,
+                                             self.evn_tbl_prim_affil_col_lbl, self.evn_tbl_prim_force_col_lbl,
+                                             self.evn_tbl_sec_name_col_lbl, self.evn_tbl_sec_type_col_lbl,
+                                             self.evn_tbl_sec_comd_col_lbl, self.evn_tbl_sec_lvl_col_lbl,
+                                             self.evn_tbl_sec_affil_col_lbl, self.evn_tbl_sec_force_col_lbl]
+
         self.evn_tbl_col_types_dict = {self.evn_tbl_time_col_lbl: float,
                                        self.evn_tbl_event_id_col_lbl: str,
                                        self.evn_tbl_event_type_col_lbl: str,
@@ -223,6 +414,13 @@ class DataSet:
         self.seen_event_lbl = "seen by secondary"
         self.stop_event_lbl = "stopped seeing secondary"
         self.status_event_lbl = "status update"
+        # event type order for the CDF events - location updates are the first type for a given time
+        self.evn_tbl_event_type_order_ls = [self.loc_event_lbl, self.status_event_lbl,
+                                            self.spot_event_lbl, self.seen_event_lbl, self.stop_event_lbl,
+                                            self.shot_event_lbl, self.kill_event_lbl, self.loss_event_lbl]
+        # event types that a shard run also adds for the entities processed by other shards - location updates for
+        # the secondary entity locations and losses for the combat power (shards option)
+        self.shard_shared_event_type_ls = [self.loc_event_lbl, self.loss_event_lbl]
 
         self.loc_event_short_lbl = "loc"
         self.shot_event_short_lbl = "shot"
@@ -252,6 +450,20 @@ class DataSet:
         self.seen_event_last_ser = 0
         self.stop_event_last_ser = 0
         self.status_event_last_ser = 0
+        # map event types to their last event number variables
+        self.event_last_ser_dict = {self.loc_event_lbl: 'loc_event_last_ser',
+                                    self.shot_event_lbl: 'shot_event_last_ser',
+                                    self.kill_event_lbl: 'kill_event_last_ser',
+                                    self.loss_event_lbl: 'loss_event_last_ser',
+                                    self.spot_event_lbl: 'spot_event_last_ser',
+                                    self.seen_event_lbl: 'seen_event_last_ser',
+                                    self.stop_event_lbl: 'stop_event_last_ser',
+                                    self.status_event_lbl: 'status_event_last_ser'}
+        # map the append_to_list target list prefixes to their event types
+        self.target_list_type_dict = {'location': self.loc_event_lbl, 'shots': self.shot_event_lbl,
+                                      'kills': self.kill_event_lbl, 'losses': self.loss_event_lbl,
+                                      'spot': self.spot_event_lbl, 'seen': self.seen_event_lbl,
+                                      'stop': self.stop_event_lbl, 'state': self.status_event_lbl}
 
         # labels for CDF combat power columns
         self.cbt_tbl_time_col_lbl = "time"
@@ -260,6 +472,9 @@ class DataSet:
         self.cbt_tbl_pwr_col_lbl = "combat_power"
         self.cbt_tbl_event_col_lbl = "event_id"
 
+        # event id label for combat power rows where an entity not present at the start was added
+        self.cbt_tbl_add_event_lbl = "entity added"
+
         self.cbt_tbl_col_types_dict = {self.cbt_tbl_time_col_lbl: float,
                                        self.cbt_tbl_item_col_lbl: str,
                                        self.cbt_tbl_comp_col_lbl: 'int64',
@@ -315,14 +530,52 @@ class DataSet:
                                        self.ent_tbl_stop_events_lbl: 'int64',
                                        self.ent_tbl_status_events_lbl: 'int64'}
 
+        # columns with a small number of repeated values, stored as categorical if memory_optimised_dtypes is set
+        self.cdf_category_col_ls = [self.case_col_lbl, self.rep_col_lbl,
+                                    self.evn_tbl_event_type_col_lbl,
+                                    self.evn_tbl_prim_id_col_lbl, self.evn_tbl_prim_name_col_lbl,
+                                    self.evn_tbl_prim_type_col_lbl, self.evn_tbl_prim_comd_col_lbl,
+                                    self.evn_tbl_prim_affil_col_lbl, self.evn_tbl_prim_force_col_lbl,
+                                    self.evn_tbl_sec_id_col_lbl, self.evn_tbl_sec_name_col_lbl,
+                                    self.evn_tbl_sec_type_col_lbl, self.evn_tbl_sec_comd_col_lbl,
+                                    self.evn_tbl_sec_affil_col_lbl, self.evn_tbl_sec_force_col_lbl,
+                                    self.cbt_tbl_item_col_lbl,
+                                    self.ent_tbl_type_col_lbl, self.ent_tbl_commander_id_col_lbl,
+                                    self.ent_tbl_commander_name_col_lbl,
+                                    self.ent_tbl_affil_col_lbl, self.ent_tbl_force_col_lbl]
+
         # empty dataframes for each of the CDF output files
         self.CDF_entity_table_df = pd.DataFrame()
         self.CDF_events_df = pd.DataFrame()
         self.CDF_combat_power_DF = pd.DataFrame()
 
+        # summary of events dropped from the CDF events Dataframe by the drop_*_events options (set when generating
+        # CDF events) - number of events, first and last event times and uids of entities involved
+        self.dropped_events_dict = {}
+
+        # entities changed since the last finalise (uid - set of changed event types and / or the entity data label
+        # for changed entity parameters) and the data kept from the last finalise (incremental_finalise option)
+        self.entity_data_lbl = 'entity data'
+        self.changed_entity_dict = {}
+        self.finalise_cache_dict = {}
+
         # array of instances of the Entity class
         self.entities = []
 
+        # number of entities added and the uids of the entities processed by other shards, entities are assigned to
+        # the shards in turn in the order they are added, the uids of the secondary entities of the events of the
+        # entities processed by other shards and the loss events of all entities (set when the CDF events are
+        # generated) (shards option)
+        self.shard_entity_count = 0
+        self.shard_foreign_uid_set = set()
+        self.shard_secondary_uid_set = set()
+        self.shard_loss_events_df = None
+        if self.shard_run and path.isfile(self.get_dataset_shard_path(self.shard_index)):
+            # remove the shard file saved by an earlier run so that it cannot be merged with this run
+            remove(self.get_dataset_shard_path(self.shard_index))
+        if self.shard_run:
+            self.wrap_shard_add_methods()
+
         # if reading entity data from table use generate_entities_from_table to populate entities list
         if self.entity_data_from_table:
             entity_data_file_path = path.join(self.input_location, self.entity_table_file)
@@ -348,10 +601,13 @@ class DataSet:
         output_name_str = output_name_str.replace(" ", "_")
         self.update_config('output_name_str', output_name_str)
 
+        # .csv files are suffixed with the compression codec extension (csv_compression option)
+        self.update_config('csv_file_ext', self.csv_file_ext_dict[self.csv_compression])
+
         metadata_filename = f"{self.meta_folder_name}_{self.output_name_str}.yaml"
-        entity_filename = f"{self.entity_folder_name}_{self.output_name_str}.csv"
-        events_filename = f"{self.events_folder_name}_{self.output_name_str}.csv"
-        cbt_filename = f"{self.cbt_folder_name}_{self.output_name_str}.csv"
+        entity_filename = f"{self.entity_folder_name}_{self.output_name_str}{self.csv_file_ext}"
+        events_filename = f"{self.events_folder_name}_{self.output_name_str}{self.csv_file_ext}"
+        cbt_filename = f"{self.cbt_folder_name}_{self.output_name_str}{self.csv_file_ext}"
         self.update_config('metadata_filename', metadata_filename)
         self.update_config('entity_filename', entity_filename)
         self.update_config('events_filename', events_filename)
@@ -381,6 +637,11 @@ class DataSet:
         """
         if str(uid) not in self.get_uid_ls():
             self.entities.append(Entity(uid))
+            self.mark_entity_changed(uid, self.entity_data_lbl)
+            if self.shard_run:
+                if self.shard_entity_count % self.shards != self.shard_index:
+                    self.shard_foreign_uid_set.add(str(uid))
+                self.shard_entity_count += 1
             self.logger.debug(f"Entity added - entity uid {uid}")
         else:
             self.logger.error(f"entity with uid {uid} already in entities array")
@@ -429,6 +690,8 @@ class DataSet:
         ent_idx = self.get_entity_index(uid)
         if ent_idx is not None:
             del self.entities[ent_idx]
+            self.mark_entity_changed(uid, self.entity_data_lbl)
+            self.shard_foreign_uid_set.discard(str(uid))
             self.logger.debug(f"Entity removed - entity uid {uid}")
         else:
             self.logger.error(f"Removal of entity uid: {uid} failed - unknown uid")
@@ -459,6 +722,7 @@ class DataSet:
             for setting in settings:
                 if setting[0] in vars(self.entities[ent_idx]).keys():
                     setattr(self.entities[ent_idx], setting[0], setting[1])
+                    self.mark_entity_changed(uid, self.entity_data_lbl)
                     self.logger.debug(f"Entity {uid} - {setting[0]} set as  {setting[1]}")
                 else:
                     self.logger.error(f"Set entity data called for entity {uid} "
@@ -602,6 +866,8 @@ class DataSet:
             self.logger.error(f"Unrecognised target list passed to append to list "
                               f"- entity uid {uid}, target list {target_list}")
         else:
+            if ent_idx is not None and data_list is not None:
+                self.mark_entity_changed(uid, self.target_list_type_dict[target_list.split('_')[0]])
             self.logger.debug(f"Entity uid {uid} - data appended to {target_list}")
 
     def add_location(self, uid: str, time: float, x: float, y: float, detail_keys: list, detail_vals: list) -> None:
@@ -793,6 +1059,86 @@ class DataSet:
         else:
             self.logger.error(f"Add state called with unrecognised uid - {uid}")
 
+    def wrap_shard_add_methods(self) -> None:
+        """
+        Wrap the methods that add events (append_to_list and the add_* event methods) of a shard run instance
+        (shards option) so that the events of the entities processed by other shards only reserve their serials
+        (see reserve_shard_event_serials). The methods are wrapped once when the instance is created, so Dataset
+        instances that are not shard runs add events without any shard checks.
+        """
+        def get_shard_add_method(add_method, event_type, sec_uid_arg):
+            def shard_add_method(uid, *args, **kwargs):
+                if str(uid) in self.shard_foreign_uid_set:
+                    # the secondary entity uid is the argument after time (or passed by keyword)
+                    sec_uid_ls = None
+                    if sec_uid_arg is not None:
+                        sec_uid_ls = [kwargs[sec_uid_arg] if sec_uid_arg in kwargs else args[1]]
+                    if self.reserve_shard_event_serials(event_type, 1, sec_uid_ls):
+                        return None
+                return add_method(uid, *args, **kwargs)
+            return shard_add_method
+
+        for method_name, event_type, sec_uid_arg in [('add_location', self.loc_event_lbl, None),
+                                                     ('add_shot', self.shot_event_lbl, None),
+                                                     ('add_kill', self.kill_event_lbl, 'victim'),
+                                                     ('add_loss', self.loss_event_lbl, 'killer'),
+                                                     ('add_spot', self.spot_event_lbl, 'entity'),
+                                                     ('add_seen', self.seen_event_lbl, 'entity'),
+                                                     ('add_stop', self.stop_event_lbl, 'entity'),
+                                                     ('add_status', self.status_event_lbl, None)]:
+            setattr(self, method_name, get_shard_add_method(getattr(self, method_name), event_type, sec_uid_arg))
+
+        # target lists that add an event id for each value and target lists of the secondary entity uids of events
+        id_target_list_ls = ['location_time', 'shots_time', 'kills_victim', 'losses_killer', 'spot_entity',
+                             'seen_entity', 'stop_entity', 'state_time']
+        sec_uid_target_list_ls = ['kills_victim', 'losses_killer', 'spot_entity', 'seen_entity', 'stop_entity']
+        append_to_list = self.append_to_list
+
+        def shard_append_to_list(uid, target_list, data_list):
+            if str(uid) in self.shard_foreign_uid_set:
+                target_list_lower = str(target_list).lower()
+                num_events = len(data_list) if data_list is not None and target_list_lower in id_target_list_ls \
+                    else 0
+                if self.reserve_shard_event_serials(self.target_list_type_dict.get(target_list_lower.split('_')[0]),
+                                                    num_events, data_list if target_list_lower in
+                                                    sec_uid_target_list_ls else None):
+                    return None
+            return append_to_list(uid, target_list, data_list)
+
+        self.append_to_list = shard_append_to_list
+
+    def reserve_shard_event_serials(self, event_type: str, num_events: int = 1, sec_uid_ls: list = None) -> bool:
+        """
+        Reserve the serials for events added to an entity processed by another shard (shards option, called by the
+        methods wrapped by wrap_shard_add_methods). Every shard run is given the events of all entities, so advancing
+        the last event numbers for the events of the other shards gives each event the same serial and event id as
+        processing the replication in a single process.
+        Only the events of the shard's own entities are added, along with the location update and loss events of the
+        other entities (shard_shared_event_type_ls) which are needed for the secondary entity locations and the combat
+        power. The secondary entity uids of the events of the other entities are kept for the CDF events check.
+        Args:
+            event_type: the type of the events
+            num_events: the number of events to reserve serials for (default 1)
+            sec_uid_ls: the uids of the secondary entities of the events (optional, default None - no secondary
+                entities)
+
+        Returns:
+            True if the events are not added to this shard (the event type is not shared between the shards),
+            otherwise False
+        """
+        if sec_uid_ls is not None:
+            self.shard_secondary_uid_set.update(sec_uid for sec_uid in sec_uid_ls if sec_uid is not None)
+        if event_type in self.shard_shared_event_type_ls:
+            return False
+
+        if num_events > 0:
+            # the last serial is set directly (as update_config does, without its debug log for every event)
+            last_ser_setting = self.event_last_ser_dict[event_type]
+            setattr(self, last_ser_setting, getattr(self, last_ser_setting) + num_events)
+            self.metadata_dict[last_ser_setting] = getattr(self, last_ser_setting)
+
+        return True
+
     def remove_event(self, remove_id: str) -> None:
         """
         Remove an event from the Dataset instance
@@ -801,6 +1147,13 @@ class DataSet:
         """
         event_id_dict = self.get_event_id_dict()
 
+        # events of entities processed by another shard (other than the shared event types) are removed by that shard
+        # (shards option)
+        if self.shard_run and remove_id not in event_id_dict['evn_id']:
+            self.logger.debug(f"event {remove_id} not in shard {self.shard_index} (removed by the shard processing "
+                              f"its entity)")
+            return
+
         ent_uid = self.search_event_id_dict(search_id=remove_id, data_key='prim_uid', event_id_dict=event_id_dict)
         ent_idx = self.get_entity_index(ent_uid)
         data_idx = self.search_event_id_dict(search_id=remove_id, data_key='data_idx', event_id_dict=event_id_dict)
@@ -865,9 +1218,21 @@ class DataSet:
             for idx in range(event_id_dict_idx, len(self.entities[ent_idx].entity_event_id_dict['evn_id'])):
                 if self.entities[ent_idx].entity_event_id_dict['type'][idx] == event_type:
                     self.entities[ent_idx].entity_event_id_dict['data_idx'][idx] -= 1
+            self.mark_entity_changed(ent_uid, event_type)
             # add a debug event to the log
             self.logger.debug(f"event {remove_id} removed from entity {ent_uid}")
 
+    def mark_entity_changed(self, uid: str, change_type: str) -> None:
+        """
+        Record that an entity has changed since the last finalise (incremental_finalise option). Changes are recorded
+        against the entity uid as the changed event type, or the entity data label for changes to entity parameters.
+        Args:
+            uid: the uid of the changed entity
+            change_type: the event type changed or the entity data label
+        """
+        if self.incremental_finalise:
+            self.changed_entity_dict.setdefault(str(uid), set()).add(change_type)
+
     def get_event_id_dict(self) -> dict:
         """
         Return a combined event_id_dict for all entities in entities array
@@ -885,6 +1250,42 @@ class DataSet:
 
         return event_dict
 
+    def get_drop_event_type_ls(self) -> list:
+        """
+        Return a list of the event types to drop from the CDF events output (drop_location_events, drop_seen_events,
+        drop_spot_events and drop_shot_events configuration options)
+        """
+        drop_event_type_ls = []
+        if self.drop_location_events:
+            drop_event_type_ls.append(self.loc_event_lbl)
+        if self.drop_seen_events:
+            drop_event_type_ls.append(self.seen_event_lbl)
+        if self.drop_spot_events:
+            drop_event_type_ls.append(self.spot_event_lbl)
+        if self.drop_shot_events:
+            drop_event_type_ls.append(self.shot_event_lbl)
+
+        return drop_event_type_ls
+
+    def get_entity_event_data_ls(self, entity: Entity) -> list:
+        """
+        Return the event data lists of an Entity instance grouped by event type, in the order that event types are
+        added to the CDF events output (location, shot, kill, loss, spot, seen, stop and status events)
+        Each item is a tuple of (event type, time list, detail list, x list, y list), x and y lists are None for all
+        event types other than location update
+        Args:
+            entity: the Entity instance to return the event data lists for
+        """
+        return [(self.loc_event_lbl, entity.location_time, entity.location_detail,
+                 entity.location_x, entity.location_y),
+                (self.shot_event_lbl, entity.shots_time, entity.shots_detail, None, None),
+                (self.kill_event_lbl, entity.kills_time, entity.kills_detail, None, None),
+                (self.loss_event_lbl, entity.losses_time, entity.losses_detail, None, None),
+                (self.spot_event_lbl, entity.spot_time, entity.spot_detail, None, None),
+                (self.seen_event_lbl, entity.seen_time, entity.seen_detail, None, None),
+                (self.stop_event_lbl, entity.stop_time, entity.stop_detail, None, None),
+                (self.status_event_lbl, entity.state_time, entity.state_detail, None, None)]
+
     def get_event_id_ls(self, sort_list=True) -> list:
         """
         Return a list of all event Ids for all entities in the entities array
@@ -1060,6 +1461,7 @@ class DataSet:
             self.entities[ent_idx].entity_event_id_dict['prim_uid'].append(prim_uid)
             self.entities[ent_idx].entity_event_id_dict['sec_uid'].append(sec_uid)
             self.entities[ent_idx].entity_event_id_dict['data_idx'].append(data_idx)
+            self.mark_entity_changed(prim_uid, add_event_type)
 
         else:
             self.logger.error(f"add_event_id called with unrecognised primary uid {prim_uid}")
@@ -1068,36 +1470,493 @@ class DataSet:
         """
         Execute all the data production and checking functions in sequence.
         """
+        # checkpoint manifest from a previous finalise of the same dataset state (finalise_checkpoints option) - the
+        # fingerprint is taken before the entity data is checked and updated
+        checkpoint_dict = None
+        if self.finalise_checkpoints != 'off':
+            checkpoint_dict = self.load_finalise_checkpoint_dict(self.get_dataset_fingerprint())
+
         self.check_dataset_details()
         self.assign_entity_levels()
         self.check_entity_data()
 
-        self.generate_cdf_entity_table_df()
-        self.check_cdf_entity_table_df()
-
-        self.generate_cdf_events_df()
-        self.check_cdf_events_df()
-
-        self.generate_cdf_cbt_pwr_df()
-        self.check_cdf_cbt_pwr_df()
+        # entities changed since the last finalise (None for a full finalise, see incremental_finalise option)
+        changes_dict = self.get_finalise_changes_dict()
+        event_uid_set = None
+        check_uid_set = None
+        cbt_item_set = None
+        if changes_dict is not None:
+            self.logger.info(f"Incremental finalise - {len(changes_dict)} entities changed since the last finalise")
+            # event rows are regenerated for entities with changed events
+            event_uid_set = {uid for uid, change_set in changes_dict.items() if change_set - {self.entity_data_lbl}}
+            # changed entities and the secondary entities of their events before the change are checked
+            check_uid_set = set(changes_dict.keys()) | self.get_cached_secondary_uid_set(event_uid_set)
+            # combat power is recalculated for the affiliations and forces (before and after the change) of entities
+            # with changed entity data or loss events
+            cbt_uid_set = {uid for uid, change_set in changes_dict.items()
+                           if change_set & {self.entity_data_lbl, self.loss_event_lbl}}
+            cbt_item_set = self.get_cbt_item_set(self.finalise_cache_dict['entity_table_df'], cbt_uid_set)
+        self.update_config('finalise_mode', 'full' if changes_dict is None else 'incremental')
+
+        def get_events_check_kwargs():
+            if check_uid_set is not None:
+                # and the secondary entities of their events after the change
+                check_uid_set.update(self.get_cached_secondary_uid_set(event_uid_set))
+            return {'cdf_file_type': 'events', 'check_set': check_uid_set}
+
+        def get_cbt_pwr_kwargs():
+            if cbt_item_set is not None:
+                cbt_item_set.update(self.get_cbt_item_set(self.CDF_entity_table_df, cbt_uid_set))
+            return {'update_item_set': cbt_item_set}
+
+        # generate and check the CDF Dataframes (see run_finalise_stages)
+        finalise_stage_ls = [
+            ('entity table', self.generate_cdf_entity_table_df, {}, []),
+            ('entity table check', self.validate_cdf_df, {'cdf_file_type': 'entity table'}, ['entity table']),
+            ('events', self.generate_cdf_events_df, {'update_uid_set': event_uid_set}, ['entity table']),
+            ('events check', self.validate_cdf_df, get_events_check_kwargs, ['events']),
+            ('combat power', self.generate_cdf_cbt_pwr_df, get_cbt_pwr_kwargs, ['entity table', 'events']),
+            ('combat power check', self.validate_cdf_df, {'cdf_file_type': 'combat power', 'check_set': cbt_item_set},
+             ['combat power'])]
+        resumed_stage_ls = []
+        if checkpoint_dict is not None:
+            # an incremental finalise regenerates the changed rows only so does not resume from checkpoints
+            if changes_dict is not None:
+                checkpoint_dict['stage_ls'] = []
+            resumed_stage_ls = list(checkpoint_dict['stage_ls'])
+            finalise_stage_ls = self.add_finalise_checkpoint_stages(finalise_stage_ls, checkpoint_dict)
+            self.update_config('finalise_resumed_stages', resumed_stage_ls)
+        stage_return_dict = self.run_finalise_stages(finalise_stage_ls)
+        # the time saved is not measured when validation_level is off (no row checks are run to estimate it from)
+        validation_time_saved = None
+        if self.validation_level != 'off':
+            validation_time_saved = sum(stage_return_dict[stage_name] for stage_name in ['entity table check',
+                                                                                         'events check',
+                                                                                         'combat power check'])
+
+        if self.incremental_finalise and len(resumed_stage_ls) > 0:
+            # the event ids of the entities are not kept when the CDF events are loaded, the next finalise is a full
+            # finalise
+            self.finalise_cache_dict = {}
+        elif self.incremental_finalise:
+            self.update_finalise_cache()
+
+        if self.validation_level == 'off':
+            self.logger.info("Validation level off - CDF row checks not run, time saved not measured")
+        elif self.validation_level != 'full':
+            self.logger.info(f"Validation level {self.validation_level} - estimated {validation_time_saved:.3f} "
+                             f"seconds saved on CDF checks")
+        self.update_config('validation_time_saved', None if validation_time_saved is None
+                           else round(validation_time_saved, 3))
 
         self.add_case_and_rep_to_cdf_df()
 
+        if self.memory_optimised_dtypes:
+            cdf_df_mem_usage = sum(cdf_df.memory_usage(deep=True).sum() for cdf_df in [self.CDF_entity_table_df,
+                                                                                      self.CDF_events_df,
+                                                                                      self.CDF_combat_power_DF])
+            self.logger.info(f"CDF Dataframes use {cdf_df_mem_usage / 1e6:.1f} MB (memory optimised dtypes)")
+
         self.add_summary_metadata()
 
-        if self.drop_location_events:
-            self.drop_event_type(self.loc_event_lbl)
-        if self.drop_seen_events:
-            self.drop_event_type(self.seen_event_lbl)
-        if self.drop_spot_events:
-            self.drop_event_type(self.spot_event_lbl)
-        if self.drop_shot_events:
-            self.drop_event_type(self.shot_event_lbl)
+        peak_memory_mb = CDFfunc.get_peak_memory_mb()
+        if peak_memory_mb is not None:
+            self.logger.info(f"Peak process memory {peak_memory_mb} MB")
+        self.update_config('peak_memory_mb', peak_memory_mb)
+
+        # a shard run saves its CDF Dataframes to be merged and exported with the other shards (shards option)
+        if self.shard_run:
+            self.save_dataset_shard()
+
+    def run_finalise_stages(self, stage_ls: list) -> dict:
+        """
+        Run the finalise_data stages that generate and check the CDF Dataframes with the finalise executor and log the
+        run time of each stage (also kept in finalise_stage_times).
+
+        Finalise executors:
+        serial - run the stages in sequence.
+        thread - run the stages on a thread pool as soon as the stages they depend on are complete, i.e. the checks of
+        a CDF Dataframe run while the next CDF Dataframe is generated.
+
+        Log records from the thread executor stages are held back and logged in stage order once the
+        stage and all the stages before it are complete, so the log order is the same for all executors.
+
+        Args:
+            stage_ls: list of stages in sequence order, each a tuple of stage name, stage function (method of this
+                Dataset instance), keyword arguments dict (or a function returning the dict, called when the stage
+                starts) and list of names of the stages it depends on
+
+        Returns:
+            dictionary of stage name - stage function return value
+        """
+        stage_return_dict = {}
+        stage_time_dict = {}
+
+        if self.finalise_executor == 'serial':
+            for stage_name, stage_func, stage_kwargs, dep_stage_ls in stage_ls:
+                start_time = perf_counter()
+                stage_return_dict[stage_name] = stage_func(**(stage_kwargs() if callable(stage_kwargs)
+                                                              else stage_kwargs))
+                stage_time_dict[stage_name] = perf_counter() - start_time
+        else:
+            log_record_capture = CDFfunc.get_log_record_capture(self.logger)
+
+            def run_stage(stage_func, stage_kwargs):
+                stage_start_time = perf_counter()
+                with log_record_capture.capture() as stage_record_ls:
+                    try:
+                        stage_return = stage_func(**stage_kwargs)
+                    except Exception:
+                        # log the stage log records before the error is raised
+                        for stage_record in stage_record_ls:
+                            self.logger.handle(stage_record)
+                        raise
+                return stage_return, stage_record_ls, perf_counter() - stage_start_time
+
+            stage_name_ls = [stage[0] for stage in stage_ls]
+            stage_record_dict = {}
+            future_stage_dict = {}
+            pending_stage_ls = list(stage_ls)
+            thread_executor = ThreadPoolExecutor(max_workers=len(stage_ls))
+            try:
+                while pending_stage_ls or future_stage_dict:
+                    # start the stages that have all the stages they depend on complete
+                    ready_stage_ls = [stage for stage in pending_stage_ls
+                                      if all(dep_stage_name in stage_return_dict for dep_stage_name in stage[3])]
+                    for stage_name, stage_func, stage_kwargs, dep_stage_ls in ready_stage_ls:
+                        pending_stage_ls.remove((stage_name, stage_func, stage_kwargs, dep_stage_ls))
+                        stage_kwargs = stage_kwargs() if callable(stage_kwargs) else stage_kwargs
+                        future = thread_executor.submit(run_stage, stage_func, stage_kwargs)
+                        future_stage_dict[future] = stage_name
+
+                    done_future_set, _ = wait(future_stage_dict, return_when=FIRST_COMPLETED)
+                    for future in done_future_set:
+                        stage_name = future_stage_dict.pop(future)
+                        stage_return_dict[stage_name], stage_record_dict[stage_name], stage_time_dict[stage_name] = \
+                            future.result()
+
+                    # log the held back log records of the complete stages in stage order
+                    while len(stage_record_dict) > 0 and stage_name_ls[0] in stage_record_dict:
+                        for stage_record in stage_record_dict.pop(stage_name_ls.pop(0)):
+                            self.logger.handle(stage_record)
+            finally:
+                for stage_name in stage_name_ls:
+                    for stage_record in stage_record_dict.pop(stage_name, []):
+                        self.logger.handle(stage_record)
+                thread_executor.shutdown(cancel_futures=True)
+
+        self.logger.info(f"Finalise stage times ({self.finalise_executor} executor) - " +
+                         ", ".join(f"{stage[0]}: {stage_time_dict[stage[0]]:.3f}s" for stage in stage_ls))
+        self.finalise_stage_times = {stage[0]: round(stage_time_dict[stage[0]], 3) for stage in stage_ls}
+
+        return stage_return_dict
+
+    def get_finalise_changes_dict(self) -> dict or None:
+        """
+        Get the entities changed since the last finalise for an incremental finalise (incremental_finalise option).
+
+        Changes are the entity changes recorded by the Dataset functions (see mark_entity_changed) plus any changes
+        found by comparing each entity with its state at the last finalise, i.e. a replaced Entity instance or a
+        change to its parameters or the lengths of its event data lists.
+
+        Returns:
+            dictionary of uid - set of changed event types and / or the entity data label for each changed entity,
+            or None if a full finalise is needed (option not set, no previous finalise, changed drop or dtype options
+            or repeat entity uids) or for a shard run (shards option)
+        """
+        if not self.incremental_finalise:
+            return None
+
+        uid_ls = self.get_uid_ls()
+        finalise_config = (tuple(self.get_drop_event_type_ls()), self.memory_optimised_dtypes)
+        full_finalise_reason = None
+        if self.shard_run:
+            full_finalise_reason = "shard run"
+        elif 'entity_state_dict' not in self.finalise_cache_dict:
+            full_finalise_reason = "no previous finalise"
+        elif self.finalise_cache_dict['config'] != finalise_config:
+            full_finalise_reason = "drop events or memory optimised dtypes options changed"
+        elif len(set(uid_ls)) != len(uid_ls):
+            full_finalise_reason = "repeat entity uids"
+        if full_finalise_reason is not None:
+            self.logger.info(f"Full finalise - {full_finalise_reason}")
+            return None
+
+        all_changes_set = set(self.event_lbl_map.keys()) | {self.entity_data_lbl}
+        changes_dict = {uid: change_set.copy() for uid, change_set in self.changed_entity_dict.items()}
+        cached_entity_state_dict = self.finalise_cache_dict['entity_state_dict']
+        for entity in self.entities:
+            cached_entity, cached_state_dict = cached_entity_state_dict.get(entity.uid, (None, None))
+            if cached_entity is not entity:
+                changes_dict.setdefault(entity.uid, set()).update(all_changes_set)
+            else:
+                for change_type, state in self.get_entity_state_dict(entity).items():
+                    if state != cached_state_dict[change_type]:
+                        changes_dict.setdefault(entity.uid, set()).add(change_type)
+        # entities removed since the last finalise
+        for uid in set(cached_entity_state_dict.keys()) - set(uid_ls):
+            changes_dict.setdefault(uid, set()).update(all_changes_set)
+
+        return changes_dict
+
+    def get_entity_state_dict(self, entity: Entity) -> dict:
+        """
+        Return the state of an Entity instance for comparison between finalise calls (incremental_finalise option) as
+        a dict of the entity data label - tuple of entity parameters and event type - tuple of event data list lengths
+        Args:
+            entity: the Entity instance to return the state for
+        """
+        state_dict = {self.entity_data_lbl: tuple(val for val in vars(entity).values()
+                                                  if not isinstance(val, (list, dict)))}
+        for event_type, time_data_ls, detail_data_ls, x_data_ls, y_data_ls in self.get_entity_event_data_ls(entity):
+            state_dict[event_type] = tuple(len(data_ls) for data_ls in (time_data_ls, detail_data_ls,
+                                                                        x_data_ls, y_data_ls) if data_ls is not None)
+        return state_dict
+
+    def get_cached_secondary_uid_set(self, uid_set: set) -> set:
+        """
+        Return the set of secondary entity uids for the events of a set of entities from the event ids kept for the
+        incremental_finalise option (i.e. as at the last call to generate_cdf_events_df)
+        Args:
+            uid_set: uids of the primary entities
+        """
+        entity_event_ids_dict = self.finalise_cache_dict.get('entity_event_ids_dict', {})
+        sec_uid_set = set()
+        for uid in uid_set:
+            for type_id_ls, type_prim_uid_ls, type_sec_uid_ls in entity_event_ids_dict.get(uid, {}).values():
+                sec_uid_set.update(type_sec_uid_ls)
+        sec_uid_set.discard(None)
+
+        return sec_uid_set
+
+    def get_cbt_item_set(self, entity_table_df: pd.DataFrame, uid_set: set) -> set:
+        """
+        Return the set of combat power items (affiliations and forces) for a set of entities
+        Args:
+            entity_table_df: CDF entity table Dataframe to get the entity affiliations and forces from
+            uid_set: uids of the entities
+        """
+        ent_row_mask = entity_table_df[self.ent_tbl_id_col_lbl].isin(uid_set)
+        return set(entity_table_df.loc[ent_row_mask, self.ent_tbl_affil_col_lbl].astype(str).to_list()) | \
+            set(entity_table_df.loc[ent_row_mask, self.ent_tbl_force_col_lbl].astype(str).to_list())
+
+    def update_finalise_cache(self) -> None:
+        """
+        Keep the entity states, CDF entity table and CDF combat power Dataframe from this finalise for the next
+        finalise and clear the recorded entity changes (incremental_finalise option). The CDF Dataframes are kept as
+        shallow copies so the column data is not copied.
+        """
+        self.finalise_cache_dict.update({
+            'config': (tuple(self.get_drop_event_type_ls()), self.memory_optimised_dtypes),
+            'entity_state_dict': {entity.uid: (entity, self.get_entity_state_dict(entity)) for entity in self.entities},
+            'entity_table_df': self.CDF_entity_table_df.copy(deep=False),
+            'cbt_pwr_df': self.CDF_combat_power_DF.copy(deep=False)})
+        self.changed_entity_dict = {}
+
+    def get_dataset_fingerprint(self) -> str:
+        """
+        Return a fingerprint (sha256 hex digest) of the dataset state the CDF Dataframes are generated from, i.e. the
+        entity parameters and event data and the options that change the CDF Dataframes (finalise_checkpoints option).
+        """
+        fingerprint_hash = hashlib.sha256()
+        fingerprint_hash.update(pickle.dumps((self.__class__.version, self.get_drop_event_type_ls(),
+                                              self.memory_optimised_dtypes, self.force_unique_unit_names)))
+        for entity in self.entities:
+            fingerprint_hash.update(pickle.dumps(vars(entity)))
+
+        return fingerprint_hash.hexdigest()
+
+    def get_finalise_checkpoint_path(self, file_name: str = None) -> str:
+        """
+        Return the path of the finalise checkpoint folder or of a file in it (finalise_checkpoints option)
+        Args:
+            file_name: name of the file in the checkpoint folder (optional, default None - return the folder path)
+        """
+        checkpoint_folder_path = path.join(self.output_location, self.checkpoint_folder_name)
+        if file_name is None:
+            return checkpoint_folder_path
+        return path.join(checkpoint_folder_path, file_name)
+
+    def load_finalise_checkpoint_dict(self, fingerprint: str) -> dict:
+        """
+        Load the finalise checkpoint manifest if it was saved for the same dataset state and checkpoint format
+        (finalise_checkpoints option).
+
+        Args:
+            fingerprint: fingerprint of the current dataset state (see get_dataset_fingerprint)
+
+        Returns:
+            checkpoint manifest dictionary - fingerprint, checkpoint format, list of the finalise stages with a
+            checkpoint file (empty if there is no usable checkpoint) and the dropped events summary
+        """
+        checkpoint_dict = {'fingerprint': fingerprint, 'format': self.finalise_checkpoints, 'stage_ls': []}
+        manifest_path = self.get_finalise_checkpoint_path(self.checkpoint_manifest_name)
+        if not path.isfile(manifest_path):
+            return checkpoint_dict
+
+        try:
+            with open(manifest_path, "r") as manifest_file:
+                saved_checkpoint_dict = yaml.safe_load(manifest_file)
+        except (OSError, yaml.YAMLError) as error:
+            self.logger.warning(f"Finalise checkpoint manifest {manifest_path} could not be read, finalise will not "
+                                f"resume from it: {str(error)}")
+            return checkpoint_dict
+
+        if not isinstance(saved_checkpoint_dict, dict) or \
+                saved_checkpoint_dict.get('fingerprint') != fingerprint or \
+                saved_checkpoint_dict.get('format') != self.finalise_checkpoints:
+            self.logger.info(f"Finalise checkpoint in {self.get_finalise_checkpoint_path()} was saved for a different "
+                             f"dataset state or format, finalise will not resume from it")
+            return checkpoint_dict
+
+        # only resume from stages with a checkpoint file
+        saved_checkpoint_dict['stage_ls'] = [
+            stage_name for stage_name in saved_checkpoint_dict.get('stage_ls', [])
+            if path.isfile(self.get_finalise_checkpoint_path(f"{self.checkpoint_stage_dict[stage_name][0]}."
+                                                             f"{self.finalise_checkpoints}"))]
+        self.logger.info(f"Finalise checkpoint found for this dataset state - CDF {saved_checkpoint_dict['stage_ls']} "
+                         f"will be loaded from {self.get_finalise_checkpoint_path()}")
+
+        return saved_checkpoint_dict
+
+    def add_finalise_checkpoint_stages(self, stage_ls: list, checkpoint_dict: dict) -> list:
+        """
+        Return the finalise stages (see run_finalise_stages) with the stages that generate CDF Dataframes swapped for
+        loading the Dataframe from its checkpoint file if it has one or followed by a stage that saves the Dataframe
+        to a checkpoint file if not (finalise_checkpoints option). The checkpoint save stages run in order so the
+        checkpoint manifest is updated by one stage at a time.
+
+        Args:
+            stage_ls: list of finalise stage tuples
+            checkpoint_dict: checkpoint manifest dictionary (see load_finalise_checkpoint_dict)
+        """
+        checkpoint_stage_ls = []
+        prev_save_stage_ls = []
+        for stage_name, stage_func, stage_kwargs, dep_stage_ls in stage_ls:
+            if stage_name in checkpoint_dict['stage_ls']:
+                checkpoint_stage_ls.append((stage_name, self.load_finalise_checkpoint,
+                                            {'stage_name': stage_name, 'checkpoint_dict': checkpoint_dict,
+                                             'stage_func': stage_func, 'stage_kwargs': stage_kwargs},
+                                            dep_stage_ls))
+            else:
+                checkpoint_stage_ls.append((stage_name, stage_func, stage_kwargs, dep_stage_ls))
+                if stage_name in self.checkpoint_stage_dict:
+                    save_stage_name = f"{stage_name} checkpoint"
+                    checkpoint_stage_ls.append((save_stage_name, self.save_finalise_checkpoint,
+                                                {'stage_name': stage_name, 'checkpoint_dict': checkpoint_dict},
+                                                [stage_name] + prev_save_stage_ls))
+                    prev_save_stage_ls = [save_stage_name]
+
+        return checkpoint_stage_ls
+
+    def save_finalise_checkpoint(self, stage_name: str, checkpoint_dict: dict) -> None:
+        """
+        Save the CDF Dataframe generated by a finalise stage to a checkpoint file and add the stage to the checkpoint
+        manifest (finalise_checkpoints option). Files are written under a temporary name and then renamed so that a
+        failure part way through a write never leaves a partial checkpoint file.
+
+        Args:
+            stage_name: finalise stage that generated the CDF Dataframe - 'entity table', 'events' or 'combat power'
+            checkpoint_dict: checkpoint manifest dictionary (see load_finalise_checkpoint_dict)
+        """
+        file_name, df_attr_name = self.checkpoint_stage_dict[stage_name]
+        if not path.isdir(self.get_finalise_checkpoint_path()):
+            makedirs(self.get_finalise_checkpoint_path())
+        checkpoint_file_path = self.get_finalise_checkpoint_path(f"{file_name}.{checkpoint_dict['format']}")
+
+        try:
+            if checkpoint_dict['format'] == 'parquet':
+                getattr(self, df_attr_name).to_parquet(checkpoint_file_path + ".tmp", index=False)
+            else:
+                getattr(self, df_attr_name).to_feather(checkpoint_file_path + ".tmp")
+        except ImportError:
+            self.logger.error(f"Finalise checkpoint not saved for the CDF {stage_name} - no "
+                              f"{checkpoint_dict['format']} engine installed")
+            return
+        except (ValueError, TypeError, NotImplementedError, OSError) as error:
+            self.logger.warning(f"Finalise checkpoint not saved for the CDF {stage_name}: {str(error)}")
+            if path.isfile(checkpoint_file_path + ".tmp"):
+                remove(checkpoint_file_path + ".tmp")
+            return
+        replace(checkpoint_file_path + ".tmp", checkpoint_file_path)
+
+        checkpoint_dict['stage_ls'] = checkpoint_dict['stage_ls'] + [stage_name]
+        if stage_name == 'events' and len(self.dropped_events_dict) > 0:
+            # summary of the dropped events (used by the CDF events checks and summary metadata) in yaml safe types
+            checkpoint_dict['dropped_events_dict'] = {
+                'num_events': int(self.dropped_events_dict['num_events']),
+                'first_time': float(self.dropped_events_dict['first_time']),
+                'last_time': float(self.dropped_events_dict['last_time']),
+                'null_time': bool(self.dropped_events_dict['null_time']),
+                'entity_ids': sorted(self.dropped_events_dict['entity_ids'], key=str)}
+        manifest_path = self.get_finalise_checkpoint_path(self.checkpoint_manifest_name)
+        with open(manifest_path + ".tmp", "w") as manifest_file:
+            yaml.safe_dump(checkpoint_dict, manifest_file)
+        replace(manifest_path + ".tmp", manifest_path)
+        self.logger.info(f"Finalise checkpoint saved for the CDF {stage_name} - {checkpoint_file_path}")
+
+    def load_finalise_checkpoint(self, stage_name: str, checkpoint_dict: dict, stage_func, stage_kwargs) -> None:
+        """
+        Load the CDF Dataframe for a finalise stage from its checkpoint file in place of generating it
+        (finalise_checkpoints option). If the checkpoint file cannot be read the Dataframe is generated.
+
+        Args:
+            stage_name: finalise stage that generates the CDF Dataframe - 'entity table', 'events' or 'combat power'
+            checkpoint_dict: checkpoint manifest dictionary (see load_finalise_checkpoint_dict)
+            stage_func: function that generates the CDF Dataframe
+            stage_kwargs: keyword arguments dict for stage_func (or a function returning the dict)
+        """
+        file_name, df_attr_name = self.checkpoint_stage_dict[stage_name]
+        checkpoint_file_path = self.get_finalise_checkpoint_path(f"{file_name}.{checkpoint_dict['format']}")
+        self.logger.info(f"Loading CDF {stage_name} from finalise checkpoint {checkpoint_file_path}")
+        try:
+            if checkpoint_dict['format'] == 'parquet':
+                cdf_df = pd.read_parquet(checkpoint_file_path)
+            else:
+                cdf_df = pd.read_feather(checkpoint_file_path)
+        except (ImportError, ValueError, TypeError, NotImplementedError, OSError) as error:
+            self.logger.error(f"Finalise checkpoint {checkpoint_file_path} could not be loaded, CDF {stage_name} will "
+                              f"be generated: {str(error)}")
+            stage_func(**(stage_kwargs() if callable(stage_kwargs) else stage_kwargs))
+            return
+
+        # string columns are loaded with python storage - restore the arrow string columns (memory_optimised_dtypes)
+        for col_lbl in cdf_df.columns:
+            if isinstance(cdf_df[col_lbl].dtype, pd.StringDtype) and cdf_df[col_lbl].dtype.storage != 'pyarrow':
+                cdf_df[col_lbl] = cdf_df[col_lbl].astype(pd.StringDtype(storage='pyarrow'))
+        setattr(self, df_attr_name, cdf_df)
+        if stage_name == 'events':
+            dropped_events_dict = checkpoint_dict.get('dropped_events_dict', {})
+            self.dropped_events_dict = dict(dropped_events_dict, entity_ids=set(dropped_events_dict['entity_ids'])) \
+                if len(dropped_events_dict) > 0 else {}
+
+    def remove_finalise_checkpoint(self) -> None:
+        """
+        Remove the finalise checkpoint files and folder (finalise_checkpoints option)
+        """
+        checkpoint_folder_path = self.get_finalise_checkpoint_path()
+        if not path.isdir(checkpoint_folder_path):
+            return
+        checkpoint_file_ls = [self.checkpoint_manifest_name] + \
+            [f"{file_name}.{checkpoint_format}" for file_name, df_attr_name in self.checkpoint_stage_dict.values()
+             for checkpoint_format in self.finalise_checkpoints_ls if checkpoint_format != 'off']
+        for file_name in listdir(checkpoint_folder_path):
+            if file_name in checkpoint_file_ls or file_name.replace(".tmp", "") in checkpoint_file_ls:
+                remove(path.join(checkpoint_folder_path, file_name))
+        if len(listdir(checkpoint_folder_path)) == 0:
+            rmdir(checkpoint_folder_path)
+        self.logger.info(f"Finalise checkpoint {checkpoint_folder_path} removed")
 
     def export_data(self) -> None:
         """
         Output CDF entity table, events and combat power files
         """
+        # the CDF files are exported once the shards are merged (shards option)
+        if self.shard_run:
+            self.logger.info(f"shard {self.shard_index} of {self.shards} - CDF files will be exported once the shards "
+                             f"are merged")
+            return
+
         # create output location if it does not already exist
         if not path.isdir(self.output_location):
             makedirs(self.output_location)
@@ -1112,38 +1971,422 @@ class DataSet:
         # refresh cdf filenames and paths
         self.generate_cdf_filenames_and_paths()
 
-        # write the metadata file
-        with open(self.metadata_file_path, "w") as metadata_file:
-            yaml.safe_dump(self.metadata_dict, metadata_file)
-        self.logger.info(f"{self.metadata_file_path} exported")
+        # record the CDF events file layout and get the columns to export
+        if self.normalised_events_export:
+            self.update_config('events_file_layout', 'normalised')
+            events_col_ls = [col_lbl for col_lbl in self.CDF_events_df.columns
+                             if col_lbl not in self.evn_tbl_entity_detail_col_ls]
+        else:
+            self.update_config('events_file_layout', 'denormalised')
+            events_col_ls = self.CDF_events_df.columns.to_list()
 
-        if self.output_csv:
-            self.logger.info("Exporting CDF files in .csv format:")
+        # record the settings used to write the .parquet files
+        self.update_config('parquet_settings', self.get_parquet_settings_dict() if self.output_parquet else None)
 
-            self.CDF_entity_table_df.to_csv(self.entity_file_path, index=False)
-            self.CDF_events_df.to_csv(self.events_file_path, index=False)
-            self.CDF_combat_power_DF.to_csv(self.cbt_pwr_file_path, index=False)
+        # set up the export tasks - metadata file then the CDF files for each output format
+        def write_metadata_file(file_path):
+            with open(file_path, "w") as metadata_file:
+                yaml.safe_dump(self.metadata_dict, metadata_file)
 
-            self.logger.info(f"{self.entity_file_path} exported")
-            self.logger.info(f"{self.events_file_path} exported")
-            self.logger.info(f"{self.cbt_pwr_file_path} exported")
+        def write_feather_file(cdf_df, file_path):
+            cdf_df.reset_index(drop=True).to_feather(file_path, compression=self.feather_compression)
 
+        # export tasks are (output format, file path, write function, write function kwargs)
+        export_task_ls = [(None, self.metadata_file_path, write_metadata_file,
+                           {'file_path': self.metadata_file_path})]
+        if self.output_csv:
+            csv_write_kwargs = {'batch_rows': self.csv_batch_rows,
+                                'compression': None if self.csv_compression == 'none' else self.csv_compression,
+                                'compression_threads': self.csv_compression_threads}
+            export_task_ls += [
+                ('csv', self.entity_file_path, CDFfunc.write_csv_batches,
+                 dict(output_df=self.CDF_entity_table_df, file_path=self.entity_file_path, **csv_write_kwargs)),
+                ('csv', self.events_file_path, CDFfunc.write_csv_batches,
+                 dict(output_df=self.CDF_events_df, file_path=self.events_file_path, columns=events_col_ls,
+                      **csv_write_kwargs)),
+                ('csv', self.cbt_pwr_file_path, CDFfunc.write_csv_batches,
+                 dict(output_df=self.CDF_combat_power_DF, file_path=self.cbt_pwr_file_path, **csv_write_kwargs))]
+        # .parquet and .feather files are named as the .csv files without the .csv file extension
+        export_df_ls = [(self.entity_file_path[:-len(self.csv_file_ext)], self.CDF_entity_table_df),
+                        (self.events_file_path[:-len(self.csv_file_ext)],
+                         self.CDF_events_df[events_col_ls] if self.normalised_events_export else self.CDF_events_df),
+                        (self.cbt_pwr_file_path[:-len(self.csv_file_ext)], self.CDF_combat_power_DF)]
         if self.output_parquet:
-            self.logger.info("Exporting CDF files in .parquet format:")
+            export_task_ls += [('parquet', f"{file_stem}.parquet", cdf_df.to_parquet,
+                                dict(path=f"{file_stem}.parquet", index=False, **self.get_parquet_write_kwargs(cdf_df)))
+                               for file_stem, cdf_df in export_df_ls]
+        if self.output_feather:
+            export_task_ls += [('feather', f"{file_stem}.feather", write_feather_file,
+                                {'cdf_df': cdf_df, 'file_path': f"{file_stem}.feather"})
+                               for file_stem, cdf_df in export_df_ls]
+        if self.output_partitioned:
+            # remove the partitions written by an earlier run of this case and replication first so that partitions
+            # for event types no longer in the CDF events are not left in the dataset
+            self.remove_dataset_partitions()
+            partitioned_df_ls = [(self.entity_folder_name, export_df_ls[0][1], self.ent_tbl_col_types_dict, False),
+                                 (self.events_folder_name, export_df_ls[1][1], self.evn_tbl_col_types_dict,
+                                  self.partition_by == 'event_type'),
+                                 (self.cbt_folder_name, export_df_ls[2][1], self.cbt_tbl_col_types_dict, False)]
+            for folder_name, cdf_df, col_types_dict, by_event_type in partitioned_df_ls:
+                if by_event_type:
+                    # a partition (and export task) for each event type in the CDF events
+                    event_type_arr = cdf_df[self.evn_tbl_event_type_col_lbl].astype(str).to_numpy()
+                    partition_df_ls = [(event_type, cdf_df.loc[event_type_arr == event_type])
+                                       for event_type in sorted(set(event_type_arr))]
+                else:
+                    partition_df_ls = [(None, cdf_df)]
+                for event_type, partition_df in partition_df_ls:
+                    partition_path = self.get_partition_path(folder_name, event_type)
+                    export_task_ls.append(('partitioned', partition_path, self.write_partitioned_cdf_df,
+                                           {'cdf_df': partition_df, 'partition_path': partition_path,
+                                            'col_types_dict': col_types_dict, 'by_event_type': by_event_type}))
+
+        export_error_dict = self.run_export_tasks(export_task_ls)
+
+        # log the outcome for each file in the order the files are listed for each format
+        format_lbl_dict = {'csv': self.csv_file_ext, 'parquet': ".parquet", 'feather': ".feather (Arrow IPC)",
+                           'partitioned': "partitioned .parquet dataset"}
+        engine_error_dict = {'csv': "Compressed csv export failed - no zstd engine installed",
+                             'parquet': "Parquet export failed - no parquet engine installed",
+                             'partitioned': "Partitioned dataset export failed - no parquet engine installed",
+                             'feather': "Feather export failed - no feather engine installed"}
+        export_error_ls = []
+        for file_format in [None, 'csv', 'parquet', 'feather', 'partitioned']:
+            format_task_ls = [export_task for export_task in export_task_ls if export_task[0] == file_format]
+            if file_format is not None and len(format_task_ls) > 0:
+                self.logger.info(f"Exporting CDF files in {format_lbl_dict[file_format]} format:")
+            # a missing zstd, parquet or feather engine is logged once for the format and does not stop the export
+            if file_format in engine_error_dict and \
+                    any(isinstance(export_error_dict[export_task[1]], ImportError) for export_task in format_task_ls):
+                self.logger.error(engine_error_dict[file_format])
+                continue
+            for _, file_path, _, _ in format_task_ls:
+                if export_error_dict[file_path] is None:
+                    self.logger.info(f"{file_path} exported")
+                else:
+                    self.logger.error(f"{file_path} export failed: {repr(export_error_dict[file_path])}")
+                    export_error_ls.append(export_error_dict[file_path])
+        # raise the first failure once all the files are reported
+        if len(export_error_ls) > 0:
+            raise export_error_ls[0]
+
+        # the CDF files are exported so the finalise checkpoint is no longer needed
+        if self.finalise_checkpoints != 'off':
+            self.remove_finalise_checkpoint()
+
+    def run_export_tasks(self, export_task_ls: list) -> dict:
+        """
+        Run the export tasks set up by export_data, in sequence or on a thread pool of up to export_max_workers
+        threads (export_executor option). The parquet and feather writers release the GIL so the files are written at
+        the same time and the export takes about as long as the largest file. A failed task does not stop the others.
+        Args:
+            export_task_ls: list of export tasks - (output format, file path, write function, write function kwargs)
+
+        Returns:
+            dict of file path - exception raised by the write function (None if the file was exported)
+        """
+        def run_task(write_func, write_kwargs):
             try:
-                pq_entity_file_path = self.entity_file_path.replace(".csv", ".parquet")
-                pq_events_file_path = self.events_file_path.replace(".csv", ".parquet")
-                pq_cbt_pwr_file_path = self.cbt_pwr_file_path.replace(".csv", ".parquet")
+                write_func(**write_kwargs)
+            except Exception as error:
+                return error
+            return None
 
-                self.CDF_entity_table_df.to_parquet(pq_entity_file_path, index=False)
-                self.CDF_events_df.to_parquet(pq_events_file_path, index=False)
-                self.CDF_combat_power_DF.to_parquet(pq_cbt_pwr_file_path, index=False)
+        if self.export_executor == 'serial' or len(export_task_ls) < 2:
+            return {file_path: run_task(write_func, write_kwargs)
+                    for _, file_path, write_func, write_kwargs in export_task_ls}
 
-                self.logger.info(f"{pq_entity_file_path} exported")
-                self.logger.info(f"{pq_events_file_path} exported")
-                self.logger.info(f"{pq_cbt_pwr_file_path} exported")
-            except ImportError:
-                self.logger.error("Parquet export failed - no parquet engine installed")
+        with ThreadPoolExecutor(max_workers=min(len(export_task_ls), self.export_max_workers)) as export_executor:
+            future_dict = {file_path: export_executor.submit(run_task, write_func, write_kwargs)
+                           for _, file_path, write_func, write_kwargs in export_task_ls}
+        return {file_path: future.result() for file_path, future in future_dict.items()}
+
+    def get_partition_path(self, folder_name: str, event_type: str = None) -> str:
+        """
+        Return the path of the partition of the partitioned .parquet dataset written by this Dataset instance for a
+        CDF output (output_partitioned option) - folder_name/case=case/rep=replication in partitioned_location, with
+        an event_type=event_type folder first if partitioned by event type. Partition values are URI encoded as they
+        are by pyarrow so that any case, replication or event type string gives a valid folder name.
+        Args:
+            folder_name: folder of the CDF output in the partitioned dataset (i.e. entity_folder_name)
+            event_type: event type of the partition if the CDF output is partitioned by event type (default None)
+        """
+        partition_ls = [f"{self.case_col_lbl}={quote(str(self.case), safe='')}",
+                        f"{self.rep_col_lbl}={quote(str(self.replication), safe='')}"]
+        if event_type is not None:
+            partition_ls.insert(0, f"{self.evn_tbl_event_type_col_lbl}={quote(str(event_type), safe='')}")
+        return path.join(self.partitioned_location, folder_name, *partition_ls)
+
+    def remove_dataset_partitions(self) -> None:
+        """
+        Remove the partitions of this case and replication from the partitioned .parquet dataset (output_partitioned
+        option) - for each CDF output and, for CDF events partitioned by event type, for every event type. The rest of
+        the dataset is not changed.
+        """
+        for folder_name in [self.entity_folder_name, self.events_folder_name, self.cbt_folder_name]:
+            partition_path_ls = [self.get_partition_path(folder_name)]
+            folder_path = path.join(self.partitioned_location, folder_name)
+            if folder_name == self.events_folder_name and self.partition_by == 'event_type' and path.isdir(folder_path):
+                case_rep_path = path.relpath(partition_path_ls[0], folder_path)
+                partition_path_ls = [path.join(folder_path, event_type_folder, case_rep_path)
+                                     for event_type_folder in listdir(folder_path)
+                                     if event_type_folder.startswith(f"{self.evn_tbl_event_type_col_lbl}=")]
+            for partition_path in partition_path_ls:
+                if path.isdir(partition_path):
+                    self.logger.debug(f"Removing partition {partition_path} written by an earlier run")
+                    shutil.rmtree(partition_path)
+
+    def write_partitioned_cdf_df(self, cdf_df: pd.DataFrame, partition_path: str, col_types_dict: dict,
+                                 by_event_type: bool = False) -> None:
+        """
+        Write a CDF output Dataframe into its partition of the partitioned .parquet dataset (output_partitioned
+        option).
+
+        Only the partition of this case and replication (and event type) is written - any files already in it are
+        removed first and the rest of the dataset is not changed, so the configurations of a batch can write into the
+        same dataset at the same time. The partition columns (case, rep and event_type if partitioned by event type)
+        are taken from the folder names and left out of the files. The other columns are written with the CDF column
+        types (as without memory_optimised_dtypes) so that the files of all the partitions have the same schema. The
+        parquet export options are applied to the files.
+        Args:
+            cdf_df: CDF output Dataframe rows of the partition (with case and rep columns, see
+                add_case_and_rep_to_cdf_df)
+            partition_path: path of the partition (see get_partition_path)
+            col_types_dict: dictionary of column labels and types of the CDF output (i.e. evn_tbl_col_types_dict)
+            by_event_type: the CDF output is partitioned by event type before case and replication
+        """
+        if pa is None:
+            raise ImportError("pyarrow is required to write the partitioned .parquet dataset")
+
+        partition_col_ls = [self.case_col_lbl, self.rep_col_lbl]
+        if by_event_type:
+            partition_col_ls.insert(0, self.evn_tbl_event_type_col_lbl)
+        pa_type_dict = {str: pa.string(), float: pa.float64(), 'int64': pa.int64(), bool: pa.bool_()}
+
+        # cast the columns to the CDF column types (categorical columns are dictionary encoded in the files anyway)
+        # and leave out the partition columns
+        cdf_table = pa.Table.from_pandas(cdf_df, preserve_index=False)
+        # the CDF column order is kept in the schema metadata (partition columns are read back last otherwise)
+        cdf_col_ls = list(cdf_table.column_names)
+        cdf_table = cdf_table.drop([col_lbl for col_lbl in partition_col_ls if col_lbl in cdf_col_ls])
+        field_ls = []
+        for field in cdf_table.schema:
+            if field.name in col_types_dict:
+                field_ls.append(pa.field(field.name, pa_type_dict[col_types_dict[field.name]]))
+            elif pa.types.is_dictionary(field.type):
+                field_ls.append(pa.field(field.name, field.type.value_type))
+            else:
+                field_ls.append(pa.field(field.name, field.type))
+        cdf_table = cdf_table.cast(pa.schema(field_ls, metadata={'cdf_columns': json.dumps(cdf_col_ls)}))
+
+        # remove any files in the partition and write the rows (in order) into it
+        if path.isdir(partition_path):
+            shutil.rmtree(partition_path)
+        write_kwargs = self.get_parquet_write_kwargs(cdf_df)
+        row_group_rows = write_kwargs.pop('row_group_size', None)
+        max_rows_kwargs = {} if row_group_rows is None else {'max_rows_per_group': row_group_rows,
+                                                              'min_rows_per_group': row_group_rows}
+        ds.write_dataset(cdf_table, partition_path, format='parquet', basename_template="part-{i}.parquet",
+                         existing_data_behavior='overwrite_or_ignore', use_threads=False,
+                         file_options=ds.ParquetFileFormat().make_write_options(**write_kwargs), **max_rows_kwargs)
+
+    def get_dataset_shard_path(self, shard_index: int) -> str:
+        """
+        Return the path of the file a shard run saves its entities to (shards option).
+        Args:
+            shard_index: index of the shard
+        """
+        return path.join(self.output_location, f"{self.shard_file_prefix}{shard_index}.pkl")
+
+    def save_dataset_shard(self) -> None:
+        """
+        Save the CDF Dataframe rows generated by this shard run (the entity table and events rows of its own entities
+        and the combat power rows of its own affiliations and forces), the dropped events summary, the uids of all
+        entities in the order they were added and the metadata dict to the shard file so that the shards can be
+        merged (see merge_dataset_shards, shards option).
+        """
+        own_row_mask = ~self.CDF_entity_table_df[self.ent_tbl_id_col_lbl].astype(str).isin(self.shard_foreign_uid_set)
+        shard_dict = {'uid_ls': self.get_uid_ls(),
+                      'entity_table_df': self.CDF_entity_table_df.loc[own_row_mask].reset_index(drop=True),
+                      'events_df': self.CDF_events_df,
+                      'cbt_pwr_df': self.CDF_combat_power_DF,
+                      'dropped_events_dict': self.dropped_events_dict,
+                      'metadata_dict': self.metadata_dict}
+
+        shard_file_path = self.get_dataset_shard_path(self.shard_index)
+        with open(shard_file_path, "wb") as shard_file:
+            pickle.dump(shard_dict, shard_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.logger.info(f"shard {self.shard_index} of {self.shards} - {int(own_row_mask.sum())} entities, "
+                         f"{len(self.CDF_events_df)} CDF events rows and {len(self.CDF_combat_power_DF)} CDF combat "
+                         f"power rows saved to {shard_file_path} to be merged")
+
+    def merge_dataset_shards(self) -> bool:
+        """
+        Merge the CDF Dataframes saved by the shard runs of the replication (shards option) into the Dataset instance.
+
+        Each shard run generates and checks the CDF rows of its own entities (and the combat power rows of its own
+        affiliations and forces), so the merge only puts the rows of the shards together in CDF order - the entity
+        table in the order the entities were added (the same in every shard run), the events by time, event type and
+        entity (as the events of each entity are gathered in turn) and the combat power by time and affiliation or
+        force. The event serials were reserved across the shards as the events were added
+        (see reserve_shard_event_serials), so the merged CDF Dataframes are the same as processing the replication in a
+        single process. The dropped events summaries of the shards are combined, the metadata dict of the first shard
+        (including any metadata added by the model processor) is applied as it is by import_dataset_dict and the
+        summary metadata is updated for the merged CDF Dataframes. The merged Dataset instance holds no entities. The
+        shard files are removed once merged.
+
+        Returns:
+            True if the shards are merged, False if a shard file is missing or the shards do not match
+        """
+        shard_file_path_ls = [self.get_dataset_shard_path(shard_index) for shard_index in range(self.shards)]
+        missing_file_ls = [shard_file_path for shard_file_path in shard_file_path_ls
+                           if not path.isfile(shard_file_path)]
+        if len(missing_file_ls) > 0:
+            self.logger.error(f"shards not merged - shard files {missing_file_ls} not found")
+            return False
+
+        uid_ls = None
+        shard_metadata_dict = None
+        shard_df_dict = {'entity_table_df': [], 'events_df': [], 'cbt_pwr_df': []}
+        shard_dropped_ls = []
+        for shard_file_path in shard_file_path_ls:
+            with open(shard_file_path, "rb") as shard_file:
+                shard_dict = pickle.load(shard_file)
+            if uid_ls is None:
+                uid_ls = shard_dict['uid_ls']
+                shard_metadata_dict = shard_dict['metadata_dict']
+            elif shard_dict['uid_ls'] != uid_ls:
+                self.logger.error(f"shards not merged - entities in {shard_file_path} do not match the first shard")
+                return False
+            for df_key, df_ls in shard_df_dict.items():
+                df_ls.append(shard_dict[df_key])
+            shard_dropped_ls.append(shard_dict['dropped_events_dict'])
+            del shard_dict
+
+        # position of each entity in the order the entities were added
+        uid_pos_dict = {str(uid): uid_pos for uid_pos, uid in enumerate(uid_ls)}
+        shard_ent_id_ls = [ent_id for entity_table_df in shard_df_dict['entity_table_df']
+                           for ent_id in entity_table_df[self.ent_tbl_id_col_lbl].astype(str).to_list()]
+        if sorted(shard_ent_id_ls, key=lambda ent_id: uid_pos_dict.get(ent_id, -1)) != \
+                [str(uid) for uid in uid_ls]:
+            self.logger.error(f"shards not merged - the shard files hold {len(shard_ent_id_ls)} entities, "
+                              f"expected {len(uid_ls)}")
+            return False
+
+        def get_merge_order(df_ls, sort_col_dict):
+            # stable sort of the rows of the Dataframes in shard order by the sort columns
+            sort_key_df = pd.DataFrame({sort_col_lbl: np.concatenate([sort_col_func(cdf_df) for cdf_df in df_ls])
+                                        for sort_col_lbl, sort_col_func in sort_col_dict.items()})
+            return sort_key_df.sort_values(by=list(sort_col_dict.keys()), kind='stable').index.to_numpy()
+
+        def get_uid_pos_arr(id_ser):
+            return id_ser.astype(str).map(uid_pos_dict).to_numpy(dtype=float)
+
+        def get_event_type_code_arr(event_type_ser):
+            # unrecognised event types sort after the known types
+            type_code_arr = pd.Categorical(event_type_ser.astype(object), self.evn_tbl_event_type_order_ls).codes
+            return np.where(type_code_arr < 0, len(self.evn_tbl_event_type_order_ls), type_code_arr)
+
+        df_ls = shard_df_dict.pop('entity_table_df')
+        self.CDF_entity_table_df = self.merge_cdf_df_rows(df_ls, get_merge_order(df_ls, {
+            'pos': lambda cdf_df: get_uid_pos_arr(cdf_df[self.ent_tbl_id_col_lbl])}))
+        df_ls = shard_df_dict.pop('events_df')
+        self.CDF_events_df = self.merge_cdf_df_rows(df_ls, get_merge_order(df_ls, {
+            'time': lambda cdf_df: pd.to_numeric(cdf_df[self.evn_tbl_time_col_lbl], errors='coerce').to_numpy(),
+            'type': lambda cdf_df: get_event_type_code_arr(cdf_df[self.evn_tbl_event_type_col_lbl]),
+            'pos': lambda cdf_df: get_uid_pos_arr(cdf_df[self.evn_tbl_prim_id_col_lbl])}))
+        df_ls = shard_df_dict.pop('cbt_pwr_df')
+        self.CDF_combat_power_DF = self.merge_cdf_df_rows(df_ls, get_merge_order(df_ls, {
+            'time': lambda cdf_df: pd.to_numeric(cdf_df[self.cbt_tbl_time_col_lbl], errors='coerce').to_numpy(),
+            'item': lambda cdf_df: cdf_df[self.cbt_tbl_item_col_lbl].astype(str).to_numpy(dtype=object)}))
+        del df_ls
+
+        # combine the dropped events summaries of the shards
+        shard_dropped_ls = [dropped_events_dict for dropped_events_dict in shard_dropped_ls
+                            if len(dropped_events_dict) > 0]
+        self.dropped_events_dict = {}
+        if len(shard_dropped_ls) > 0:
+            self.dropped_events_dict = {
+                'num_events': sum(dropped_dict['num_events'] for dropped_dict in shard_dropped_ls),
+                'first_time': pd.Series([dropped_dict['first_time'] for dropped_dict in shard_dropped_ls]).min(),
+                'last_time': pd.Series([dropped_dict['last_time'] for dropped_dict in shard_dropped_ls]).max(),
+                'null_time': any(dropped_dict['null_time'] for dropped_dict in shard_dropped_ls),
+                'entity_ids': set().union(*[dropped_dict['entity_ids'] for dropped_dict in shard_dropped_ls])}
+        self.finalise_cache_dict = {}
+
+        # update settings or add as metadata item (ignore init_date_time_str and the shard index)
+        for key, value in shard_metadata_dict.items():
+            if key not in ['init_date_time_str', 'shard_index']:
+                if key in vars(self):
+                    self.update_config(key, value)
+                else:
+                    self.add_metadata(key, value)
+        self.add_summary_metadata(total_entities=len(uid_ls))
+
+        for shard_file_path in shard_file_path_ls:
+            remove(shard_file_path)
+        self.logger.info(f"{len(uid_ls)} entities, {len(self.CDF_events_df)} CDF events rows and "
+                         f"{len(self.CDF_combat_power_DF)} CDF combat power rows merged from {self.shards} shards")
+
+        return True
+
+    @staticmethod
+    def run_shard_merge(dataset_config: dict) -> str:
+        """
+        Merge the CDF Dataframes of the shard runs of a replication (shards option) into a new Dataset instance and
+        export the CDF files. Called by CDFfunc.batch_run_processor once the shard runs for the configuration are
+        complete.
+        Args:
+            dataset_config: configuration dict for the replication (without shard_index)
+
+        Returns:
+            Outcome of the merge for the batch log
+        """
+        merged_dataset = DataSet(dataset_config=dataset_config)
+        if not merged_dataset.merge_dataset_shards():
+            return "failed - shards not merged (see Dataset log)"
+        merged_dataset.export_data()
+
+        return "complete"
+
+    def get_parquet_settings_dict(self) -> dict:
+        """
+        Return a dict of the settings used to write the .parquet output files (parquet export options) - compression
+        codec and level (None - codec default), rows in each row group (None - pyarrow default), dictionary encoded
+        columns (all, none or a list of column labels) and whether min / max column statistics are written for each
+        row group.
+        """
+        dictionary_columns = self.parquet_dictionary_columns
+        if dictionary_columns not in ['all', 'none']:
+            dictionary_columns = [col_lbl.strip() for col_lbl in dictionary_columns.split(';') if col_lbl.strip()]
+
+        return {'compression': self.parquet_compression,
+                'compression_level': self.parquet_compression_level,
+                'row_group_rows': self.parquet_row_group_rows if self.parquet_row_group_rows > 0 else None,
+                'dictionary_columns': dictionary_columns,
+                'statistics': self.parquet_statistics}
+
+    def get_parquet_write_kwargs(self, cdf_df: pd.DataFrame) -> dict:
+        """
+        Return the keyword arguments for DataFrame.to_parquet to write a CDF Dataframe with the parquet export
+        options (see get_parquet_settings_dict). The CDF events and combat power Dataframes are in time order so the
+        min / max time statistics of each row group allow readers to skip row groups outside a time window.
+        Args:
+            cdf_df: the CDF Dataframe to write
+        """
+        settings_dict = self.get_parquet_settings_dict()
+        use_dictionary = settings_dict['dictionary_columns'] == 'all'
+        if isinstance(settings_dict['dictionary_columns'], list):
+            use_dictionary = [col_lbl for col_lbl in settings_dict['dictionary_columns'] if col_lbl in cdf_df.columns]
+        write_kwargs = {'compression': None if settings_dict['compression'] == 'none' else settings_dict['compression'],
+                        'use_dictionary': use_dictionary,
+                        'write_statistics': settings_dict['statistics']}
+        if settings_dict['compression_level'] is not None:
+            write_kwargs['compression_level'] = settings_dict['compression_level']
+        if settings_dict['row_group_rows'] is not None:
+            write_kwargs['row_group_size'] = settings_dict['row_group_rows']
+
+        return write_kwargs
 
     def check_dataset_details(self) -> None:
         """
@@ -1230,73 +2473,67 @@ class DataSet:
         not_set_comps = 1
         not_set_cbt_comp = 1
 
-        for entity in self.entities:
-            # check if the entity uid is not of string type
-            if type(entity.uid) != str:
-                self.logger.warning(f"an entity has uid that is not of string type (uid: {entity.uid})")
-            # check str entity data for values that have not been set
-            if entity.unit_name is None:
-                entity.unit_name = not_set_str
-                self.logger.debug(f"Unit_name not set for uid {entity.uid}, set to {not_set_str}")
-            if entity.unit_type is None:
-                entity.unit_type = not_set_str
-                self.logger.debug(f"Unit_type not set for uid {entity.uid}, set to {not_set_str}")
-            if entity.commander is None:
-                entity.commander = not_set_str
-                self.logger.debug(f"Commander not set for uid {entity.uid}, set to {not_set_str}")
-            if entity.affiliation is None:
-                entity.affiliation = not_set_str
-                self.logger.debug(f"Affiliation not set for uid {entity.uid}, set to {not_set_str}")
-            if entity.force is None:
-                entity.force = str(entity.affiliation) + force_suffix_str
-                self.logger.debug(f"Force not set for uid {entity.uid}, set to {entity.force}")
-
-            # check for numerical data entries that are not set, set to default and generate warning:
-            if entity.level is None:
-                entity.level = not_set_lvl
-                self.logger.debug(f"Level not set for uid {entity.uid} - set to {str(not_set_lvl)}")
-            if entity.init_comps is None:
-                entity.init_comps = not_set_comps
-                self.logger.debug(f"Init comps not set for uid {entity.uid} - set to {str(not_set_comps)}")
-            if entity.cbt_per_comp is None:
-                entity.cbt_per_comp = not_set_cbt_comp
-                self.logger.debug(f"Cbt pwr per comp not set for uid {entity.uid} - set to {str(not_set_cbt_comp)}")
+        # columnar view of the entity data (object arrays so that values not set remain as None)
+        ent_data_dict = {attr: pd.Series([getattr(entity, attr) for entity in self.entities], dtype=object).to_numpy()
+                         for attr in ['uid', 'unit_name', 'unit_type', 'commander', 'affiliation', 'force',
+                                      'level', 'init_comps', 'cbt_per_comp']}
+
+        # check if any entity uids are not of string type
+        for uid in ent_data_dict['uid'][[type(uid) != str for uid in ent_data_dict['uid']]]:
+            self.logger.warning(f"an entity has uid that is not of string type (uid: {uid})")
+
+        # check entity data for values that have not been set and set to default values
+        not_set_dict = {'unit_name': not_set_str, 'unit_type': not_set_str, 'commander': not_set_str,
+                        'affiliation': not_set_str, 'force': None,
+                        'level': not_set_lvl, 'init_comps': not_set_comps, 'cbt_per_comp': not_set_cbt_comp}
+        for attr, default_val in not_set_dict.items():
+            not_set_mask = np.equal(ent_data_dict[attr], None)
+            num_not_set = int(not_set_mask.sum())
+            if num_not_set > 0:
+                if attr == 'force':
+                    # default force is the entity affiliation with suffix
+                    ent_data_dict[attr][not_set_mask] = [str(affil) + force_suffix_str
+                                                         for affil in ent_data_dict['affiliation'][not_set_mask]]
+                    self.logger.debug(f"Force not set for {num_not_set} entities, set to affiliation + "
+                                      f"'{force_suffix_str}'")
+                else:
+                    ent_data_dict[attr][not_set_mask] = default_val
+                    self.logger.debug(f"{attr} not set for {num_not_set} entities, set to {str(default_val)}")
+                for ent_idx in np.flatnonzero(not_set_mask):
+                    setattr(self.entities[ent_idx], attr, ent_data_dict[attr][ent_idx])
 
         # check if entity names are unique and add suffix if forcing unique entity names
-        repeat_dict = {}
-        repeat_found = False
-
-        for entity in self.entities:
-            ent_name = str(entity.unit_name).lower()
-            if ent_name in list(repeat_dict.keys()):
-                repeat_dict[ent_name] += 1
-                if not self.force_unique_unit_names:
-                    self.logger.warning(f"Name for entity {entity.uid} ({entity.unit_name}) is not unique")
-                if self.force_unique_unit_names:
-                    if not repeat_found:
-                        self.logger.info("Repeat entity names automatically updated, details in dataset instance log")
-                        repeat_found = True
-                    entity.unit_name = str(entity.unit_name) + "-" + str(repeat_dict[ent_name])
-                    self.logger.debug(f"Name for entity {entity.uid} updated to {entity.unit_name} (repeat unit name)")
+        ent_name_ser = pd.Series([str(unit_name) for unit_name in ent_data_dict['unit_name']], dtype=object)
+        ent_name_lower_ser = ent_name_ser.str.lower()
+        # repeat number for each entity name (1 for first instance of the name, 2 for the next etc.)
+        repeat_num_arr = ent_name_lower_ser.groupby(ent_name_lower_ser, sort=False).cumcount().to_numpy() + 1
+        repeat_idx_arr = np.flatnonzero(repeat_num_arr > 1)
+
+        if len(repeat_idx_arr) > 0:
+            if not self.force_unique_unit_names:
+                for ent_idx in repeat_idx_arr:
+                    self.logger.warning(f"Name for entity {ent_data_dict['uid'][ent_idx]} "
+                                        f"({ent_data_dict['unit_name'][ent_idx]}) is not unique")
             else:
-                repeat_dict[ent_name] = 1
+                self.logger.info("Repeat entity names automatically updated, details in dataset instance log")
+                for ent_idx in repeat_idx_arr:
+                    self.entities[ent_idx].unit_name = ent_name_ser[ent_idx] + "-" + str(repeat_num_arr[ent_idx])
+                self.logger.debug(f"Names for {len(repeat_idx_arr)} entities updated with a repeat number suffix "
+                                  f"(repeat unit name)")
 
         self.logger.debug(f"Summary of entity name repeats:")
-        for item in repeat_dict.items():
-            if item[1] > 1:
-                self.logger.debug(f"{item[1]} x repeats of {item[0]}")
+        name_repeats_ser = ent_name_lower_ser.groupby(ent_name_lower_ser, sort=False).size()
+        for ent_name, num_repeats in name_repeats_ser[name_repeats_ser > 1].items():
+            self.logger.debug(f"{num_repeats} x repeats of {ent_name}")
 
         # check if force name matches any affiliation name
-        afil_ls = []
-        for entity in self.entities:
-            afil_ls.append(entity.affiliation)
-        afil_ls = CDFfunc.get_unique_list(afil_ls)
-
-        for entity in self.entities:
-            if entity.force in afil_ls:
-                self.logger.warning(f"Force ({entity.force}) for entity {entity.uid} is also a value for affiliation, "
-                                    f"appending '{force_suffix_str}' to force for entity")
-                entity.force = entity.force + force_suffix_str
+        force_clash_mask = pd.Series(ent_data_dict['force'], dtype=object).isin(
+            set(ent_data_dict['affiliation'].tolist())).to_numpy()
+        for ent_idx in np.flatnonzero(force_clash_mask):
+            entity = self.entities[ent_idx]
+            self.logger.warning(f"Force ({entity.force}) for entity {entity.uid} is also a value for affiliation, "
+                                f"appending '{force_suffix_str}' to force for entity")
+            entity.force = entity.force + force_suffix_str
 
     def generate_cdf_entity_table_df(self) -> None:
         """
@@ -1306,116 +2543,219 @@ class DataSet:
         # reset the dataframe
         self.CDF_entity_table_df = pd.DataFrame()
 
-        unit_id_ls = []
-        for entity in self.entities:
-            unit_id_ls.append(entity.uid)
-
-        unit_name_ls = []
-        unit_type_ls = []
-        unit_commander_id_ls = []
-        unit_commander_name_ls = []
-        unit_level_ls = []
-        affiliation_ls = []
-        force_ls = []
-        init_comps_ls = []
-        cbt_per_comp_ls = []
-        init_cbt_pwr_ls = []
-
-        system_entity_ls = []
-        start_entity_ls = []
-        add_time_ls = []
-        total_events_ls = []
-        loc_events_ls = []
-        seen_events_ls = []
-        spot_events_ls = []
-        shot_events_ls = []
-        kill_events_ls = []
-        loss_events_ls = []
-        stop_events_ls = []
-        status_events_ls = []
-
-        for entity in self.entities:
-            unit_name_ls.append(entity.unit_name)
-            unit_type_ls.append(entity.unit_type)
-            unit_commander_id_ls.append(entity.commander)
-
-            # in some cases commander may not be a recognised entity
-            if str(unit_commander_id_ls[-1]) in unit_id_ls:
-                commander_name = self.entities[self.get_entity_index(unit_commander_id_ls[-1])].unit_name
-                unit_commander_name_ls.append(commander_name)
-            else:
-                self.logger.debug(f"Commander uid {unit_commander_id_ls[-1]} for {entity.uid} not recognised, "
-                                  f"commander_name set as blank")
-                unit_commander_name_ls.append("")
-
-            unit_level_ls.append(entity.level)
-            affiliation_ls.append(entity.affiliation)
-            force_ls.append(entity.force)
-            init_comps_ls.append(entity.init_comps)
-            cbt_per_comp_ls.append(entity.cbt_per_comp)
-            init_cbt_pwr_ls.append(entity.init_comps * entity.cbt_per_comp)
-
-            system_entity_ls.append(entity.system_entity)
-            start_entity_ls.append(entity.start_entity)
-            add_time_ls.append(entity.add_time)
-            loc_events_ls.append(len(entity.location_time))
-            seen_events_ls.append(len(entity.seen_time))
-            spot_events_ls.append(len(entity.spot_time))
-            shot_events_ls.append(len(entity.shots_time))
-            kill_events_ls.append(len(entity.kills_time))
-            loss_events_ls.append(len(entity.losses_time))
-            stop_events_ls.append(len(entity.stop_time))
-            status_events_ls.append(len(entity.state_time))
-
-            total_events_ls.append(len(entity.entity_event_id_dict['evn_id']))
-
-        if not CDFfunc.compare_list_lengths(unit_id_ls, unit_name_ls, unit_type_ls,
-                                            unit_commander_id_ls, unit_level_ls, affiliation_ls, force_ls,
-                                            init_comps_ls, cbt_per_comp_ls, init_cbt_pwr_ls,
-                                            system_entity_ls, start_entity_ls, add_time_ls,
-                                            loc_events_ls, seen_events_ls, spot_events_ls,
-                                            shot_events_ls, kill_events_ls, loss_events_ls,
-                                            stop_events_ls, status_events_ls, total_events_ls):
-            self.logger.error("Generate_cdf_entity_table function - mismatched list lengths")
-
-        self.CDF_entity_table_df = pd.DataFrame(data=zip(unit_id_ls, unit_name_ls, unit_type_ls,
-                                                         unit_commander_id_ls, unit_commander_name_ls,
-                                                         unit_level_ls, affiliation_ls, force_ls,
-                                                         init_comps_ls, cbt_per_comp_ls, init_cbt_pwr_ls,
-                                                         system_entity_ls, start_entity_ls, add_time_ls,
-                                                         total_events_ls, status_events_ls, loc_events_ls,
-                                                         seen_events_ls, spot_events_ls, stop_events_ls,
-                                                         shot_events_ls, kill_events_ls, loss_events_ls),
-                                                columns=[self.ent_tbl_id_col_lbl,
-                                                         self.ent_tbl_name_col_lbl,
-                                                         self.ent_tbl_type_col_lbl,
-                                                         self.ent_tbl_commander_id_col_lbl,
-                                                         self.ent_tbl_commander_name_col_lbl,
-                                                         self.ent_tbl_level_col_lbl,
-                                                         self.ent_tbl_affil_col_lbl,
-                                                         self.ent_tbl_force_col_lbl,
-                                                         self.ent_tbl_init_comp_col_lbl,
-                                                         self.ent_tbl_cbt_per_comp_col_lbl,
-                                                         self.ent_tbl_init_cbt_pwr_col_lbl,
-                                                         self.ent_tbl_sys_entity_col_lbl,
-                                                         self.ent_tbl_start_entity_col_lbl,
-                                                         self.ent_tbl_add_time_col_lbl,
-                                                         self.ent_tbl_total_events_lbl,
-                                                         self.ent_tbl_status_events_lbl,
-                                                         self.ent_tbl_loc_events_lbl,
-                                                         self.ent_tbl_seen_events_lbl,
-                                                         self.ent_tbl_spot_events_lbl,
-                                                         self.ent_tbl_stop_events_lbl,
-                                                         self.ent_tbl_shot_events_lbl,
-                                                         self.ent_tbl_kill_events_lbl,
-                                                         self.ent_tbl_loss_events_lbl])
-
-        # try to apply column types to the CDF entity table df
+        # CDF entity table columns in output order
+        ent_tbl_col_lbl_ls = [self.ent_tbl_id_col_lbl, self.ent_tbl_name_col_lbl, self.ent_tbl_type_col_lbl,
+                              self.ent_tbl_commander_id_col_lbl, self.ent_tbl_level_col_lbl,
+                              self.ent_tbl_affil_col_lbl, self.ent_tbl_force_col_lbl,
+                              self.ent_tbl_init_comp_col_lbl, self.ent_tbl_cbt_per_comp_col_lbl,
+                              self.ent_tbl_init_cbt_pwr_col_lbl,
+                              self.ent_tbl_sys_entity_col_lbl, self.ent_tbl_start_entity_col_lbl,
+                              self.ent_tbl_add_time_col_lbl,
+                              self.ent_tbl_total_events_lbl, self.ent_tbl_status_events_lbl,
+                              self.ent_tbl_loc_events_lbl, self.ent_tbl_seen_events_lbl,
+                              self.ent_tbl_spot_events_lbl, self.ent_tbl_stop_events_lbl,
+                              self.ent_tbl_shot_events_lbl, self.ent_tbl_kill_events_lbl,
+                              self.ent_tbl_loss_events_lbl]
+
+        # gather the entity data (event counts from the lengths of the entity event lists) in a single pass
+        ent_data_ls = [(entity.uid, entity.unit_name, entity.unit_type, entity.commander, entity.level,
+                        entity.affiliation, entity.force, entity.init_comps, entity.cbt_per_comp,
+                        entity.init_comps * entity.cbt_per_comp,
+                        entity.system_entity, entity.start_entity, entity.add_time,
+                        len(entity.entity_event_id_dict['evn_id']), len(entity.state_time),
+                        len(entity.location_time), len(entity.seen_time), len(entity.spot_time),
+                        len(entity.stop_time), len(entity.shots_time), len(entity.kills_time),
+                        len(entity.losses_time)) for entity in self.entities]
+        ent_data_dict = dict(zip(ent_tbl_col_lbl_ls, zip(*ent_data_ls))) if ent_data_ls \
+            else {col_lbl: () for col_lbl in ent_tbl_col_lbl_ls}
+
+        # commander name from a join of commander id to entity id (blank if commander is not a recognised entity)
+        ent_name_dict = dict(zip(ent_data_dict[self.ent_tbl_id_col_lbl], ent_data_dict[self.ent_tbl_name_col_lbl]))
+        commander_id_ser = pd.Series([str(commander_id) for commander_id
+                                      in ent_data_dict[self.ent_tbl_commander_id_col_lbl]], dtype=object)
+        commander_known_mask = commander_id_ser.isin(ent_name_dict.keys())
+        commander_name_ls = commander_id_ser.map(ent_name_dict).where(commander_known_mask, "").to_list()
+        if not commander_known_mask.all():
+            self.logger.debug(f"Commander uid not recognised for {int((~commander_known_mask).sum())} entities, "
+                              f"commander_name set as blank")
+        ent_data_dict[self.ent_tbl_commander_name_col_lbl] = commander_name_ls
+
+        # construct the dataframe with columns typed as they are added
+        ent_tbl_col_lbl_ls.insert(ent_tbl_col_lbl_ls.index(self.ent_tbl_commander_id_col_lbl) + 1,
+                                  self.ent_tbl_commander_name_col_lbl)
+        ent_tbl_col_types_dict = self.get_cdf_col_types_dict(self.ent_tbl_col_types_dict)
         try:
-            self.CDF_entity_table_df = self.CDF_entity_table_df.astype(dtype=self.ent_tbl_col_types_dict)
-        except ValueError as error:
+            ent_tbl_col_dict = dict()
+            for col_lbl in ent_tbl_col_lbl_ls:
+                col_type = ent_tbl_col_types_dict[col_lbl]
+                if col_type is str:
+                    ent_tbl_col_dict[col_lbl] = np.array([str(val) for val in ent_data_dict[col_lbl]], dtype=object)
+                elif self.ent_tbl_col_types_dict[col_lbl] is str:
+                    ent_tbl_col_dict[col_lbl] = pd.array([str(val) for val in ent_data_dict[col_lbl]], dtype=col_type)
+                else:
+                    ent_tbl_col_dict[col_lbl] = np.array(ent_data_dict[col_lbl], dtype=col_type)
+            self.CDF_entity_table_df = pd.DataFrame(ent_tbl_col_dict, columns=ent_tbl_col_lbl_ls)
+        except (ValueError, TypeError) as error:
             self.logger.error(f"Unable to type cast for one or more columns in CDF entity table df: {str(error)}, "
                               f"may cause issues with parquet export")
+            self.CDF_entity_table_df = pd.DataFrame({col_lbl: pd.Series(ent_data_dict[col_lbl], dtype=object)
+                                                     for col_lbl in ent_tbl_col_lbl_ls}, columns=ent_tbl_col_lbl_ls)
+
+    def get_cdf_col_types_dict(self, col_types_dict: dict) -> dict:
+        """
+        Get the column types to apply to a CDF output Dataframe.
+
+        If memory_optimised_dtypes is set, string columns in cdf_category_col_ls are categorical, other string columns
+        are arrow strings (if pyarrow is installed) and 64 bit integer columns are 32 bit. Float columns are
+        unchanged so that values are written to .csv files exactly as before.
+
+        Args:
+            col_types_dict: dictionary of column labels and types (i.e. evn_tbl_col_types_dict)
+
+        Returns:
+            dictionary of column labels and types to apply
+        """
+        if not self.memory_optimised_dtypes:
+            return col_types_dict
+
+        try:
+            str_dtype = pd.StringDtype(storage='pyarrow')
+        except ImportError:
+            str_dtype = str
+
+        opt_col_types_dict = dict()
+        for col_lbl, col_type in col_types_dict.items():
+            if col_type is str and col_lbl in self.cdf_category_col_ls:
+                opt_col_types_dict[col_lbl] = 'category'
+            elif col_type is str:
+                opt_col_types_dict[col_lbl] = str_dtype
+            elif col_type == 'int64':
+                opt_col_types_dict[col_lbl] = 'int32'
+            else:
+                opt_col_types_dict[col_lbl] = col_type
+        return opt_col_types_dict
+
+    def apply_cdf_col_types(self, cdf_df: pd.DataFrame, col_types_dict: dict) -> None:
+        """
+        Apply column types to a CDF output Dataframe in place.
+
+        Columns are converted one at a time and only if needed (string columns are always converted) so that at most
+        one column is copied at a time, rather than the whole Dataframe as with DataFrame.astype.
+
+        Args:
+            cdf_df: CDF output Dataframe
+            col_types_dict: dictionary of column labels and types (i.e. from get_cdf_col_types_dict)
+
+        Raises:
+            ValueError: if a column cannot be converted to its type
+        """
+        for col_lbl, col_type in col_types_dict.items():
+            col_ser = cdf_df[col_lbl]
+            if col_type is str and isinstance(col_ser.dtype, pd.CategoricalDtype):
+                # convert categorical columns via object so the category values are shared rather than copied per row
+                col_ser = col_ser.astype(object)
+            if col_type is not str:
+                exp_dtype = pd.api.types.pandas_dtype(col_type)
+                if isinstance(exp_dtype, pd.CategoricalDtype):
+                    if isinstance(col_ser.dtype, pd.CategoricalDtype):
+                        continue
+                elif col_ser.dtype == exp_dtype:
+                    continue
+            cdf_df[col_lbl] = col_ser.astype(col_type)
+
+    def validate_cdf_df(self, cdf_file_type: str, check_set: set = None) -> float:
+        """
+        Run the checks for a CDF output Dataframe at the dataset validation level.
+
+        Validation levels:
+        full - run all checks on all rows.
+        sampled - run the row checks on a deterministic sample of validation_sample_size rows (every nth row) and
+        estimate the number of row issues in the full Dataframe. Entity table checks are always run in full.
+        off - check the columns and column types of the Dataframe only.
+
+        Args:
+            cdf_file_type: CDF output Dataframe to check - 'entity table', 'events' or 'combat power'
+            check_set: entity uids (events) or affiliations and forces (combat power) to restrict the checks to, i.e.
+                those changed since the last finalise (incremental_finalise option) (optional, default None - check
+                all rows)
+
+        Returns:
+            Estimated time (seconds) saved on the row checks compared to running the full checks (0 for full
+            validation and for validation off, where the time saved is not measured)
+        """
+        check_dict = {'entity table': (self.check_cdf_entity_table_df, self.CDF_entity_table_df,
+                                       self.ent_tbl_col_types_dict),
+                      'events': (self.check_cdf_events_df, self.CDF_events_df, self.evn_tbl_col_types_dict),
+                      'combat power': (self.check_cdf_cbt_pwr_df, self.CDF_combat_power_DF,
+                                       self.cbt_tbl_col_types_dict)}
+        check_func, cdf_df, col_types_dict = check_dict[cdf_file_type]
+        col_types_dict = self.get_cdf_col_types_dict(col_types_dict)
+        sampled_check = cdf_file_type != 'entity table'
+        if self.shard_run and cdf_file_type == 'entity table' and self.shard_index != 0:
+            # every shard run holds all the entities, the entity table is checked by the first shard (shards option)
+            self.logger.info(f"shard {self.shard_index} of {self.shards} - CDF entity table checked by shard 0")
+            return 0.0
+
+        # rows to check (all rows unless the checks are restricted to a check set)
+        num_check_rows = len(cdf_df)
+        check_kwargs = dict()
+        if check_set is not None and cdf_file_type == 'events':
+            check_kwargs['check_uid_set'] = check_set
+            num_check_rows = int((cdf_df[self.evn_tbl_prim_id_col_lbl].isin(check_set) |
+                                  cdf_df[self.evn_tbl_sec_id_col_lbl].isin(check_set)).sum())
+        elif check_set is not None and cdf_file_type == 'combat power':
+            check_kwargs['check_item_set'] = check_set
+            num_check_rows = int(cdf_df[self.cbt_tbl_item_col_lbl].astype(str).isin(check_set).sum())
+
+        if self.validation_level == 'full' or (self.validation_level == 'sampled' and not sampled_check):
+            check_func(**check_kwargs)
+            return 0.0
+
+        if self.validation_level == 'sampled':
+            sample_step = -(-num_check_rows // self.validation_sample_size) if num_check_rows > 0 else 1
+            # time saved estimated from the time to run the row checks on the sample
+            return check_func(sample_step=sample_step, **check_kwargs) * (sample_step - 1)
+
+        self.check_cdf_df_structure(cdf_file_type, cdf_df, col_types_dict)
+        return 0.0
+
+    def check_cdf_df_structure(self, cdf_file_type: str, cdf_df: pd.DataFrame, col_types_dict: dict) -> None:
+        """
+        Check the structure of a CDF output Dataframe (validation_level off).
+
+        Structure checks:
+        Check that all expected columns are present (add Dataset error).
+        Check that the column types match the expected types (add Dataset warning).
+
+        Args:
+            cdf_file_type: CDF output Dataframe type for log messages
+            cdf_df: CDF output Dataframe to check
+            col_types_dict: dictionary of expected column labels and types
+        """
+        self.logger.info(f"Checking CDF {cdf_file_type} file structure")
+        structure_issue_count = 0
+
+        for col_lbl, col_type in col_types_dict.items():
+            if col_lbl not in cdf_df.columns:
+                self.logger.error(f"CDF {cdf_file_type} structure check - column {col_lbl} missing")
+                structure_issue_count += 1
+            else:
+                exp_dtype = np.dtype(object) if col_type is str else pd.api.types.pandas_dtype(col_type)
+                # categorical columns match any categories
+                if isinstance(exp_dtype, pd.CategoricalDtype):
+                    type_match = isinstance(cdf_df[col_lbl].dtype, pd.CategoricalDtype)
+                else:
+                    type_match = cdf_df[col_lbl].dtype == exp_dtype
+                if not type_match:
+                    self.logger.warning(f"CDF {cdf_file_type} structure check - column {col_lbl} has type "
+                                        f"{cdf_df[col_lbl].dtype}, expected {exp_dtype}")
+                    structure_issue_count += 1
+
+        if structure_issue_count == 0:
+            self.logger.info(f"No issues found in CDF {cdf_file_type} file structure")
+        else:
+            self.logger.warning(f"{structure_issue_count} potential issues found in CDF {cdf_file_type} "
+                                f"file structure")
 
     def check_cdf_entity_table_df(self) -> None:
         """
@@ -1428,24 +2768,25 @@ class DataSet:
         self.logger.info("Checking CDF entity table file")
 
         entity_table_issue_count = 0
-        entity_uid_list = self.CDF_entity_table_df[self.ent_tbl_id_col_lbl].tolist()
+        entity_uid_ser = self.CDF_entity_table_df[self.ent_tbl_id_col_lbl]
 
         # check that entity uids are unique
-        unique_uid_list = CDFfunc.get_unique_list(entity_uid_list)
-        if len(unique_uid_list) < len(entity_uid_list):
-            for uid in unique_uid_list:
-                if entity_uid_list.count(uid) > 1:
-                    self.logger.error(f"CDF entity table check - {entity_uid_list.count(uid)} instances "
-                                      f"of uid {uid} in CDF entity table")
-                    entity_table_issue_count += 1
+        repeat_uid_mask = entity_uid_ser.duplicated(keep=False)
+        if repeat_uid_mask.any():
+            uid_count_dict = entity_uid_ser[repeat_uid_mask].value_counts().to_dict()
+            for uid in entity_uid_ser[repeat_uid_mask].drop_duplicates().to_list():
+                self.logger.error(f"CDF entity table check - {uid_count_dict[uid]} instances "
+                                  f"of uid {uid} in CDF entity table")
+                entity_table_issue_count += 1
 
         # check that affiliation to force is a many-to-one mapping
-        unique_affil_list = CDFfunc.get_unique_list(self.CDF_entity_table_df[self.ent_tbl_affil_col_lbl].tolist())
-        for affil in unique_affil_list:
-            test_mask = (self.CDF_entity_table_df[self.ent_tbl_affil_col_lbl] == affil)
-            force_list = CDFfunc.get_unique_list(
-                self.CDF_entity_table_df.loc[test_mask, self.ent_tbl_force_col_lbl].tolist())
-            if len(force_list) > 1:
+        affil_force_grp = self.CDF_entity_table_df.groupby(self.ent_tbl_affil_col_lbl, sort=False, dropna=False,
+                                                           observed=True)[self.ent_tbl_force_col_lbl]
+        affil_num_forces_ser = affil_force_grp.nunique(dropna=False)
+        if (affil_num_forces_ser > 1).any():
+            affil_forces_dict = affil_force_grp.unique().to_dict()
+            for affil in affil_num_forces_ser[affil_num_forces_ser > 1].index.to_list():
+                force_list = list(affil_forces_dict[affil])
                 self.logger.error(f"CDF entity table check - {affil} maps to multiple forces: {force_list}")
                 entity_table_issue_count += 1
 
@@ -1457,13 +2798,399 @@ class DataSet:
             self.logger.warning(f"{entity_table_issue_count} potential issues found in CDF entity table file, "
                                 f"may cause issues with parquet export")
 
-    def generate_cdf_events_df(self) -> None:
+    def generate_cdf_events_df(self, update_uid_set: set = None) -> None:
         """
         Generate CDF event output as a Dataframe
+
+        Args:
+            update_uid_set: uids of the entities with events changed since the last finalise. The CDF events rows of
+                these entities are rebuilt and spliced into the CDF events from the last finalise
+                (see splice_cdf_events_rows) or, if the rows cannot be spliced, the event ids of all other entities
+                are reused from the last finalise (incremental_finalise option) (optional, default None - generate all
+                events)
         """
         self.logger.info("Generating CDF events file")
-        # reset the dataframe
+        # event types to drop from CDF events (configuration options) - these are never added to the CDF events df
+        drop_event_type_ls = self.get_drop_event_type_ls()
+        for event_type in drop_event_type_ls:
+            self.logger.info(f"Dropping events of type {event_type} from CDF events")
+
+        drop_num_events_dict = None
+        if update_uid_set is not None and 'events_df' in self.finalise_cache_dict:
+            drop_num_events_dict = self.splice_cdf_events_rows(drop_event_type_ls, update_uid_set)
+        if drop_num_events_dict is None:
+            # reset the dataframe
+            self.CDF_events_df = pd.DataFrame()
+            drop_num_events_dict = self.build_cdf_events_rows(drop_event_type_ls, update_uid_set=update_uid_set)
+            self.CDF_events_df = self.complete_cdf_events_df(self.CDF_events_df)
+        if self.shard_run:
+            self.split_shard_cdf_events_rows()
+
+        if self.incremental_finalise:
+            # keep the CDF events for the next finalise (the column data is not copied)
+            self.finalise_cache_dict['events_df'] = self.CDF_events_df.copy(deep=False)
+
+        for event_type, num_events in drop_num_events_dict.items():
+            self.logger.info(f"{num_events} events of type {event_type} dropped")
+
+    def complete_cdf_events_df(self, events_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Attach the primary and secondary entity details to CDF events rows (see attach_cdf_events_entity_details), put
+        the columns in CDF events order and apply the CDF events column types.
+
+        Args:
+            events_df: CDF events rows with locations (see build_cdf_events_rows)
+
+        Returns:
+            CDF events Dataframe (the column data is not copied)
+        """
+        # attach the primary and secondary entity details from the entity table (see attach_cdf_events_entity_details)
+        self.attach_cdf_events_entity_details(events_df)
+
+        # rearrange columns of the CDF events file (the column data is not copied)
+        evn_tbl_col_lbl_ls = [self.evn_tbl_time_col_lbl,
+                              self.evn_tbl_prim_id_col_lbl,
+                              self.evn_tbl_prim_name_col_lbl,
+                              self.evn_tbl_prim_type_col_lbl,
+                              self.evn_tbl_prim_comd_col_lbl,
+                              self.evn_tbl_prim_lvl_col_lbl,
+                              self.evn_tbl_prim_affil_col_lbl,
+                              self.evn_tbl_prim_force_col_lbl,
+                              self.evn_tbl_prim_x_col_lbl, self.evn_tbl_prim_y_col_lbl,
+                              self.evn_tbl_event_id_col_lbl,
+                              self.evn_tbl_event_type_col_lbl,
+                              self.evn_tbl_event_detail_col_lbl,
+                              self.evn_tbl_sec_id_col_lbl,
+                              self.evn_tbl_sec_name_col_lbl,
+                              self.evn_tbl_sec_type_col_lbl,
+                              self.evn_tbl_sec_comd_col_lbl,
+                              self.evn_tbl_sec_lvl_col_lbl,
+                              self.evn_tbl_sec_affil_col_lbl,
+                              self.evn_tbl_sec_force_col_lbl,
+                              self.evn_tbl_sec_x_col_lbl, self.evn_tbl_sec_y_col_lbl]
+        events_df = pd.DataFrame({col_lbl: events_df[col_lbl] for col_lbl in evn_tbl_col_lbl_ls}, copy=False)
+
+        # try to apply column types to the CDF events df
+        try:
+            self.apply_cdf_col_types(events_df, self.get_cdf_col_types_dict(self.evn_tbl_col_types_dict))
+        except ValueError as error:
+            self.logger.error(f"Unable to type cast for one or more columns in CDF events df: {str(error)}")
+
+        return events_df
+
+    def split_shard_cdf_events_rows(self) -> None:
+        """
+        Remove the CDF events rows of the entities processed by other shards from the CDF events Dataframe of a shard
+        run (shards option). These rows (location updates and losses, see reserve_shard_event_serials) are only built
+        so that the locations are attached to the CDF events rows as in a single process. The loss events rows of all
+        entities, which are needed to attach the loss event ids to the combat power rows, are kept in
+        shard_loss_events_df.
+        """
+        foreign_row_mask = self.CDF_events_df[self.evn_tbl_prim_id_col_lbl].astype(str).isin(
+            self.shard_foreign_uid_set).to_numpy()
+        loss_row_mask = (self.CDF_events_df[self.evn_tbl_event_type_col_lbl] == self.loss_event_lbl).to_numpy()
+        self.shard_loss_events_df = self.CDF_events_df.loc[loss_row_mask,
+                                                           [self.evn_tbl_time_col_lbl, self.evn_tbl_prim_id_col_lbl,
+                                                            self.evn_tbl_prim_affil_col_lbl,
+                                                            self.evn_tbl_prim_force_col_lbl,
+                                                            self.evn_tbl_event_id_col_lbl,
+                                                            self.evn_tbl_event_type_col_lbl]]
+        self.CDF_events_df = self.CDF_events_df.loc[~foreign_row_mask].reset_index(drop=True)
+        self.logger.info(f"shard {self.shard_index} of {self.shards} - {len(self.CDF_events_df)} CDF events rows of "
+                         f"the entities of the shard, {int(foreign_row_mask.sum())} rows of the entities of other "
+                         f"shards removed")
+
+    def splice_cdf_events_rows(self, drop_event_type_ls: list, update_uid_set: set) -> dict or None:
+        """
+        Splice the rebuilt CDF events rows of the entities with changed events into the CDF events from the last
+        finalise (incremental_finalise option).
+
+        The rows of the changed entities are dropped from the CDF events (and location track) of the last finalise,
+        the rows for their current events are built (see build_cdf_events_rows) and merge-inserted by time, event type
+        and entity order (see CDFfunc.get_merge_order), so the rows are in the same order as a full build without
+        sorting the CDF events. Locations are then attached only to the rows of the entities with changed events or
+        location tracks and the entity details only to the rows of the entities with changed entity table rows.
+
+        Args:
+            drop_event_type_ls: event types to drop from CDF events (see get_drop_event_type_ls)
+            update_uid_set: uids of the entities with events changed since the last finalise
+
+        Returns:
+            dictionary of the number of events dropped for each event type in drop_event_type_ls or None if the rows
+            cannot be spliced (the CDF events are then built in full)
+        """
+        cached_events_df = self.finalise_cache_dict['events_df']
+        cached_splice_dict = self.finalise_cache_dict.get('events_splice_dict')
+        cached_event_ids_dict = self.finalise_cache_dict.get('entity_event_ids_dict', {})
+        full_build_reason = None
+        if cached_splice_dict is None:
+            full_build_reason = "the entities of the CDF events rows of the last finalise were not kept"
+        elif cached_splice_dict['loc_null_xy']:
+            full_build_reason = "location update events with null x / y values"
+        elif not pd.api.types.is_float_dtype(cached_events_df[self.evn_tbl_time_col_lbl]):
+            full_build_reason = "non-numeric event times"
+        if full_build_reason is not None:
+            self.logger.debug(f"CDF events built in full - {full_build_reason}")
+            return None
+
+        uid_idx = pd.Index(self.get_uid_ls())
+        event_type_cat_ls = self.evn_tbl_event_type_order_ls
+        prim_id_col_lbl = self.evn_tbl_prim_id_col_lbl
+        sec_id_col_lbl = self.evn_tbl_sec_id_col_lbl
+
+        def get_order_keys(events_df, owner_arr):
+            # time and a sub key of event type (unrecognised types last) and entity order for each CDF events row
+            type_code_arr = pd.Categorical(events_df[self.evn_tbl_event_type_col_lbl],
+                                           categories=event_type_cat_ls).codes.astype('int64')
+            type_code_arr[type_code_arr < 0] = len(event_type_cat_ls)
+            return (events_df[self.evn_tbl_time_col_lbl].to_numpy(dtype=float),
+                    type_code_arr * (len(uid_idx) + 1) + uid_idx.get_indexer(owner_arr) + 1)
+
+        # rows of the changed entities are dropped from the CDF events and location track of the last finalise
+        cached_owner_arr = cached_splice_dict['owner_arr']
+        keep_mask = ~pd.Series(cached_owner_arr, dtype=object).isin(update_uid_set).to_numpy()
+        keep_idx_arr = np.flatnonzero(keep_mask)
+        removed_idx_arr = np.flatnonzero(~keep_mask)
+        cached_track_df = cached_splice_dict['loc_track_df']
+        if cached_track_df is not None:
+            track_keep_mask = ~pd.Series(cached_splice_dict['loc_track_owner_arr'],
+                                         dtype=object).isin(update_uid_set).to_numpy()
+            track_keep_idx_arr = np.flatnonzero(track_keep_mask)
+
+        # build the rows of the changed entities (without locations) and attach their entity details
+        update_entity_ls = [entity for entity in self.entities if entity.uid in update_uid_set]
         self.CDF_events_df = pd.DataFrame()
+        self.build_cdf_events_rows(drop_event_type_ls, entity_ls=update_entity_ls)
+        new_splice_dict = self.finalise_cache_dict['events_splice_dict']
+        new_event_ids_dict = self.finalise_cache_dict['entity_event_ids_dict']
+        new_events_df = self.CDF_events_df
+        new_events_df[self.evn_tbl_sec_x_col_lbl] = np.nan
+        new_events_df[self.evn_tbl_sec_y_col_lbl] = np.nan
+        new_events_df = self.complete_cdf_events_df(new_events_df)
+
+        # merge-insert the rebuilt rows into the kept rows
+        if len(removed_idx_arr) == 0 and len(new_events_df) == 0:
+            events_df = cached_events_df.copy(deep=False)
+            owner_arr = cached_owner_arr
+            track_df = cached_track_df
+            track_owner_arr = cached_splice_dict['loc_track_owner_arr']
+        else:
+            kept_time_arr, kept_sub_key_arr = get_order_keys(cached_events_df.iloc[keep_idx_arr],
+                                                             cached_owner_arr[keep_idx_arr])
+            try:
+                merge_order_arr = CDFfunc.get_merge_order(kept_time_arr, kept_sub_key_arr,
+                                                          *get_order_keys(new_events_df, new_splice_dict['owner_arr']))
+                if cached_track_df is not None:
+                    kept_track_owner_arr = cached_splice_dict['loc_track_owner_arr'][track_keep_idx_arr]
+                    track_merge_order_arr = CDFfunc.get_merge_order(
+                        uid_idx.get_indexer(kept_track_owner_arr), np.zeros(len(kept_track_owner_arr)),
+                        uid_idx.get_indexer(new_splice_dict['loc_track_owner_arr']),
+                        np.zeros(len(new_splice_dict['loc_track_owner_arr'])))
+            except ValueError as error:
+                self.logger.debug(f"CDF events built in full - rows cannot be spliced: {error}")
+                self.finalise_cache_dict['entity_event_ids_dict'] = cached_event_ids_dict
+                return None
+            # index of each spliced row in the cached rows followed by the rebuilt rows
+            take_idx_arr = np.concatenate([keep_idx_arr, np.arange(len(cached_events_df),
+                                                                   len(cached_events_df) + len(new_events_df))])[
+                merge_order_arr]
+            events_df = self.merge_cdf_df_rows([cached_events_df, new_events_df], take_idx_arr)
+            owner_arr = np.concatenate([cached_owner_arr, new_splice_dict['owner_arr']])[take_idx_arr]
+            track_df = None
+            track_owner_arr = None
+            if cached_track_df is not None:
+                num_new_track = len(new_splice_dict['loc_track_df'])
+                track_take_idx_arr = np.concatenate([track_keep_idx_arr, np.arange(
+                    len(cached_track_df), len(cached_track_df) + num_new_track)])[track_merge_order_arr]
+                track_df = self.merge_cdf_df_rows([cached_track_df, new_splice_dict['loc_track_df']],
+                                                  track_take_idx_arr)
+                track_owner_arr = np.concatenate([cached_splice_dict['loc_track_owner_arr'],
+                                                  new_splice_dict['loc_track_owner_arr']])[track_take_idx_arr]
+        # categorical entity detail columns have the categories of the entity table (as set for the rebuilt rows)
+        for col_lbl in self.evn_tbl_entity_detail_col_ls:
+            if isinstance(events_df[col_lbl].dtype, pd.CategoricalDtype):
+                events_df[col_lbl] = events_df[col_lbl].cat.set_categories(new_events_df[col_lbl].cat.categories)
+
+        prim_id_arr = events_df[prim_id_col_lbl].to_numpy(dtype=object)
+        sec_id_arr = events_df[sec_id_col_lbl].to_numpy(dtype=object)
+
+        def set_col_rows(col_lbl, row_idx_arr, val_arr):
+            # set the values of a column for a set of rows (the column is copied so the cached rows are not changed)
+            col_arr = events_df[col_lbl].array.copy()
+            col_arr[row_idx_arr] = np.asarray(val_arr, dtype=object) if \
+                isinstance(col_arr.dtype, pd.CategoricalDtype) else val_arr
+            events_df[col_lbl] = col_arr
+
+        # the location tracks of the primary and secondary entities of the removed and rebuilt rows may have changed,
+        # locations are attached again to the rows of these entities using the rows with the location updates of all
+        # the entities of those rows
+        track_uid_set = set(update_uid_set)
+        for id_col_lbl in [prim_id_col_lbl, sec_id_col_lbl]:
+            track_uid_set.update(cached_events_df[id_col_lbl].iloc[removed_idx_arr])
+            track_uid_set.update(new_events_df[id_col_lbl])
+            if cached_track_df is not None:
+                track_uid_set.update(cached_track_df[id_col_lbl].to_numpy(dtype=object)[~track_keep_mask])
+                track_uid_set.update(new_splice_dict['loc_track_df'][id_col_lbl])
+        track_uid_set -= {None, ''}
+        loc_row_mask = (events_df[self.evn_tbl_event_type_col_lbl] == self.loc_event_lbl).to_numpy()
+        loc_row_idx_arr = np.flatnonzero(pd.Series(prim_id_arr).isin(track_uid_set).to_numpy() |
+                                         pd.Series(sec_id_arr).isin(track_uid_set).to_numpy())
+        if len(loc_row_idx_arr) > 0:
+            row_uid_set = (set(prim_id_arr[loc_row_idx_arr]) | set(sec_id_arr[loc_row_idx_arr])) - {None, ''}
+            sub_row_mask = np.zeros(len(events_df), dtype=bool)
+            sub_row_mask[loc_row_idx_arr] = True
+            sub_row_mask |= loc_row_mask & (pd.Series(prim_id_arr).isin(row_uid_set).to_numpy() |
+                                            pd.Series(sec_id_arr).isin(row_uid_set).to_numpy())
+            sub_row_idx_arr = np.flatnonzero(sub_row_mask)
+            # the rows as they are built - no secondary id is null and x / y values only for location updates
+            sub_sec_id_arr = sec_id_arr[sub_row_idx_arr]
+            sub_sec_id_arr[sub_sec_id_arr == ''] = None
+            sub_df = pd.DataFrame({
+                self.evn_tbl_time_col_lbl: events_df[self.evn_tbl_time_col_lbl].to_numpy()[sub_row_idx_arr],
+                self.evn_tbl_event_type_col_lbl: pd.Categorical(
+                    events_df[self.evn_tbl_event_type_col_lbl].to_numpy(dtype=object)[sub_row_idx_arr],
+                    categories=event_type_cat_ls),
+                prim_id_col_lbl: prim_id_arr[sub_row_idx_arr],
+                sec_id_col_lbl: sub_sec_id_arr})
+            for col_lbl in [self.evn_tbl_prim_x_col_lbl, self.evn_tbl_prim_y_col_lbl]:
+                sub_df[col_lbl] = np.where(loc_row_mask[sub_row_idx_arr],
+                                           events_df[col_lbl].to_numpy(dtype=float)[sub_row_idx_arr], np.nan)
+            sub_track_df = None
+            if track_df is not None:
+                sub_track_df = track_df[track_df[prim_id_col_lbl].isin(row_uid_set) |
+                                        track_df[sec_id_col_lbl].isin(row_uid_set)]
+            self.attach_cdf_events_locations(loc_track_df=sub_track_df, events_df=sub_df)
+            sub_loc_row_mask = np.isin(sub_row_idx_arr, loc_row_idx_arr)
+            for col_lbl in [self.evn_tbl_prim_x_col_lbl, self.evn_tbl_prim_y_col_lbl,
+                            self.evn_tbl_sec_x_col_lbl, self.evn_tbl_sec_y_col_lbl]:
+                set_col_rows(col_lbl, loc_row_idx_arr, sub_df[col_lbl].to_numpy()[sub_loc_row_mask])
+
+        # entity details are attached again to the rows of the entities with changed entity table rows
+        detail_uid_set = self.get_changed_entity_detail_uid_set(self.finalise_cache_dict['entity_table_df'])
+        detail_row_idx_arr = np.flatnonzero(pd.Series(prim_id_arr).isin(detail_uid_set).to_numpy() |
+                                            pd.Series(sec_id_arr).isin(detail_uid_set).to_numpy())
+        if len(detail_row_idx_arr) > 0:
+            detail_df = pd.DataFrame({prim_id_col_lbl: prim_id_arr[detail_row_idx_arr],
+                                      sec_id_col_lbl: sec_id_arr[detail_row_idx_arr]})
+            self.attach_cdf_events_entity_details(detail_df)
+            evn_col_types_dict = self.get_cdf_col_types_dict(self.evn_tbl_col_types_dict)
+            try:
+                self.apply_cdf_col_types(detail_df, {col_lbl: evn_col_types_dict[col_lbl]
+                                                     for col_lbl in self.evn_tbl_entity_detail_col_ls})
+            except ValueError as error:
+                self.logger.error(f"Unable to type cast for one or more columns in CDF events df: {str(error)}")
+            for col_lbl in self.evn_tbl_entity_detail_col_ls:
+                set_col_rows(col_lbl, detail_row_idx_arr, detail_df[col_lbl].to_numpy())
+
+        self.CDF_events_df = events_df
+        # keep the event ids, the entity of each row and the dropped events of each entity for the next finalise
+        self.finalise_cache_dict['entity_event_ids_dict'] = {
+            uid: new_event_ids_dict[uid] if uid in update_uid_set else cached_event_ids_dict[uid] for uid in uid_idx}
+        entity_drop_dict = {uid: new_splice_dict['entity_drop_dict'][uid] if uid in update_uid_set else
+                            cached_splice_dict['entity_drop_dict'][uid] for uid in uid_idx
+                            if uid in new_splice_dict['entity_drop_dict'] or
+                            (uid not in update_uid_set and uid in cached_splice_dict['entity_drop_dict'])}
+        self.finalise_cache_dict['events_splice_dict'] = {'owner_arr': owner_arr, 'loc_track_df': track_df,
+                                                          'loc_track_owner_arr': track_owner_arr,
+                                                          'entity_drop_dict': entity_drop_dict,
+                                                          'loc_null_xy': new_splice_dict['loc_null_xy']}
+        drop_num_events_dict, self.dropped_events_dict = self.get_dropped_events_summary(drop_event_type_ls,
+                                                                                         entity_drop_dict)
+
+        if len(update_uid_set) == 0:
+            self.logger.info("No entity events changed since the last finalise, CDF events reused")
+        else:
+            self.logger.info(f"CDF events rows of {len(update_uid_set)} changed entities spliced into the CDF events "
+                             f"of the last finalise - {len(removed_idx_arr)} rows removed, {len(new_events_df)} "
+                             f"rows inserted")
+        self.logger.debug(f"Locations attached to {len(loc_row_idx_arr)} and entity details to "
+                          f"{len(detail_row_idx_arr)} spliced CDF events rows")
+
+        return drop_num_events_dict
+
+    def merge_cdf_df_rows(self, df_ls: list, take_idx_arr: np.ndarray) -> pd.DataFrame:
+        """
+        Return the rows of CDF Dataframes with the same columns taken in the order of take_idx_arr, one column at a
+        time. Categorical columns keep their categories if they are the same in all the Dataframes, otherwise they are
+        given the sorted categories of all the Dataframes with unused categories removed (as for a column cast to a
+        category type). A column with no values in a Dataframe is cast to the type of the column in the first
+        Dataframe with values.
+
+        Args:
+            df_ls: list of Dataframes
+            take_idx_arr: index of each row to take in the rows of the Dataframes in list order
+        """
+        merged_col_dict = {}
+        for col_lbl in df_ls[0].columns:
+            ser_ls = [cdf_df[col_lbl] for cdf_df in df_ls]
+            if all(isinstance(ser.dtype, pd.CategoricalDtype) for ser in ser_ls):
+                same_categories = all(set(ser.cat.categories) == set(ser_ls[0].cat.categories) for ser in ser_ls)
+                col_arr = pd.api.types.union_categoricals([ser.array for ser in ser_ls],
+                                                          sort_categories=not same_categories).take(take_idx_arr)
+                if not same_categories:
+                    col_arr = col_arr.remove_unused_categories()
+                merged_col_dict[col_lbl] = col_arr
+                continue
+            value_ser_ls = [ser for ser in ser_ls if not ser.isna().all()]
+            if len(value_ser_ls) > 0:
+                ser_ls = [ser.astype(value_ser_ls[0].dtype) if ser.dtype != value_ser_ls[0].dtype and ser.isna().all()
+                          else ser for ser in ser_ls]
+            merged_col_dict[col_lbl] = pd.concat(ser_ls, ignore_index=True).array.take(take_idx_arr)
+
+        return pd.DataFrame(merged_col_dict, copy=False)
+
+    def get_changed_entity_detail_uid_set(self, cached_entity_table_df: pd.DataFrame) -> set:
+        """
+        Return the set of entity ids with entity details (name, type, commander, level, affiliation and force) in the
+        CDF entity table that are not the same as in an earlier CDF entity table (incremental_finalise option)
+        Args:
+            cached_entity_table_df: CDF entity table Dataframe of the last finalise
+        """
+        ent_detail_col_ls = [self.ent_tbl_name_col_lbl, self.ent_tbl_type_col_lbl, self.ent_tbl_commander_id_col_lbl,
+                             self.ent_tbl_level_col_lbl, self.ent_tbl_affil_col_lbl, self.ent_tbl_force_col_lbl]
+        ent_detail_df_ls = [entity_table_df.drop_duplicates(subset=self.ent_tbl_id_col_lbl, keep='last').set_index(
+            self.ent_tbl_id_col_lbl)[ent_detail_col_ls].astype(object)
+            for entity_table_df in [cached_entity_table_df, self.CDF_entity_table_df]]
+        ent_id_idx = ent_detail_df_ls[0].index.append(ent_detail_df_ls[1].index).unique()
+        cached_detail_df, detail_df = [ent_detail_df.reindex(ent_id_idx) for ent_detail_df in ent_detail_df_ls]
+        same_mask = ((cached_detail_df == detail_df) | (cached_detail_df.isna() & detail_df.isna())).all(axis=1)
+
+        return set(ent_id_idx[~same_mask.to_numpy()])
+
+    def build_cdf_events_rows(self, drop_event_type_ls: list, update_uid_set: set = None,
+                              entity_ls: list = None) -> dict:
+        """
+        Build the CDF events Dataframe rows (time, primary entity id and x / y, event id, type and detail and secondary
+        entity id and x / y) from the entity event data, sorted by time and event type, and record a summary of the
+        dropped events in dropped_events_dict.
+
+        If the incremental_finalise option is set, the entity (uid) of each CDF events
+        and location track row and a summary of the dropped events of each entity are kept in finalise_cache_dict
+        (events_splice_dict) so that the rows of changed entities can be spliced on the next finalise
+        (see splice_cdf_events_rows).
+
+        Args:
+            drop_event_type_ls: event types to drop from CDF events (see get_drop_event_type_ls)
+            update_uid_set: uids of the entities with events changed since the last finalise, the event ids,
+                primary and secondary uids of all other entities are reused from the last finalise
+                (optional, default None - gather event ids for all entities)
+            entity_ls: Entity instances to build the rows for, locations are not attached to the rows
+                (see splice_cdf_events_rows) (optional, default None - all entities with locations attached)
+
+        Returns:
+            dictionary of the number of events dropped for each event type in drop_event_type_ls
+        """
+        attach_locations = entity_ls is None
+        if entity_ls is None:
+            entity_ls = self.entities
+        drop_num_events_dict = {event_type: 0 for event_type in drop_event_type_ls}
+        drop_time_ls = []
+        drop_entity_id_set = set()
+        # location track - location update data is kept for fill forward of x / y even when location events are dropped
+        loc_track_col_dict = {self.evn_tbl_time_col_lbl: [], self.evn_tbl_prim_id_col_lbl: [],
+                              self.evn_tbl_prim_x_col_lbl: [], self.evn_tbl_prim_y_col_lbl: [],
+                              self.evn_tbl_sec_id_col_lbl: []}
+
         # set up empty lists to hold the key data that will form the cdf events df
         event_time_ls = []
         event_primary_entity_ls = []
@@ -1474,64 +3201,94 @@ class DataSet:
         event_secondary_entity_ls = []
         event_id_ls = []
 
-        def extend_event_lists(ent_event_id_df, event_type,
-                               time_data_ls, detail_data_ls,
-                               primary_x_data_ls=None, primary_y_data_ls=None):
-            # this function takes data from an entity and uses it to extend the lists that will form the CDF events df
-            # copy the entity data for the selected event type
-            ent_event_type_id_df = ent_event_id_df.loc[ent_event_id_df['type'] == event_type].copy()
-            # extend the relevant CDF events lists with the data from the entity
-            event_time_ls.extend(time_data_ls)
-            event_detail_ls.extend(detail_data_ls)
-            event_type_ls.extend(ent_event_type_id_df['type'].to_list())
-            event_id_ls.extend(ent_event_type_id_df['evn_id'].to_list())
-            event_primary_entity_ls.extend(ent_event_type_id_df['prim_uid'].to_list())
-            event_secondary_entity_ls.extend(ent_event_type_id_df['sec_uid'].to_list())
-            # only location events will have x and y data so if they are provided use them to extend the CDF events primary x and y lists
-            if primary_x_data_ls:
-                event_primary_entity_x_ls.extend(primary_x_data_ls)
-            if primary_y_data_ls:
-                event_primary_entity_y_ls.extend(primary_y_data_ls)
-            # otherwise just keep appending None to the CDF events primary x and y lists until the list lengths match
-            while len(event_primary_entity_x_ls) < len(event_time_ls):
-                event_primary_entity_x_ls.append(None)
-                event_primary_entity_y_ls.append(None)
-
-        # cycle through entities and extend event lists with data from that entity
-        for entity in self.entities:
-            # add location events
-            extend_event_lists(ent_event_id_df=pd.DataFrame(data=entity.entity_event_id_dict),
-                               time_data_ls=entity.location_time, detail_data_ls=entity.location_detail,
-                               primary_x_data_ls=entity.location_x, primary_y_data_ls=entity.location_y,
-                               event_type=self.loc_event_lbl)
-            # add shot events
-            extend_event_lists(ent_event_id_df=pd.DataFrame(data=entity.entity_event_id_dict),
-                               time_data_ls=entity.shots_time, detail_data_ls=entity.shots_detail,
-                               event_type=self.shot_event_lbl)
-            # add kill events
-            extend_event_lists(ent_event_id_df=pd.DataFrame(data=entity.entity_event_id_dict),
-                               time_data_ls=entity.kills_time, detail_data_ls=entity.kills_detail,
-                               event_type=self.kill_event_lbl)
-            # add loss events
-            extend_event_lists(ent_event_id_df=pd.DataFrame(data=entity.entity_event_id_dict),
-                               time_data_ls=entity.losses_time, detail_data_ls=entity.losses_detail,
-                               event_type=self.loss_event_lbl)
-            # add spot events
-            extend_event_lists(ent_event_id_df=pd.DataFrame(data=entity.entity_event_id_dict),
-                               time_data_ls=entity.spot_time, detail_data_ls=entity.spot_detail,
-                               event_type=self.spot_event_lbl)
-            # add seen events
-            extend_event_lists(ent_event_id_df=pd.DataFrame(data=entity.entity_event_id_dict),
-                               time_data_ls=entity.seen_time, detail_data_ls=entity.seen_detail,
-                               event_type=self.seen_event_lbl)
-            # add stop events
-            extend_event_lists(ent_event_id_df=pd.DataFrame(data=entity.entity_event_id_dict),
-                               time_data_ls=entity.stop_time, detail_data_ls=entity.stop_detail,
-                               event_type=self.stop_event_lbl)
-            # add status events
-            extend_event_lists(ent_event_id_df=pd.DataFrame(data=entity.entity_event_id_dict),
-                               time_data_ls=entity.state_time, detail_data_ls=entity.state_detail,
-                               event_type=self.status_event_lbl)
+        # event ids, primary and secondary uids for each entity by event type (kept for the next finalise if the
+        # incremental_finalise option is set)
+        cached_event_ids_dict = self.finalise_cache_dict.get('entity_event_ids_dict', {}) \
+            if update_uid_set is not None else {}
+        entity_event_ids_dict = {}
+        num_reused = 0
+        # entity uids with the number of CDF events, location track and dropped event rows gathered up to the end of
+        # each entity and the dropped events of each entity (kept for the next finalise if the incremental_finalise
+        # option is set, see splice_cdf_events_rows)
+        owner_uid_ls = []
+        owner_end_ls = []
+        entity_drop_dict = {}
+
+        # event type order for the CDF events - location updates are the first type for a given time
+        event_type_cat_ls = self.evn_tbl_event_type_order_ls
+
+        # cycle through entities and extend event lists with data from that entity in a single pass
+        for entity in entity_ls:
+            if entity.uid in cached_event_ids_dict and entity.uid not in update_uid_set:
+                ent_type_ids_dict = cached_event_ids_dict[entity.uid]
+                num_reused += 1
+            else:
+                ent_type_ids_dict = self.get_entity_event_ids_dict(entity)
+            if self.incremental_finalise:
+                entity_event_ids_dict[entity.uid] = ent_type_ids_dict
+            # the events of an entity processed by another shard (location updates and losses only) are gathered for
+            # the locations and combat power but removed from the CDF events once complete and the dropped events are
+            # counted by the other shard (shards option, see split_shard_cdf_events_rows)
+            count_dropped = not self.shard_run or entity.uid not in self.shard_foreign_uid_set
+
+            # extend the CDF events lists for each event type in turn (location events first)
+            for event_type, time_data_ls, detail_data_ls, x_data_ls, y_data_ls in \
+                    self.get_entity_event_data_ls(entity):
+                type_id_ls, type_prim_uid_ls, type_sec_uid_ls = ent_type_ids_dict.get(event_type, ([], [], []))
+                if event_type in drop_num_events_dict:
+                    if count_dropped:
+                        drop_num_events_dict[event_type] += len(time_data_ls)
+                        drop_time_ls.extend(time_data_ls)
+                        if time_data_ls:
+                            drop_entity_id_set.add(entity.uid)
+                        drop_entity_id_set.update(type_sec_uid_ls)
+                    if count_dropped and self.incremental_finalise and (time_data_ls or type_sec_uid_ls):
+                        ent_drop_dict = entity_drop_dict.setdefault(entity.uid, {'num_events': {}, 'entity_ids': set()})
+                        ent_drop_dict['num_events'][event_type] = \
+                            ent_drop_dict['num_events'].get(event_type, 0) + len(time_data_ls)
+                        if time_data_ls:
+                            ent_drop_dict['entity_ids'].add(entity.uid)
+                        ent_drop_dict['entity_ids'].update(type_sec_uid_ls)
+                    if x_data_ls is not None:
+                        loc_track_col_dict[self.evn_tbl_time_col_lbl].extend(time_data_ls)
+                        loc_track_col_dict[self.evn_tbl_prim_x_col_lbl].extend(x_data_ls)
+                        loc_track_col_dict[self.evn_tbl_prim_y_col_lbl].extend(y_data_ls)
+                        loc_track_col_dict[self.evn_tbl_prim_id_col_lbl].extend(type_prim_uid_ls)
+                        loc_track_col_dict[self.evn_tbl_sec_id_col_lbl].extend(type_sec_uid_ls)
+                    continue
+                event_time_ls.extend(time_data_ls)
+                event_detail_ls.extend(detail_data_ls)
+                event_type_ls.extend([event_type] * len(type_id_ls))
+                event_id_ls.extend(type_id_ls)
+                event_primary_entity_ls.extend(type_prim_uid_ls)
+                event_secondary_entity_ls.extend(type_sec_uid_ls)
+                # only location events will have x and y data so if they are provided use them to extend the lists
+                if x_data_ls:
+                    event_primary_entity_x_ls.extend(x_data_ls)
+                if y_data_ls:
+                    event_primary_entity_y_ls.extend(y_data_ls)
+                # otherwise pad the CDF events primary x and y lists with None until the list lengths match
+                pad_len = len(event_time_ls) - len(event_primary_entity_x_ls)
+                if pad_len > 0:
+                    event_primary_entity_x_ls.extend([None] * pad_len)
+                    event_primary_entity_y_ls.extend([None] * pad_len)
+            if self.incremental_finalise:
+                owner_uid_ls.append(entity.uid)
+                owner_end_ls.append((len(event_id_ls), len(loc_track_col_dict[self.evn_tbl_time_col_lbl]),
+                                     len(drop_time_ls)))
+
+
+        if update_uid_set is not None:
+            self.logger.debug(f"Event ids reused for {num_reused} of {len(entity_ls)} entities")
+        if self.incremental_finalise:
+            self.finalise_cache_dict['entity_event_ids_dict'] = entity_event_ids_dict
+
+        # record a summary of the dropped events
+        drop_time_ser = pd.to_numeric(pd.Series(drop_time_ls, dtype=object), errors='coerce')
+        self.dropped_events_dict = {'num_events': sum(drop_num_events_dict.values()),
+                                    'first_time': drop_time_ser.min(), 'last_time': drop_time_ser.max(),
+                                    'null_time': bool(drop_time_ser.isna().any()),
+                                    'entity_ids': drop_entity_id_set}
 
         if not CDFfunc.compare_list_lengths(event_time_ls,
                                             event_primary_entity_ls,
@@ -1551,135 +3308,310 @@ class DataSet:
                               f"\n\tevent type - {len(event_type_ls)}"
                               f"\n\tevent detail - {len(event_detail_ls)}")
 
-        self.CDF_events_df = pd.DataFrame(data=zip(event_time_ls,
-                                                   event_primary_entity_ls,
-                                                   event_primary_entity_x_ls, event_primary_entity_y_ls,
-                                                   event_id_ls,
-                                                   event_type_ls,
-                                                   event_detail_ls,
-                                                   event_secondary_entity_ls),
-                                          columns=[self.evn_tbl_time_col_lbl,
-                                                   self.evn_tbl_prim_id_col_lbl,
-                                                   self.evn_tbl_prim_x_col_lbl, self.evn_tbl_prim_y_col_lbl,
-                                                   self.evn_tbl_event_id_col_lbl,
-                                                   self.evn_tbl_event_type_col_lbl,
-                                                   self.evn_tbl_event_detail_col_lbl,
-                                                   self.evn_tbl_sec_id_col_lbl])
+        # build the dataframe column by column rather than row by row (the lists are released as each column is built)
+        event_col_dict = {self.evn_tbl_time_col_lbl: event_time_ls,
+                          self.evn_tbl_prim_id_col_lbl: event_primary_entity_ls,
+                          self.evn_tbl_prim_x_col_lbl: event_primary_entity_x_ls,
+                          self.evn_tbl_prim_y_col_lbl: event_primary_entity_y_ls,
+                          self.evn_tbl_event_id_col_lbl: event_id_ls,
+                          self.evn_tbl_event_type_col_lbl: event_type_ls,
+                          self.evn_tbl_event_detail_col_lbl: event_detail_ls,
+                          self.evn_tbl_sec_id_col_lbl: event_secondary_entity_ls}
+        del event_time_ls, event_primary_entity_ls, event_primary_entity_x_ls, event_primary_entity_y_ls, \
+            event_id_ls, event_type_ls, event_detail_ls, event_secondary_entity_ls
+        # if list lengths are mismatched truncate all columns to the shortest list
+        num_events = min([len(col_ls) for col_ls in event_col_dict.values()])
+        for col_lbl, col_ls in event_col_dict.items():
+            if len(col_ls) > num_events:
+                event_col_dict[col_lbl] = col_ls[:num_events]
 
         # make the event type column categorical and set a sort order putting location updates as the first type
-        self.CDF_events_df[self.evn_tbl_event_type_col_lbl] = \
-            pd.Categorical(self.CDF_events_df[self.evn_tbl_event_type_col_lbl],
-                           [self.loc_event_lbl, self.status_event_lbl,
-                            self.spot_event_lbl, self.seen_event_lbl, self.stop_event_lbl,
-                            self.shot_event_lbl, self.kill_event_lbl, self.loss_event_lbl])
-        # order the cdf events df by time and then by event type
-        self.CDF_events_df.sort_values(by=[self.evn_tbl_time_col_lbl, self.evn_tbl_event_type_col_lbl],
-                                       inplace=True, ignore_index=True)
-
-        # fill in blanks in the primary location x / y cols by filling with the last location update values
-        # assuming that the entity remains at its last reported location for each event until the next location update
-        self.CDF_events_df[self.evn_tbl_prim_x_col_lbl] = \
-            self.CDF_events_df.groupby(by=self.evn_tbl_prim_id_col_lbl)[self.evn_tbl_prim_x_col_lbl].ffill()
-        self.CDF_events_df[self.evn_tbl_prim_y_col_lbl] = \
-            self.CDF_events_df.groupby(by=self.evn_tbl_prim_id_col_lbl)[self.evn_tbl_prim_y_col_lbl].ffill()
-
-        # attach secondary entity locations - get a df of locations by time
-        unit_locations_df = self.CDF_events_df[[self.evn_tbl_time_col_lbl, self.evn_tbl_prim_id_col_lbl,
-                                                self.evn_tbl_prim_x_col_lbl, self.evn_tbl_prim_y_col_lbl,
-                                                self.evn_tbl_event_type_col_lbl, self.evn_tbl_sec_id_col_lbl]].copy()
-
-        # mask event type is 'location update'
-        loc_event_mask = unit_locations_df[self.evn_tbl_event_type_col_lbl] == self.loc_event_lbl
-        # mask secondary entity id is blank
-        no_sec_id_mask = pd.isnull(unit_locations_df[self.evn_tbl_sec_id_col_lbl])
-
-        # where event type is location update and there is no secondary id copy the primary id to the sec id column
-        unit_locations_df.loc[loc_event_mask & no_sec_id_mask, self.evn_tbl_sec_id_col_lbl] = \
-            unit_locations_df[self.evn_tbl_prim_id_col_lbl]
-
-        # where event type is location update copy primary x / y to secondary x / y columns
-        unit_locations_df.loc[loc_event_mask, self.evn_tbl_sec_x_col_lbl] = \
-            unit_locations_df[self.evn_tbl_prim_x_col_lbl]
-        unit_locations_df.loc[loc_event_mask, self.evn_tbl_sec_y_col_lbl] = \
-            unit_locations_df[self.evn_tbl_prim_y_col_lbl]
-
-        # fill the secondary x / y columns down for each entity id
-        # i.e. assumption as for primary that the entity is still at the same position until the next location update
-        unit_locations_df[self.evn_tbl_sec_x_col_lbl] = \
-            unit_locations_df.groupby(by=self.evn_tbl_sec_id_col_lbl)[self.evn_tbl_sec_x_col_lbl].ffill()
-        unit_locations_df[self.evn_tbl_sec_y_col_lbl] = \
-            unit_locations_df.groupby(by=self.evn_tbl_sec_id_col_lbl)[self.evn_tbl_sec_y_col_lbl].ffill()
-
-        # remove the secondary x / y values for the location update events
-        unit_locations_df.loc[loc_event_mask, self.evn_tbl_sec_x_col_lbl] = None
-        unit_locations_df.loc[loc_event_mask, self.evn_tbl_sec_y_col_lbl] = None
-
-        # add the secondary x / y locations from unit_locations_df to the CDF events file
-        self.CDF_events_df[self.evn_tbl_sec_x_col_lbl] = unit_locations_df[self.evn_tbl_sec_x_col_lbl]
-        self.CDF_events_df[self.evn_tbl_sec_y_col_lbl] = unit_locations_df[self.evn_tbl_sec_y_col_lbl]
-
-        # get a dictionary with entity details keyed to unit id using the entity table
-        entity_dict = self.CDF_entity_table_df.set_index(self.ent_tbl_id_col_lbl).to_dict()
-
-        # dict for primary entity details (CDF column title - field in the entity dict to get the data from)
+        event_col_dict[self.evn_tbl_event_type_col_lbl] = \
+            pd.Categorical(event_col_dict[self.evn_tbl_event_type_col_lbl], event_type_cat_ls)
+        # order the cdf events by time and then by event type - the order is found from the two sort columns and each
+        # column is then built in that order so there is never a sorted copy of the whole dataframe
+        sort_key_df = pd.DataFrame({self.evn_tbl_time_col_lbl: event_col_dict[self.evn_tbl_time_col_lbl],
+                                    self.evn_tbl_event_type_col_lbl: event_col_dict[self.evn_tbl_event_type_col_lbl]})
+        sort_order_arr = sort_key_df.sort_values(by=[self.evn_tbl_time_col_lbl,
+                                                     self.evn_tbl_event_type_col_lbl]).index.to_numpy()
+        del sort_key_df
+        for col_lbl in event_col_dict.keys():
+            event_col_dict[col_lbl] = pd.Series(event_col_dict[col_lbl]).array.take(sort_order_arr)
+        self.CDF_events_df = pd.DataFrame(data=event_col_dict, copy=False)
+        del event_col_dict
+
+        loc_track_df = None
+        if self.loc_event_lbl in drop_num_events_dict:
+            loc_track_df = pd.DataFrame(data=loc_track_col_dict)
+            loc_track_df[self.evn_tbl_event_type_col_lbl] = \
+                pd.Categorical([self.loc_event_lbl] * len(loc_track_df), event_type_cat_ls)
+
+        if self.incremental_finalise:
+            self.finalise_cache_dict['events_splice_dict'] = self.get_events_splice_dict(
+                owner_uid_ls, owner_end_ls, sort_order_arr, loc_track_df, drop_time_ls, entity_drop_dict)
+
+        # attach primary and secondary entity locations from the location track (see attach_cdf_events_locations)
+        if attach_locations:
+            self.attach_cdf_events_locations(loc_track_df=loc_track_df)
+
+        return drop_num_events_dict
+
+    def get_events_splice_dict(self, owner_uid_ls: list, owner_end_ls: list, sort_order_arr: np.ndarray,
+                               loc_track_df: pd.DataFrame or None, drop_time_ls: list, entity_drop_dict: dict) -> dict:
+        """
+        Return the data kept from building the CDF events rows in memory for splicing the rows of changed entities on
+        the next finalise (incremental_finalise option, see splice_cdf_events_rows) - the uid of the entity of each
+        CDF events row (in CDF events order) and location track row, the location track, a summary of the dropped
+        events of each entity and whether any location update event has a null x / y value. This must be called
+        before the locations are attached to the CDF events rows.
+
+        Args:
+            owner_uid_ls: uids of the entities the rows were built for in build order
+            owner_end_ls: number of CDF events, location track and dropped event rows gathered up to the end of each
+                entity (tuple for each entity)
+            sort_order_arr: CDF events order of the gathered CDF events rows
+            loc_track_df: location track Dataframe (location updates dropped by the drop_location_events option) or
+                None if location events are not dropped
+            drop_time_ls: time of each dropped event in build order
+            entity_drop_dict: dictionary of uid - dictionary of the number of dropped events of each type (num_events)
+                and the entity ids of the dropped events (entity_ids) for each entity with dropped events (the first
+                and last time and null time of the dropped events are added in place)
+
+        Returns:
+            dictionary of the kept data (owner_arr, loc_track_df, loc_track_owner_arr, entity_drop_dict and
+            loc_null_xy)
+        """
+        owner_uid_arr = np.empty(len(owner_uid_ls), dtype=object)
+        owner_uid_arr[:] = owner_uid_ls
+        owner_num_arr = np.diff(np.array([(0, 0, 0)] + owner_end_ls, dtype='int64'), axis=0)
+        owner_arr = np.repeat(owner_uid_arr, owner_num_arr[:, 0])[:len(sort_order_arr)].take(sort_order_arr)
+
+        # first and last time and null time of the dropped events of each entity
+        drop_time_df = pd.DataFrame({'uid': np.repeat(owner_uid_arr, owner_num_arr[:, 2]),
+                                     'time': pd.to_numeric(pd.Series(drop_time_ls, dtype=object), errors='coerce')})
+        drop_time_df = drop_time_df.groupby('uid', sort=False, dropna=False)['time'].agg(['min', 'max', 'count',
+                                                                                         'size'])
+        for uid, ent_drop_dict in entity_drop_dict.items():
+            if uid in drop_time_df.index:
+                ent_drop_dict.update({'first_time': drop_time_df.at[uid, 'min'],
+                                      'last_time': drop_time_df.at[uid, 'max'],
+                                      'null_time': bool(drop_time_df.at[uid, 'count'] < drop_time_df.at[uid, 'size'])})
+            else:
+                ent_drop_dict.update({'first_time': np.nan, 'last_time': np.nan, 'null_time': False})
+
+        loc_event_mask = (self.CDF_events_df[self.evn_tbl_event_type_col_lbl] == self.loc_event_lbl).to_numpy()
+        loc_xy_df = self.CDF_events_df.loc[loc_event_mask, [self.evn_tbl_prim_x_col_lbl, self.evn_tbl_prim_y_col_lbl]]
+
+        return {'owner_arr': owner_arr, 'loc_track_df': loc_track_df,
+                'loc_track_owner_arr': np.repeat(owner_uid_arr, owner_num_arr[:, 1]) if loc_track_df is not None
+                else None,
+                'entity_drop_dict': entity_drop_dict, 'loc_null_xy': bool(loc_xy_df.isna().to_numpy().any())}
+
+    @staticmethod
+    def get_dropped_events_summary(drop_event_type_ls: list, entity_drop_dict: dict) -> tuple:
+        """
+        Return the number of events dropped for each event type and a summary of the dropped events (as kept in
+        dropped_events_dict) from the dropped events of each entity (see get_events_splice_dict)
+        Args:
+            drop_event_type_ls: event types dropped from CDF events (see get_drop_event_type_ls)
+            entity_drop_dict: dictionary of uid - dictionary of the dropped events of the entity
+        """
+        drop_num_events_dict = {event_type: 0 for event_type in drop_event_type_ls}
+        drop_entity_id_set = set()
+        for ent_drop_dict in entity_drop_dict.values():
+            for event_type, num_events in ent_drop_dict['num_events'].items():
+                drop_num_events_dict[event_type] += num_events
+            drop_entity_id_set.update(ent_drop_dict['entity_ids'])
+        first_time_ser = pd.Series([ent_drop_dict['first_time'] for ent_drop_dict in entity_drop_dict.values()],
+                                   dtype=float)
+        last_time_ser = pd.Series([ent_drop_dict['last_time'] for ent_drop_dict in entity_drop_dict.values()],
+                                  dtype=float)
+        dropped_events_dict = {'num_events': sum(drop_num_events_dict.values()),
+                               'first_time': first_time_ser.min(), 'last_time': last_time_ser.max(),
+                               'null_time': any(ent_drop_dict['null_time']
+                                                for ent_drop_dict in entity_drop_dict.values()),
+                               'entity_ids': drop_entity_id_set}
+
+        return drop_num_events_dict, dropped_events_dict
+
+    def get_entity_event_ids_dict(self, entity: Entity) -> dict:
+        """
+        Return the event ids, primary uids and secondary uids of an Entity instance's events grouped by event type
+        (in the order the events were added) as a dict of event type - tuple of (event id list, primary uid list,
+        secondary uid list)
+        Args:
+            entity: the Entity instance to return the event ids for
+        """
+        ent_event_id_dict = entity.entity_event_id_dict
+        # bucket the positions of the entity's event id entries by event type (one pass over the event id dict)
+        ent_type_idx_dict = {}
+        for idx, event_type in enumerate(ent_event_id_dict['type']):
+            ent_type_idx_dict.setdefault(event_type, []).append(idx)
+
+        return {event_type: ([ent_event_id_dict['evn_id'][idx] for idx in type_idx_ls],
+                             [ent_event_id_dict['prim_uid'][idx] for idx in type_idx_ls],
+                             [ent_event_id_dict['sec_uid'][idx] for idx in type_idx_ls])
+                for event_type, type_idx_ls in ent_type_idx_dict.items()}
+
+    def attach_cdf_events_locations(self, loc_track_df: pd.DataFrame = None, events_df: pd.DataFrame = None) -> None:
+        """
+        Fill the primary and secondary x / y columns of the CDF events Dataframe using the location track.
+
+        The location track is the set of location update events for each entity in CDF events order. Each event is
+        given the last reported location of its primary and secondary entities at or before that event, i.e. the
+        assumption is that an entity remains at its last reported location until its next location update. Location
+        update events keep their own primary x / y values and are not given secondary x / y values.
+        This function must only be called once the CDF events Dataframe has been sorted by time and event type.
+
+        Args:
+            loc_track_df: Dataframe of location update events that are not in the CDF events Dataframe (i.e. dropped
+                by the drop_location_events option) with time, primary id, primary x / y, secondary id and
+                (categorical) event type columns. These are merged into the track in CDF events order but are not
+                added to the CDF events Dataframe (optional, default None).
+            events_df: CDF events rows to fill in place (optional, default None - the CDF events Dataframe)
+        """
+        if events_df is None:
+            events_df = self.CDF_events_df
+        track_col_lbl_ls = [self.evn_tbl_time_col_lbl, self.evn_tbl_event_type_col_lbl,
+                            self.evn_tbl_prim_id_col_lbl, self.evn_tbl_sec_id_col_lbl,
+                            self.evn_tbl_prim_x_col_lbl, self.evn_tbl_prim_y_col_lbl]
+        if loc_track_df is not None and not loc_track_df.empty:
+            # merge the extra location updates with the CDF events (same sort as the CDF events df, location
+            # updates are always first for a given time so the CDF events keep their relative order)
+            # all-NA columns (i.e. no secondary ids for the location updates) are first cast to the type of the other
+            # Dataframe's column so the concat does not rely on pandas leaving them out when setting the column types
+            loc_track_df = loc_track_df[track_col_lbl_ls]
+            cdf_track_df = events_df[track_col_lbl_ls]
+            for col_lbl in track_col_lbl_ls:
+                if loc_track_df[col_lbl].dtype == cdf_track_df[col_lbl].dtype:
+                    continue
+                if loc_track_df[col_lbl].isna().all():
+                    loc_track_df = loc_track_df.assign(**{col_lbl: loc_track_df[col_lbl].astype(
+                        cdf_track_df[col_lbl].dtype)})
+                elif cdf_track_df[col_lbl].isna().all():
+                    cdf_track_df = cdf_track_df.assign(**{col_lbl: cdf_track_df[col_lbl].astype(
+                        loc_track_df[col_lbl].dtype)})
+            track_df = pd.concat([loc_track_df.assign(cdf_event=False), cdf_track_df.assign(cdf_event=True)],
+                                 ignore_index=True)
+            track_df.sort_values(by=[self.evn_tbl_time_col_lbl, self.evn_tbl_event_type_col_lbl],
+                                 inplace=True, ignore_index=True)
+            cdf_event_mask = track_df['cdf_event'].to_numpy()
+        else:
+            track_df = events_df
+            cdf_event_mask = slice(None)
+
+        num_events = len(track_df)
+        # the position of each event in the sorted track df is used as the sequence value for track lookups
+        event_pos_arr = np.arange(num_events)
+        loc_event_mask = (track_df[self.evn_tbl_event_type_col_lbl] == self.loc_event_lbl).to_numpy()
+        prim_id_arr = track_df[self.evn_tbl_prim_id_col_lbl].to_numpy()
+        sec_id_arr = track_df[self.evn_tbl_sec_id_col_lbl].to_numpy()
+        no_sec_id_mask = pd.isnull(sec_id_arr)
+
+        # location updates are tracked against the secondary id if there is one, otherwise the primary id
+        loc_track_key_arr = np.where(no_sec_id_mask, prim_id_arr, sec_id_arr)[loc_event_mask]
+        loc_track_pos_arr = event_pos_arr[loc_event_mask]
+        # secondary locations are only attached to events other than location updates that have a secondary entity
+        sec_query_mask = ~loc_event_mask & ~no_sec_id_mask
+
+        def get_track_vals(track_val_arr, track_idx_arr):
+            # return the track value for each track index with null values where there is no track item (-1)
+            if track_val_arr.dtype == object:
+                return_arr = np.full(len(track_idx_arr), np.nan, dtype=object)
+            else:
+                return_arr = np.full(len(track_idx_arr), np.nan)
+            found_mask = track_idx_arr >= 0
+            return_arr[found_mask] = track_val_arr[track_idx_arr[found_mask]]
+            return return_arr
+
+        for prim_col_lbl, sec_col_lbl in ((self.evn_tbl_prim_x_col_lbl, self.evn_tbl_sec_x_col_lbl),
+                                          (self.evn_tbl_prim_y_col_lbl, self.evn_tbl_sec_y_col_lbl)):
+            # primary - last non-null value for the primary entity up to and including each event
+            prim_val_arr = track_df[prim_col_lbl].to_numpy()
+            track_mask = pd.notnull(prim_val_arr)
+            track_idx_arr = CDFfunc.get_last_track_idx(track_keys=prim_id_arr[track_mask],
+                                                       track_seqs=event_pos_arr[track_mask],
+                                                       query_keys=prim_id_arr, query_seqs=event_pos_arr)
+            prim_val_arr = get_track_vals(prim_val_arr[track_mask], track_idx_arr)
+
+            # secondary - last non-null location update value for the secondary entity before each event
+            loc_val_arr = prim_val_arr[loc_event_mask]
+            track_mask = pd.notnull(loc_val_arr)
+            track_idx_arr = CDFfunc.get_last_track_idx(track_keys=loc_track_key_arr[track_mask],
+                                                       track_seqs=loc_track_pos_arr[track_mask],
+                                                       query_keys=sec_id_arr[sec_query_mask],
+                                                       query_seqs=event_pos_arr[sec_query_mask])
+            sec_val_arr = np.full(num_events, np.nan, dtype=prim_val_arr.dtype)
+            sec_val_arr[sec_query_mask] = get_track_vals(loc_val_arr[track_mask], track_idx_arr)
+
+            events_df[prim_col_lbl] = prim_val_arr[cdf_event_mask]
+            events_df[sec_col_lbl] = sec_val_arr[cdf_event_mask]
+
+    def attach_cdf_events_entity_details(self, events_df: pd.DataFrame = None) -> None:
+        """
+        Add the primary and secondary entity detail columns (name, type, commander, level, affiliation and force) to
+        the CDF events Dataframe from the CDF entity table.
+
+        The primary and secondary entity ids are each integer coded against the entity table once and the codes are
+        used to take the values for all the detail columns. Where a uid appears more than once in the entity table
+        the last entry is used. Events with an unrecognised entity id get null values, which are then replaced with
+        blank strings for the secondary entity id and (non-numeric) secondary detail columns. If memory_optimised_dtypes
+        is set the categorical detail columns are built directly from the codes.
+
+        Args:
+            events_df: CDF events rows to add the columns to in place (optional, default None - the CDF events
+                Dataframe)
+        """
+        if events_df is None:
+            events_df = self.CDF_events_df
+        # dicts for primary and secondary entity details (CDF column title - entity table column to get the data from)
         cdf_primary_entity_cols_dict = dict({self.evn_tbl_prim_name_col_lbl: self.ent_tbl_name_col_lbl,
                                              self.evn_tbl_prim_type_col_lbl: self.ent_tbl_type_col_lbl,
                                              self.evn_tbl_prim_comd_col_lbl: self.ent_tbl_commander_id_col_lbl,
                                              self.evn_tbl_prim_lvl_col_lbl: self.ent_tbl_level_col_lbl,
                                              self.evn_tbl_prim_affil_col_lbl: self.ent_tbl_affil_col_lbl,
                                              self.evn_tbl_prim_force_col_lbl: self.ent_tbl_force_col_lbl})
-        # iterate the dictionary to add the columns to the CDF events dataframe
-        for col in cdf_primary_entity_cols_dict.items():
-            self.CDF_events_df[col[0]] = self.CDF_events_df[self.evn_tbl_prim_id_col_lbl].map(entity_dict[col[1]])
-
-        # dict for secondary entity details (CDF column title - field in entity dict to get data from)
         cdf_secondary_entity_cols_dict = dict({self.evn_tbl_sec_name_col_lbl: self.ent_tbl_name_col_lbl,
                                                self.evn_tbl_sec_type_col_lbl: self.ent_tbl_type_col_lbl,
                                                self.evn_tbl_sec_comd_col_lbl: self.ent_tbl_commander_id_col_lbl,
                                                self.evn_tbl_sec_lvl_col_lbl: self.ent_tbl_level_col_lbl,
                                                self.evn_tbl_sec_affil_col_lbl: self.ent_tbl_affil_col_lbl,
                                                self.evn_tbl_sec_force_col_lbl: self.ent_tbl_force_col_lbl})
-        # iterate the dictionary to add the columns to the CDF events dataframe
-        for col in cdf_secondary_entity_cols_dict.items():
-            self.CDF_events_df[col[0]] = self.CDF_events_df[self.evn_tbl_sec_id_col_lbl].map(entity_dict[col[1]])
+
+        evn_col_types_dict = self.get_cdf_col_types_dict(self.evn_tbl_col_types_dict)
+
+        # get the integer code (row in the de-duplicated entity table) for each primary and secondary entity id
+        entity_table_df = self.CDF_entity_table_df.drop_duplicates(subset=self.ent_tbl_id_col_lbl, keep='last')
+        entity_id_idx = pd.Index(entity_table_df[self.ent_tbl_id_col_lbl])
+        prim_code_arr = entity_id_idx.get_indexer(events_df[self.evn_tbl_prim_id_col_lbl])
+        sec_code_arr = entity_id_idx.get_indexer(events_df[self.evn_tbl_sec_id_col_lbl])
+
+        # take the entity details for each event using the codes (code -1 gives a null value)
+        for code_arr, cols_dict in ((prim_code_arr, cdf_primary_entity_cols_dict),
+                                    (sec_code_arr, cdf_secondary_entity_cols_dict)):
+            for evn_col_lbl, ent_col_lbl in cols_dict.items():
+                if evn_col_types_dict[evn_col_lbl] == 'category':
+                    ent_val_code_arr, ent_val_idx = pd.factorize(entity_table_df[ent_col_lbl].to_numpy())
+                    events_df[evn_col_lbl] = pd.Categorical.from_codes(
+                        pd.api.extensions.take(ent_val_code_arr, code_arr, allow_fill=True, fill_value=-1),
+                        categories=ent_val_idx)
+                else:
+                    events_df[evn_col_lbl] = pd.api.extensions.take(entity_table_df[ent_col_lbl].to_numpy(),
+                                                                    code_arr, allow_fill=True)
 
         # replace any None values in secondary entity ID column and mapped columns with blank strings
         replace_none_vals_col_ls = [self.evn_tbl_sec_id_col_lbl,
                                     self.evn_tbl_sec_name_col_lbl, self.evn_tbl_sec_type_col_lbl,
                                     self.evn_tbl_sec_comd_col_lbl,
                                     self.evn_tbl_sec_affil_col_lbl, self.evn_tbl_sec_force_col_lbl]
-        for column in replace_none_vals_col_ls:
-            self.CDF_events_df[column].fillna(value='', inplace=True)
-
-        # rearrange columns of the CDF events file
-        self.CDF_events_df = self.CDF_events_df[[self.evn_tbl_time_col_lbl,
-                                                 self.evn_tbl_prim_id_col_lbl,
-                                                 self.evn_tbl_prim_name_col_lbl,
-                                                 self.evn_tbl_prim_type_col_lbl,
-                                                 self.evn_tbl_prim_comd_col_lbl,
-                                                 self.evn_tbl_prim_lvl_col_lbl,
-                                                 self.evn_tbl_prim_affil_col_lbl,
-                                                 self.evn_tbl_prim_force_col_lbl,
-                                                 self.evn_tbl_prim_x_col_lbl, self.evn_tbl_prim_y_col_lbl,
-                                                 self.evn_tbl_event_id_col_lbl,
-                                                 self.evn_tbl_event_type_col_lbl,
-                                                 self.evn_tbl_event_detail_col_lbl,
-                                                 self.evn_tbl_sec_id_col_lbl,
-                                                 self.evn_tbl_sec_name_col_lbl,
-                                                 self.evn_tbl_sec_type_col_lbl,
-                                                 self.evn_tbl_sec_comd_col_lbl,
-                                                 self.evn_tbl_sec_lvl_col_lbl,
-                                                 self.evn_tbl_sec_affil_col_lbl,
-                                                 self.evn_tbl_sec_force_col_lbl,
-                                                 self.evn_tbl_sec_x_col_lbl, self.evn_tbl_sec_y_col_lbl]]
-
-        # try to apply column types to the CDF events df
-        try:
-            self.CDF_events_df = self.CDF_events_df.astype(dtype=self.evn_tbl_col_types_dict)
-        except ValueError as error:
-            self.logger.error(f"Unable to type cast for one or more columns in CDF events df: {str(error)}")
-
-    def check_cdf_events_df(self) -> None:
+        for col_lbl in replace_none_vals_col_ls:
+            col_ser = events_df[col_lbl]
+            if isinstance(col_ser.dtype, pd.CategoricalDtype) and '' not in col_ser.cat.categories:
+                col_ser = col_ser.cat.add_categories('')
+            events_df[col_lbl] = col_ser.fillna(value='')
+
+    def check_cdf_events_df(self, sample_step: int = 1, entity_checks: bool = True,
+                            check_uid_set: set = None) -> float:
         """
         Check CDF event Dataframe.
 
@@ -1688,45 +3620,92 @@ class DataSet:
         Check for negative event times (add Dataset error).
         Check for entities suffering more loss events than they have components (add Dataset error)
         Check for entities not involved in any events (i.e. as primary or secondary) (add Dataset warning).
+        Check for event detail with no key or no value (add Dataset warning).
+
+        Args:
+            sample_step: run the row checks (secondary uids, times and event detail) on every nth event only
+                (deterministic sample) and log an estimate of the row issues in the full CDF events Dataframe. Entity
+                checks always use all events (optional, default 1 - check all events).
+            entity_checks: run the entity checks (loss events and entity involvement) (optional, default True)
+            check_uid_set: run the row checks on events with a primary or secondary entity uid in the set and the
+                entity checks on entities in the set only (optional, default None - check all events and entities)
+
+        A shard run (shards option) runs the entity checks on its own entities only, their involvement as the secondary
+        entity of the events of other shards is taken from shard_secondary_uid_set.
+
+        Returns:
+            Time (seconds) spent on the row checks
         """
         self.logger.info("Checking CDF events file")
         cdf_events_file_issue_count = 0
-        event_id_ls = self.CDF_events_df[self.evn_tbl_event_id_col_lbl].to_list()
-        event_time_ls = self.CDF_events_df[self.evn_tbl_time_col_lbl].to_list()
-        primary_entity_id_ls = self.CDF_events_df[self.evn_tbl_prim_id_col_lbl].to_list()
-        secondary_ent_id_ls = self.CDF_events_df[self.evn_tbl_sec_id_col_lbl].to_list()
-        known_ent_id_ls = self.CDF_entity_table_df[self.ent_tbl_id_col_lbl].to_list()
+        row_issue_count = 0
+        primary_entity_id_ser = self.CDF_events_df[self.evn_tbl_prim_id_col_lbl]
+        secondary_ent_id_ser = self.CDF_events_df[self.evn_tbl_sec_id_col_lbl]
+        known_ent_id_set = set(self.CDF_entity_table_df[self.ent_tbl_id_col_lbl].to_list())
+
+        # entities and events to check
+        check_entity_ls = self.entities
+        if self.shard_run:
+            check_entity_ls = [entity for entity in self.entities if entity.uid not in self.shard_foreign_uid_set]
+        check_events_df = self.CDF_events_df
+        if check_uid_set is not None:
+            check_entity_ls = [entity for entity in check_entity_ls if entity.uid in check_uid_set]
+            check_events_df = self.CDF_events_df.loc[primary_entity_id_ser.isin(check_uid_set) |
+                                                     secondary_ent_id_ser.isin(check_uid_set)]
+            self.logger.info(f"CDF events check - checks run on {len(check_events_df)} events and "
+                             f"{len(check_entity_ls)} entities changed since the last finalise")
+
+        # sample of events for the row checks
+        row_check_start_time = perf_counter()
+        sample_events_df = check_events_df if sample_step <= 1 else check_events_df.iloc[::sample_step]
+        sample_event_id_ser = sample_events_df[self.evn_tbl_event_id_col_lbl]
+        sample_event_time_ser = sample_events_df[self.evn_tbl_time_col_lbl]
+        sample_sec_ent_id_ser = sample_events_df[self.evn_tbl_sec_id_col_lbl]
 
         # check for unknown secondary entity ids
-        for idx, ent_id in enumerate(secondary_ent_id_ls):
-            if ent_id != "" and ent_id != "no secondary entity" and ent_id is not None:
-                if ent_id not in known_ent_id_ls:
-                    self.logger.warning(f"CDF events check - unrecognised secondary entity id {ent_id} "
-                                        f"for event {event_id_ls[idx]}")
-                    cdf_events_file_issue_count += 1
+        unknown_sec_id_mask = ~sample_sec_ent_id_ser.isin(["", "no secondary entity"]) & \
+            sample_sec_ent_id_ser.notna() & ~sample_sec_ent_id_ser.isin(known_ent_id_set)
+        for ent_id, event_id in zip(sample_sec_ent_id_ser[unknown_sec_id_mask].to_list(),
+                                    sample_event_id_ser[unknown_sec_id_mask].to_list()):
+            self.logger.warning(f"CDF events check - unrecognised secondary entity id {ent_id} "
+                                f"for event {event_id}")
+            row_issue_count += 1
 
         # check for any negative event times and check for any non-numeric event time values
-        for idx, event_time in enumerate(event_time_ls):
-            try:
-                if event_time < 0:
-                    self.logger.error(f"CDF events check - Negative time value of {event_time} "
-                                      f"for event {event_id_ls[idx]}")
-                    cdf_events_file_issue_count += 1
-            except TypeError:
-                self.logger.error(f"CDF events check - Non-numeric time value {event_time} "
-                                  f"for event {event_id_ls[idx]}")
-                cdf_events_file_issue_count += 1
+        if pd.api.types.is_numeric_dtype(sample_event_time_ser) and \
+                not pd.api.types.is_bool_dtype(sample_event_time_ser):
+            negative_time_mask = sample_event_time_ser < 0
+            for event_time, event_id in zip(sample_event_time_ser[negative_time_mask].to_list(),
+                                            sample_event_id_ser[negative_time_mask].to_list()):
+                self.logger.error(f"CDF events check - Negative time value of {event_time} "
+                                  f"for event {event_id}")
+                row_issue_count += 1
+        else:
+            # time column could not be cast to a numeric type - check each value
+            for event_time, event_id in zip(sample_event_time_ser.to_list(), sample_event_id_ser.to_list()):
+                try:
+                    if event_time < 0:
+                        self.logger.error(f"CDF events check - Negative time value of {event_time} "
+                                          f"for event {event_id}")
+                        row_issue_count += 1
+                except TypeError:
+                    self.logger.error(f"CDF events check - Non-numeric time value {event_time} "
+                                      f"for event {event_id}")
+                    row_issue_count += 1
+        row_check_time = perf_counter() - row_check_start_time
 
         # check for any entities that have suffered more loss events than they have components
-        for entity in self.entities:
-            loss_evnts_mask = (self.CDF_events_df[self.evn_tbl_prim_id_col_lbl] == entity.uid) & \
-                              (self.CDF_events_df[self.evn_tbl_event_type_col_lbl] == self.loss_event_lbl)
-            loss_evnts_ls = list(self.CDF_events_df.loc[loss_evnts_mask, self.evn_tbl_event_id_col_lbl])
-            num_loss_evnts = len(loss_evnts_ls)
+        loss_evnts_mask = self.CDF_events_df[self.evn_tbl_event_type_col_lbl] == self.loss_event_lbl
+        loss_evnts_prim_id_ser = primary_entity_id_ser[loss_evnts_mask]
+        num_loss_evnts_dict = loss_evnts_prim_id_ser.value_counts(sort=False).to_dict() if entity_checks else {}
+        for entity in check_entity_ls if entity_checks else []:
+            num_loss_evnts = num_loss_evnts_dict.get(entity.uid, 0)
             num_comps = entity.init_comps
 
             if num_comps > 0:
                 if num_loss_evnts > num_comps:
+                    loss_evnts_ls = self.CDF_events_df.loc[loss_evnts_mask, self.evn_tbl_event_id_col_lbl][
+                        loss_evnts_prim_id_ser == entity.uid].to_list()
                     self.logger.error(f"CDF events check - Entity {entity.uid} suffered {num_loss_evnts} loss events"
                                       f" but only had {num_comps} components")
                     self.logger.debug(f"loss events for entity {entity.uid} - {loss_evnts_ls}")
@@ -1736,103 +3715,156 @@ class DataSet:
                                   f"Init comps vs. loss events check skipped for entity {entity.uid} (0 initial comps)")
 
         # check for entities not involved in any events
-        for entity in self.entities:
-            if entity.uid not in primary_entity_id_ls and entity.uid not in secondary_ent_id_ls:
+        event_ent_id_set = set(primary_entity_id_ser.to_list()) | set(secondary_ent_id_ser.to_list()) | \
+            self.dropped_events_dict.get('entity_ids', set()) | self.shard_secondary_uid_set if entity_checks else set()
+        for entity in check_entity_ls if entity_checks else []:
+            if entity.uid not in event_ent_id_set:
                 self.logger.warning(f"CDF events check - Entity {entity.uid} not involved in any events")
                 cdf_events_file_issue_count += 1
 
         # check for no_key or no_val in event detail fields
-        for idx, event_detail_str in enumerate(self.CDF_events_df[self.evn_tbl_event_detail_col_lbl].to_list()):
-            if 'no_key' in event_detail_str:
-                self.logger.warning(f"event {event_id_ls[idx]} at time {event_time_ls[idx]} "
-                                    f"had a detail value with no key")
-                cdf_events_file_issue_count += 1
-            if 'no_val' in event_detail_str:
-                self.logger.warning(f"event {event_id_ls[idx]} at time {event_time_ls[idx]} "
-                                    f"had a detail key with no value")
-                cdf_events_file_issue_count += 1
+        row_check_start_time = perf_counter()
+        event_detail_ser = sample_events_df[self.evn_tbl_event_detail_col_lbl].astype(str)
+        no_key_mask = event_detail_ser.str.contains('no_key', regex=False)
+        no_val_mask = event_detail_ser.str.contains('no_val', regex=False)
+        no_key_or_val_mask = no_key_mask | no_val_mask
+        for event_id, event_time, no_key, no_val in zip(sample_event_id_ser[no_key_or_val_mask].to_list(),
+                                                        sample_event_time_ser[no_key_or_val_mask].to_list(),
+                                                        no_key_mask[no_key_or_val_mask].to_list(),
+                                                        no_val_mask[no_key_or_val_mask].to_list()):
+            if no_key:
+                self.logger.warning(f"event {event_id} at time {event_time} had a detail value with no key")
+                row_issue_count += 1
+            if no_val:
+                self.logger.warning(f"event {event_id} at time {event_time} had a detail key with no value")
+                row_issue_count += 1
+        row_check_time += perf_counter() - row_check_start_time
 
         # add code for additional checks
 
+        cdf_events_file_issue_count += row_issue_count
+        if sample_step > 1:
+            self.logger.info(f"CDF events check - row checks run on {len(sample_events_df)} of "
+                             f"{len(check_events_df)} events (1 in {sample_step}), estimated "
+                             f"{row_issue_count * sample_step} row issues in full CDF events file")
+
         if cdf_events_file_issue_count == 0:
             self.logger.info("No issues found in CDF events file")
         else:
             self.logger.warning(f"{cdf_events_file_issue_count} potential issues found in CDF events file")
 
-    def generate_cdf_cbt_pwr_df(self) -> None:
+        return row_check_time
+
+    def generate_cdf_cbt_pwr_df(self, update_item_set: set = None) -> None:
         """
         Generate CDF combat power output as a Dataframe.
+
+        Args:
+            update_item_set: affiliations and forces affected by changes since the last finalise, the combat power rows
+                for all other affiliations and forces are reused from the last finalise (incremental_finalise option).
+                All rows are generated if any add or loss rows are at or before time 0 as the loss event ids are then
+                not attached independently for each affiliation and force (optional, default None - generate all
+                rows)
+
+        A shard run (shards option) keeps the rows of its own affiliations and forces only (see get_shard_item_set).
         """
         self.logger.info("Generating CDF combat power file")
         # reset the dataframe
         self.CDF_combat_power_DF = pd.DataFrame()
-
-        # initialise lists to hold the data - need to get the time, affiliation / force affected and the cbt pwr loss
-        loss_time = []
-        loss_item = []
-        loss_comps = []
-        loss_pwr = []
-
-        # identify the affiliations and forces from the entity table and make lists to hold starting comps / pwr
-        affiliations = CDFfunc.get_unique_list(self.CDF_entity_table_df[self.ent_tbl_affil_col_lbl].tolist())
-        affiliations_start_comps = [0] * len(affiliations)
-        affiliations_start_pwr = [0] * len(affiliations)
-        forces = CDFfunc.get_unique_list(self.CDF_entity_table_df[self.ent_tbl_force_col_lbl].tolist())
-        forces_start_comps = [0] * len(forces)
-        forces_start_pwr = [0] * len(forces)
-
-        # go through each entity and add its starting power and comps to the appropriate list
-        for entity in self.entities:
-            for idx, affiliation in enumerate(affiliations):
-                if str(entity.affiliation) == str(affiliation):
-                    affiliations_start_comps[idx] = affiliations_start_comps[idx] + entity.init_comps
-                    affiliations_start_pwr[idx] = affiliations_start_pwr[idx] + (
-                            entity.init_comps * entity.cbt_per_comp)
-
-            for idx, force in enumerate(forces):
-                if str(entity.force) == str(force):
-                    forces_start_comps[idx] = forces_start_comps[idx] + entity.init_comps
-                    forces_start_pwr[idx] = forces_start_pwr[idx] + (entity.init_comps * entity.cbt_per_comp)
-
-        # add the starting comps and power to the lists
-        for idx, affiliation in enumerate(affiliations):
-            loss_time.append(0)
-            loss_item.append(affiliation)
-            loss_comps.append(affiliations_start_comps[idx])
-            loss_pwr.append(affiliations_start_pwr[idx])
-
-        for idx, force in enumerate(forces):
-            loss_time.append(0)
-            loss_item.append(force)
-            loss_comps.append(forces_start_comps[idx])
-            loss_pwr.append(forces_start_pwr[idx])
-
-        # go through each entity and get the loss events and the affiliation / force affected
-        for entity in self.entities:
-            for time in entity.losses_time:
-                if entity.init_comps > 0:
-                    loss_time.append(time)
-                    loss_item.append(str(entity.affiliation))
-                    loss_comps.append(-1)
-                    loss_pwr.append(-entity.cbt_per_comp)
-
-                    loss_time.append(time)
-                    loss_item.append(str(entity.force))
-                    loss_comps.append(-1)
-                    loss_pwr.append(-entity.cbt_per_comp)
-                else:
-                    self.logger.debug(f"Loss event for entity {entity.uid} at time {time} ignored in generation"
-                                      f" of cbt_pwr file as entity had {entity.init_comps} initial components")
+        cached_cbt_pwr_df = self.finalise_cache_dict.get('cbt_pwr_df') if update_item_set is not None else None
+
+        ent_tbl_df = self.CDF_entity_table_df
+        affil_ser = ent_tbl_df[self.ent_tbl_affil_col_lbl].astype(str)
+        force_ser = ent_tbl_df[self.ent_tbl_force_col_lbl].astype(str)
+        init_comps_arr = ent_tbl_df[self.ent_tbl_init_comp_col_lbl].to_numpy()
+        cbt_per_comp_arr = ent_tbl_df[self.ent_tbl_cbt_per_comp_col_lbl].to_numpy()
+        init_pwr_arr = ent_tbl_df[self.ent_tbl_init_cbt_pwr_col_lbl].to_numpy()
+        shard_item_set = self.get_shard_item_set(set(affil_ser) | set(force_ser)) if self.shard_run else None
+
+        # entities not present at the start (with an add time after 0) enter the timeline at their add time (start
+        # entity values that are not bool, i.e. if the column could not be type cast, are parsed as config bools)
+        add_time_arr = pd.to_numeric(ent_tbl_df[self.ent_tbl_add_time_col_lbl], errors='coerce').to_numpy()
+        start_entity_ser = ent_tbl_df[self.ent_tbl_start_entity_col_lbl]
+        if not pd.api.types.is_bool_dtype(start_entity_ser):
+            start_entity_ser = start_entity_ser.map(lambda val: bool(val) if isinstance(val, (bool, np.bool_))
+                                                    else CDFfunc.parse_config_bool(val))
+        late_entity_mask = ~start_entity_ser.to_numpy(dtype=bool) & (add_time_arr > 0)
+
+        # starting comps and power for each affiliation and force (all items get a starting row, even if 0)
+        start_df = pd.DataFrame({'comp loss': np.where(late_entity_mask, 0, init_comps_arr),
+                                 'pwr loss': np.where(late_entity_mask, 0, init_pwr_arr)})
+        start_df_ls = []
+        for item_ser in (affil_ser, force_ser):
+            item_start_df = start_df.groupby(item_ser.to_numpy(), sort=False).sum()
+            start_df_ls.append(pd.DataFrame({self.cbt_tbl_time_col_lbl: 0.0,
+                                             self.cbt_tbl_item_col_lbl: item_start_df.index.to_numpy(),
+                                             'comp loss': item_start_df['comp loss'].to_numpy(),
+                                             'pwr loss': item_start_df['pwr loss'].to_numpy(),
+                                             self.cbt_tbl_add_event_lbl: False}))
+
+        # rows adding the comps and power of late entities (with components) to their affiliation and force
+        late_entity_mask = late_entity_mask & (init_comps_arr > 0)
+        add_df_ls = []
+        for item_ser in (affil_ser, force_ser):
+            add_df_ls.append(pd.DataFrame({self.cbt_tbl_time_col_lbl: add_time_arr[late_entity_mask],
+                                           self.cbt_tbl_item_col_lbl: item_ser.to_numpy()[late_entity_mask],
+                                           'comp loss': init_comps_arr[late_entity_mask],
+                                           'pwr loss': init_pwr_arr[late_entity_mask],
+                                           self.cbt_tbl_add_event_lbl: True}))
+
+        # loss times of each entity aligned to the entity table rows by entity id (no losses for an entity table row
+        # without an entity)
+        ent_id_arr = ent_tbl_df[self.ent_tbl_id_col_lbl].astype(str).to_numpy()
+        losses_time_ser = pd.Series([entity.losses_time for entity in self.entities],
+                                    index=[str(entity.uid) for entity in self.entities], dtype=object)
+        losses_time_ser = losses_time_ser.loc[~losses_time_ser.index.duplicated()].reindex(ent_id_arr)
+        losses_time_ls = [ent_losses if isinstance(ent_losses, list) else [] for ent_losses in losses_time_ser]
+
+        # loss rows for the affiliation and force of each entity with components (one component lost per loss)
+        loss_entity_mask = init_comps_arr > 0
+        for uid, ent_losses, ent_init_comps in zip(ent_id_arr, losses_time_ls, init_comps_arr):
+            if ent_init_comps <= 0 and len(ent_losses) > 0:
+                self.logger.debug(f"{len(ent_losses)} loss events for entity {uid} ignored in generation of "
+                                  f"cbt_pwr file as entity had {ent_init_comps} initial components")
+        num_losses_arr = np.array([len(ent_losses) for ent_losses in losses_time_ls], dtype='int64')
+        num_losses_arr = np.where(loss_entity_mask, num_losses_arr, 0)
+        loss_time_arr = pd.to_numeric(pd.Series([time for ent_losses, ent_has_comps
+                                                 in zip(losses_time_ls, loss_entity_mask)
+                                                 if ent_has_comps for time in ent_losses],
+                                                dtype=object)).to_numpy()
+        loss_df_ls = []
+        for item_ser in (affil_ser, force_ser):
+            loss_df_ls.append(pd.DataFrame({self.cbt_tbl_time_col_lbl: loss_time_arr,
+                                            self.cbt_tbl_item_col_lbl: np.repeat(item_ser.to_numpy(), num_losses_arr),
+                                            'comp loss': -1,
+                                            'pwr loss': -np.repeat(cbt_per_comp_arr, num_losses_arr),
+                                            self.cbt_tbl_add_event_lbl: False}))
 
         # construct into a dataframe and sort by time
-        if not CDFfunc.compare_list_lengths(loss_time, loss_item, loss_comps, loss_pwr):
-            self.logger.error("Generate_cdf_cbt_pwr_file function - mismatched list lengths")
-
-        self.CDF_combat_power_DF = pd.DataFrame(data=zip(loss_time, loss_item, loss_comps, loss_pwr),
-                                                columns=[self.cbt_tbl_time_col_lbl, self.cbt_tbl_item_col_lbl,
-                                                         'comp loss', 'pwr loss'])
+        self.CDF_combat_power_DF = pd.concat(start_df_ls + add_df_ls + loss_df_ls, ignore_index=True)
         self.CDF_combat_power_DF[self.cbt_tbl_time_col_lbl] = \
             pd.to_numeric(self.CDF_combat_power_DF[self.cbt_tbl_time_col_lbl])
+        if cached_cbt_pwr_df is not None:
+            update_row_mask = self.CDF_combat_power_DF[self.cbt_tbl_item_col_lbl].isin(update_item_set)
+            # only the starting row of each affiliation and force can be at or before time 0
+            num_start_rows = len(start_df_ls[0]) + len(start_df_ls[1])
+            if (~(self.CDF_combat_power_DF[self.cbt_tbl_time_col_lbl] > 0)).sum() == num_start_rows and \
+                    (~(cached_cbt_pwr_df[self.cbt_tbl_time_col_lbl] > 0)).sum() == \
+                    cached_cbt_pwr_df[self.cbt_tbl_item_col_lbl].nunique():
+                self.CDF_combat_power_DF = self.CDF_combat_power_DF.loc[update_row_mask]
+                self.logger.info(f"Combat power recalculated for {len(update_item_set)} affiliations and forces")
+            else:
+                self.logger.debug("Combat power rows at or before time 0 - combat power recalculated for all "
+                                  "affiliations and forces")
+                cached_cbt_pwr_df = None
+        elif shard_item_set is not None and \
+                (~(self.CDF_combat_power_DF[self.cbt_tbl_time_col_lbl] > 0)).sum() == \
+                len(start_df_ls[0]) + len(start_df_ls[1]):
+            # the loss event ids are attached independently for each affiliation and force so only the rows of the
+            # shard's own affiliations and forces are generated
+            self.CDF_combat_power_DF = self.CDF_combat_power_DF.loc[
+                self.CDF_combat_power_DF[self.cbt_tbl_item_col_lbl].isin(shard_item_set)]
+            shard_item_set = None
         self.CDF_combat_power_DF.sort_values(by=[self.cbt_tbl_time_col_lbl, self.cbt_tbl_item_col_lbl],
                                              inplace=True, ignore_index=True)
         # add cumulative total columns for comps and pwr
@@ -1847,25 +3879,61 @@ class DataSet:
         # drop the comp loss and pwr loss columns
         self.CDF_combat_power_DF.drop(labels=['comp loss', 'pwr loss'], axis=1, inplace=True)
 
-        self.attach_loss_events_to_cdf_cbt_pwr_df()
+        self.attach_loss_events_to_cdf_cbt_pwr_df(
+            entity_added_ls=self.CDF_combat_power_DF.pop(self.cbt_tbl_add_event_lbl).to_list())
+        if shard_item_set is not None:
+            # rows at or before time 0 other than the starting rows, all rows were generated for the loss event ids
+            self.CDF_combat_power_DF = self.CDF_combat_power_DF.loc[
+                self.CDF_combat_power_DF[self.cbt_tbl_item_col_lbl].isin(shard_item_set)].reset_index(drop=True)
+
+        if cached_cbt_pwr_df is not None:
+            # merge with the rows for the other affiliations and forces from the last finalise (rows for the same time
+            # and item are all from one of the Dataframes so keep their order in the stable sort)
+            reuse_row_mask = ~cached_cbt_pwr_df[self.cbt_tbl_item_col_lbl].astype(str).isin(update_item_set)
+            if len(self.CDF_combat_power_DF) > 0:
+                self.CDF_combat_power_DF = pd.concat([cached_cbt_pwr_df.loc[reuse_row_mask],
+                                                      self.CDF_combat_power_DF], ignore_index=True)
+            else:
+                # no recalculated rows, leave them out of the concat so they don't set the column types
+                self.CDF_combat_power_DF = cached_cbt_pwr_df.loc[reuse_row_mask].reset_index(drop=True)
+            self.CDF_combat_power_DF.sort_values(by=[self.cbt_tbl_time_col_lbl, self.cbt_tbl_item_col_lbl],
+                                                 inplace=True, ignore_index=True, kind='stable')
 
         # try to apply column types to the CDF combat power df
         try:
-            self.CDF_combat_power_DF = self.CDF_combat_power_DF.astype(dtype=self.cbt_tbl_col_types_dict)
+            self.apply_cdf_col_types(self.CDF_combat_power_DF, self.get_cdf_col_types_dict(
+                self.cbt_tbl_col_types_dict))
         except ValueError as error:
             self.logger.error(f"Unable to type cast for one or more columns in CDF combat power df: {str(error)},"
                               f"may cause issues with parquet export")
 
-    def attach_loss_events_to_cdf_cbt_pwr_df(self) -> None:
+    def get_shard_item_set(self, item_set: set) -> set:
+        """
+        Return the affiliations and forces whose CDF combat power rows are generated by this shard run (shards
+        option). The affiliations and forces are assigned to the shards in turn in sorted order.
+
+        Args:
+            item_set: all affiliations and forces (as strings)
+        """
+        return {item for item_idx, item in enumerate(sorted(item_set)) if item_idx % self.shards == self.shard_index}
+
+    def attach_loss_events_to_cdf_cbt_pwr_df(self, entity_added_ls: list = None) -> None:
         """
         Identify the CDF loss events that caused drops in force / affiliation components / combat power and add
         event IDs to the CDF combat power Dataframe.
+
+        Args:
+            entity_added_ls: List of bools (one per combat power row) marking rows where a late entity added its
+                components / combat power, these rows are given the entity added label instead of a loss event id
+                (optional, default None - no entity added rows).
         """
         self.logger.info("Attaching loss event ids to CDF combat power file")
 
         # extract a list of times and items from the CDF combat power file
         time_ls = self.CDF_combat_power_DF[self.cbt_tbl_time_col_lbl].to_list()
         item_ls = self.CDF_combat_power_DF[self.cbt_tbl_item_col_lbl].to_list()
+        if entity_added_ls is None:
+            entity_added_ls = [False] * len(time_ls)
 
         num_items = len(CDFfunc.get_unique_list(item_ls))
         # add 'none' at the start of the list for the initial level for each unique item
@@ -1873,32 +3941,51 @@ class DataSet:
         # remove times for initial levels from lists
         del time_ls[:num_items]
         del item_ls[:num_items]
+        del entity_added_ls[:num_items]
 
-        # cut a dataframe from CDF events with just the losses and extract lists
-        losses_df = self.CDF_events_df.loc[self.CDF_events_df[self.evn_tbl_event_type_col_lbl] == self.loss_event_lbl]
+        # cut a dataframe from CDF events with just the losses and extract lists (a shard run keeps the loss events
+        # of all entities apart from its CDF events, see split_shard_cdf_events_rows)
+        events_df = self.shard_loss_events_df if self.shard_run else self.CDF_events_df
+        losses_df = events_df.loc[events_df[self.evn_tbl_event_type_col_lbl] == self.loss_event_lbl]
         loss_time_ls = losses_df[self.evn_tbl_time_col_lbl].to_list()
         loss_affil_ls = losses_df[self.evn_tbl_prim_affil_col_lbl].to_list()
         loss_force_ls = losses_df[self.evn_tbl_prim_force_col_lbl].to_list()
         loss_eventid_ls = losses_df[self.evn_tbl_event_id_col_lbl].to_list()
         loss_entity_ls = losses_df[self.evn_tbl_prim_id_col_lbl].to_list()
 
-        # go through the lists from the combat power file and try to find the associated loss event from CDF event lists
+        # queue the loss events (in CDF events order) against each (time, affiliation) and (time, force) key,
+        # ignoring losses for entities with no initial components as these are not included in the cbt pwr file
+        init_comps_dict = {entity.uid: entity.init_comps for entity in self.entities}
+        affil_queue_dict = dict()
+        force_queue_dict = dict()
+        for loss_idx, loss_time in enumerate(loss_time_ls):
+            if init_comps_dict[str(loss_entity_ls[loss_idx])] > 0:
+                affil_queue_dict.setdefault((loss_time, loss_affil_ls[loss_idx]), deque()).append(loss_idx)
+                force_queue_dict.setdefault((loss_time, loss_force_ls[loss_idx]), deque()).append(loss_idx)
+
+        # go through the lists from the combat power file and take the first unused loss event from the matching
+        # affiliation and force queues - a loss event matching on both affiliation and force is used for both
         for time_idx, time in enumerate(time_ls):
-            event_identified = False
-            for loss_idx, loss_time in enumerate(loss_time_ls):
-                if not event_identified:
-                    if self.entities[self.get_entity_index(loss_entity_ls[loss_idx])].init_comps > 0:
-                        if time == loss_time and loss_affil_ls[loss_idx] == item_ls[time_idx]:
-                            eventid_ls.append(loss_eventid_ls[loss_idx])
-                            loss_affil_ls[loss_idx] = None
-                            event_identified = True
-                        if time == loss_time and loss_force_ls[loss_idx] == item_ls[time_idx]:
-                            eventid_ls.append(loss_eventid_ls[loss_idx])
-                            loss_force_ls[loss_idx] = None
-                            event_identified = True
-
-            # if the event has not been identified after going through all CDF loss events warn and append placeholder
-            if not event_identified:
+            item = item_ls[time_idx]
+            if entity_added_ls[time_idx]:
+                eventid_ls.append(self.cbt_tbl_add_event_lbl)
+                continue
+            affil_queue = affil_queue_dict.get((time, item), deque())
+            while affil_queue and loss_affil_ls[affil_queue[0]] is None:
+                affil_queue.popleft()
+            force_queue = force_queue_dict.get((time, item), deque())
+            while force_queue and loss_force_ls[force_queue[0]] is None:
+                force_queue.popleft()
+
+            if affil_queue or force_queue:
+                loss_idx = min(queue[0] for queue in (affil_queue, force_queue) if queue)
+                eventid_ls.append(loss_eventid_ls[loss_idx])
+                if loss_affil_ls[loss_idx] == item:
+                    loss_affil_ls[loss_idx] = None
+                if loss_force_ls[loss_idx] == item:
+                    loss_force_ls[loss_idx] = None
+            else:
+                # if the event has not been identified from the CDF loss events warn and append placeholder
                 self.logger.warning(f"No loss event identified for component drop at time {time}")
                 eventid_ls.append("event not found")
 
@@ -1909,42 +3996,68 @@ class DataSet:
             self.logger.error("Mismatched list lengths - attaching loss event ids to CDF combat power file aborted")
             self.CDF_combat_power_DF[self.cbt_tbl_event_col_lbl] = 'event id attachment aborted'
 
-    def check_cdf_cbt_pwr_df(self) -> None:
+    def check_cdf_cbt_pwr_df(self, sample_step: int = 1, entity_checks: bool = True,
+                             check_item_set: set = None) -> float:
         """
         Check CDF combat power Dataframe.
 
         CDF combat power Dataframe checks:
         Check for negative time values (add Dataset error).
         Check for negative total components (add Dataset error).
+
+        Args:
+            sample_step: run the time value check on every nth row only (deterministic sample) and log an estimate of
+                the negative times in the full CDF combat power Dataframe. The components check always uses all rows
+                (optional, default 1 - check all rows).
+            entity_checks: run the components check (optional, default True)
+            check_item_set: run the checks on rows for the affiliations and forces in the set only (optional,
+                default None - check all rows)
+
+        Returns:
+            Time (seconds) spent on the time value check
         """
         self.logger.info("Checking CDF combat power file")
         cdf_cbt_pwr_file_issue_count = 0
 
+        # rows to check
+        check_cbt_pwr_df = self.CDF_combat_power_DF
+        if check_item_set is not None:
+            check_cbt_pwr_df = self.CDF_combat_power_DF.loc[
+                self.CDF_combat_power_DF[self.cbt_tbl_item_col_lbl].astype(str).isin(check_item_set)]
+            self.logger.info(f"CDF cbt pwr check - checks run on {len(check_cbt_pwr_df)} rows for "
+                             f"{len(check_item_set)} affiliations and forces changed since the last finalise")
+
         # check for negative times
-        time_ls = self.CDF_combat_power_DF[self.cbt_tbl_time_col_lbl].to_list()
-        for time in time_ls:
-            if time < 0:
-                self.logger.error(f"CDF cbt pwr check - Negative time value {time} in CDF combat power file")
-                cdf_cbt_pwr_file_issue_count += 1
+        row_check_start_time = perf_counter()
+        time_ser = check_cbt_pwr_df[self.cbt_tbl_time_col_lbl]
+        if sample_step > 1:
+            time_ser = time_ser.iloc[::sample_step]
+        for time in time_ser[time_ser < 0].to_list():
+            self.logger.error(f"CDF cbt pwr check - Negative time value {time} in CDF combat power file")
+            cdf_cbt_pwr_file_issue_count += 1
+        if sample_step > 1:
+            self.logger.info(f"CDF cbt pwr check - time check run on {len(time_ser)} of "
+                             f"{len(check_cbt_pwr_df)} rows (1 in {sample_step}), estimated "
+                             f"{cdf_cbt_pwr_file_issue_count * sample_step} negative time values in full CDF combat "
+                             f"power file")
+        row_check_time = perf_counter() - row_check_start_time
 
         # check for negative component values (combat power is a multiplication of comps so wil also be negative)
-        cbt_items_ls = CDFfunc.get_unique_list(self.CDF_combat_power_DF[self.cbt_tbl_item_col_lbl].to_list())
-
-        for cbt_item in cbt_items_ls:
-            neg_comps_mask = (self.CDF_combat_power_DF[self.cbt_tbl_item_col_lbl] == cbt_item) & \
-                             (self.CDF_combat_power_DF[self.cbt_tbl_comp_col_lbl] < 0)
-
-            if sum(neg_comps_mask) > 0:
-                cdf_cbt_pwr_file_issue_count += 1
-                neg_comps_times_ls = self.CDF_combat_power_DF.loc[neg_comps_mask,
-                                                                  self.cbt_tbl_time_col_lbl].to_list()
-                neg_comps_loss_events_ls = self.CDF_combat_power_DF.loc[neg_comps_mask,
-                                                                        self.cbt_tbl_event_col_lbl].to_list()
-
-                self.logger.error(f"CDF cbt pwr check - "
-                                  f"{cbt_item} had negative components at times {neg_comps_times_ls}")
-                self.logger.debug(f"associated loss events were {neg_comps_loss_events_ls}")
-                cdf_cbt_pwr_file_issue_count += 1
+        neg_comps_df = check_cbt_pwr_df.loc[check_cbt_pwr_df[self.cbt_tbl_comp_col_lbl] < 0]
+
+        if entity_checks and not neg_comps_df.empty:
+            neg_comps_grp = neg_comps_df.groupby(self.cbt_tbl_item_col_lbl, sort=False, observed=True)
+            neg_comps_times_dict = neg_comps_grp[self.cbt_tbl_time_col_lbl].agg(list).to_dict()
+            neg_comps_loss_events_dict = neg_comps_grp[self.cbt_tbl_event_col_lbl].agg(list).to_dict()
+
+            # report items in the order they first appear in the combat power file
+            for cbt_item in check_cbt_pwr_df[self.cbt_tbl_item_col_lbl].drop_duplicates().to_list():
+                if cbt_item in neg_comps_times_dict:
+                    cdf_cbt_pwr_file_issue_count += 1
+                    self.logger.error(f"CDF cbt pwr check - "
+                                      f"{cbt_item} had negative components at times {neg_comps_times_dict[cbt_item]}")
+                    self.logger.debug(f"associated loss events were {neg_comps_loss_events_dict[cbt_item]}")
+                    cdf_cbt_pwr_file_issue_count += 1
 
         # add code for additional CDF combat power file checks
 
@@ -1953,32 +4066,33 @@ class DataSet:
         else:
             self.logger.warning(f"{cdf_cbt_pwr_file_issue_count} potential issues found in CDF combat power file")
 
+        return row_check_time
+
     def add_case_and_rep_to_cdf_df(self) -> None:
         """
         Add case and replication columns to CDF outputs
         values from configuration
         """
         self.logger.info("adding case and replication columns to CDF outputs")
+        case_rep_col_types_dict = self.get_cdf_col_types_dict({self.case_col_lbl: str, self.rep_col_lbl: str})
         self.CDF_entity_table_df.insert(0, self.case_col_lbl, self.case)
         self.CDF_entity_table_df.insert(1, self.rep_col_lbl, self.replication)
-        self.CDF_entity_table_df = self.CDF_entity_table_df.astype(dtype={self.case_col_lbl: str,
-                                                                          self.rep_col_lbl: str})
+        self.apply_cdf_col_types(self.CDF_entity_table_df, case_rep_col_types_dict)
 
         self.CDF_events_df.insert(0, self.case_col_lbl, self.case)
         self.CDF_events_df.insert(1, self.rep_col_lbl, self.replication)
-        self.CDF_events_df = self.CDF_events_df.astype(dtype={self.case_col_lbl: str,
-                                                              self.rep_col_lbl: str})
+        self.apply_cdf_col_types(self.CDF_events_df, case_rep_col_types_dict)
 
         self.CDF_combat_power_DF.insert(0, self.case_col_lbl, self.case)
         self.CDF_combat_power_DF.insert(1, self.rep_col_lbl, self.replication)
-        self.CDF_combat_power_DF = self.CDF_combat_power_DF.astype(dtype={self.case_col_lbl: str,
-                                                                          self.rep_col_lbl: str})
+        self.apply_cdf_col_types(self.CDF_combat_power_DF, case_rep_col_types_dict)
 
     def drop_event_type(self, event_type: str) -> None:
         """
         Drop all events of a defined type from the CDF events Dataframe
-        Function called during finalise data process to selectively drop any of location, seen, spot or shot events
-        depending on configuration.
+        Note - the drop_location_events, drop_seen_events, drop_spot_events and drop_shot_events options are applied
+        as the CDF events Dataframe is generated (see generate_cdf_events_df) so this function is not called during
+        the finalise data process.
         This function will only drop events from the CDF events dataframe and CDF events output. It will not remove
         event data from entities and should only be called after generate_cdf_event_file() .
 
@@ -1993,6 +4107,45 @@ class DataSet:
 
         self.logger.info(f"{events_dropped} events of type {event_type} dropped")
 
+    def check_config_setting(self, setting: str, default_val, valid, valid_desc: str = None,
+                             default_desc: str = "the default value will be used", setting_type: type = str) -> None:
+        """
+        Check an option setting from the dataset config (after the parameters are set by the init method). The
+        setting is parsed as the setting type and recorded in the metadata dict, if it is not valid a warning is
+        logged and it is set to the default value.
+        Args:
+            setting: name of the setting
+            default_val: value of the setting if it is not valid
+            valid: list of valid values or a function returning True for a valid (parsed) value
+            valid_desc: description of the valid values for the warning (default - the list of valid values)
+            default_desc: description of what the default value does for the warning
+            setting_type: str (stripped and lower case), int or float - values that cannot be parsed as an int or
+                float are left as they are (default str)
+        """
+        setting_val = getattr(self, setting)
+        if setting_type is str:
+            setting_val = str(setting_val).strip().lower()
+        elif setting_val is not None:
+            try:
+                float_val = float(setting_val)
+                if setting_type is float:
+                    setting_val = float_val
+                elif float_val.is_integer():
+                    setting_val = int(float_val)
+            except ValueError:
+                pass
+        setattr(self, setting, setting_val)
+        self.metadata_dict[setting] = setting_val
+
+        if isinstance(valid, list):
+            setting_valid = setting_val in valid
+            valid_desc = valid_desc or f"valid values are {valid}"
+        else:
+            setting_valid = valid(setting_val)
+        if not setting_valid:
+            self.logger.warning(f"{setting} {setting_val} not recognised ({valid_desc}), {default_desc}")
+            self.update_config(setting, default_val)
+
     def update_config(self, setting: str, value):
         """
         Update a dataset config element and record in metadata dict
@@ -2029,17 +4182,36 @@ class DataSet:
             self.metadata_dict[meta_key] = meta_value
             self.logger.debug(f"Metadata added - key: {meta_key}, value: {meta_value}")
 
-    def add_summary_metadata(self) -> None:
+    def add_summary_metadata(self, total_entities: int = None) -> None:
         """
         Add summary statistics to the metadata file
+
+        Args:
+            total_entities: number of entities (optional, default None - the number of entity instances, see
+                get_num_entities)
         """
-        total_entities = self.get_num_entities()
-        total_events = len(self.CDF_events_df[self.evn_tbl_time_col_lbl].to_list())
+        if total_entities is None:
+            total_entities = self.get_num_entities()
+        # first and last CDF event times (the CDF events are sorted by time)
+        event_time_ser = self.CDF_events_df[self.evn_tbl_time_col_lbl]
+        event_time_ls = event_time_ser.iloc[:1].to_list() + event_time_ser.iloc[-1:].to_list()
         total_items = len(CDFfunc.get_unique_list(self.CDF_combat_power_DF[self.cbt_tbl_item_col_lbl].to_list()))
 
-        if len(self.CDF_events_df[self.evn_tbl_time_col_lbl].to_list()) > 0:
-            first_event_str = f"{self.CDF_events_df[self.evn_tbl_time_col_lbl].to_list()[0]} {self.time_unit}"
-            last_event_str = f"{self.CDF_events_df[self.evn_tbl_time_col_lbl].to_list()[-1]} {self.time_unit}"
+        # totals and first / last event times include any events dropped by the drop_*_events options
+        dropped_events_dict = self.dropped_events_dict
+        total_events = len(event_time_ser) + dropped_events_dict.get('num_events', 0)
+        if dropped_events_dict.get('num_events', 0) > 0:
+            # CDF events are sorted by time with any null times last
+            time_ser = pd.to_numeric(pd.Series(event_time_ls[:1] + event_time_ls[-1:] +
+                                               [dropped_events_dict['first_time'], dropped_events_dict['last_time']],
+                                               dtype=object), errors='coerce')
+            last_time = np.nan if (dropped_events_dict['null_time'] or pd.isnull(event_time_ls[-1:]).any()) \
+                else time_ser.max()
+            event_time_ls = [time_ser.min(), last_time]
+
+        if total_events > 0:
+            first_event_str = f"{event_time_ls[0]} {self.time_unit}"
+            last_event_str = f"{event_time_ls[-1]} {self.time_unit}"
         else:
             first_event_str = 'no events'
             last_event_str = 'no events'
@@ -2097,6 +4269,8 @@ class DataSet:
         self.CDF_entity_table_df = pd.DataFrame()
         self.CDF_events_df = pd.DataFrame()
         self.CDF_combat_power_DF = pd.DataFrame()
+        # the next finalise is a full finalise
+        self.finalise_cache_dict = {}
 
         # empty the entities array
         self.entities = []
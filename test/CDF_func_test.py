@@ -1,3 +1,4 @@
+import gzip
 import pytest
 import pandas as pd
 
@@ -135,6 +136,70 @@ def test_get_df_slice(test_utils, slice_col, slice_val, rtn_cols, exp_dict):
     test_utils.check_fail_ls(fail_msg_ls)
 
 
+@pytest.mark.parametrize(
+    ('track_keys', 'track_seqs', 'query_keys', 'query_seqs', 'exp_ls'),
+    (
+            pytest.param(['a', 'a', 'b'], [1, 3, 2], ['a', 'a', 'a', 'b'], [0, 1, 2, 5], [-1, 0, 0, 2],
+                         id='last item at or before'),
+            pytest.param(['a', 'a', 'a'], [1, 1, 4], ['a', 'a'], [1, 3], [1, 1], id='repeat sequence values'),
+            pytest.param(['a', 'b'], [1, 1], ['c', None], [2, 2], [-1, -1], id='unknown and null keys'),
+            pytest.param([], [], ['a'], [1], [-1], id='empty track'),
+    )
+)
+def test_get_last_track_idx(test_utils, track_keys, track_seqs, query_keys, query_seqs, exp_ls):
+    fail_msg_ls = []
+    func = test_utils.get_cdf_func()
+
+    out_ls = list(func.get_last_track_idx(track_keys=track_keys, track_seqs=track_seqs,
+                                          query_keys=query_keys, query_seqs=query_seqs))
+    if out_ls != exp_ls:
+        fail_msg_ls.append(f"get_last_track_idx returned {out_ls} but expected {exp_ls}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize(
+    ('prim_id_ls', 'sec_id_ls', 'exp_prim_name_ls', 'exp_sec_name_ls', 'exp_sec_lvl_ls'),
+    (
+            pytest.param(['a', 'b'], ['b', 'a'], ['A', 'B'], ['B', 'A'], [2.0, 1.0], id='primary and secondary'),
+            pytest.param(['a', 'a'], [None, 'x'], ['A', 'A'], ['', ''], [None, None],
+                         id='no secondary and unknown secondary'),
+            pytest.param(['c'], ['a'], ['C2'], ['A'], [1.0], id='repeat entity id (last entry used)'),
+    )
+)
+def test_denormalise_cdf_events(test_utils, prim_id_ls, sec_id_ls, exp_prim_name_ls, exp_sec_name_ls,
+                                exp_sec_lvl_ls):
+    fail_msg_ls = []
+    func = test_utils.get_cdf_func()
+
+    entity_df = pd.DataFrame({'id': ['a', 'b', 'c', 'c'], 'name': ['A', 'B', 'C1', 'C2'],
+                              'type': ['t', 't', 't', 't'], 'commander_id': ['b', 'None', 'b', 'b'],
+                              'level': [1, 2, 3, 3], 'affiliation': ['blue', 'blue', 'red', 'red'],
+                              'force': ['f1', 'f1', 'f2', 'f2']})
+    events_df = pd.DataFrame({'time': [float(idx) for idx in range(len(prim_id_ls))], 'primary_entity_id': prim_id_ls,
+                              'event_id': [f"e-{idx}" for idx in range(len(prim_id_ls))],
+                              'secondary_entity_id': sec_id_ls})
+
+    out_df = func.denormalise_cdf_events(events_df=events_df, entity_df=entity_df)
+    exp_col_ls = ['time', 'primary_entity_id', 'primary_entity_name', 'primary_entity_type',
+                  'primary_entity_commander', 'primary_entity_level', 'primary_entity_affiliation',
+                  'primary_entity_force', 'event_id', 'secondary_entity_id', 'secondary_entity_name',
+                  'secondary_entity_type', 'secondary_entity commander', 'secondary_entity_level',
+                  'secondary_entity_affiliation', 'secondary_entity_force']
+    if out_df.columns.to_list() != exp_col_ls:
+        fail_msg_ls.append(f"denormalise_cdf_events returned columns {out_df.columns.to_list()} "
+                           f"but expected {exp_col_ls}")
+    else:
+        for col_lbl, exp_ls in [('primary_entity_name', exp_prim_name_ls), ('secondary_entity_name', exp_sec_name_ls),
+                                ('secondary_entity_level', exp_sec_lvl_ls)]:
+            out_ser = out_df[col_lbl]
+            if not out_ser.equals(pd.Series(exp_ls, name=col_lbl, dtype=out_ser.dtype)):
+                fail_msg_ls.append(f"denormalise_cdf_events returned {col_lbl} {out_ser.to_list()} "
+                                   f"but expected {exp_ls}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
 @pytest.mark.parametrize(
     ('input_str', 'exp_flt'),
     (
@@ -499,3 +564,65 @@ def test_parse_config_location(test_utils, input_str, exp_str):
         fail_msg_ls.append(f"parse_config_location returned {out_str} for {input_str} but {exp_str} expected")
 
     test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize('batch_rows', (pytest.param(1, id='1 row batches'), pytest.param(2, id='2 row batches'),
+                                        pytest.param(100000, id='single batch')))
+@pytest.mark.parametrize('columns', (pytest.param(None, id='all columns'), pytest.param(['time', 'event_id'],
+                                                                                       id='column subset')))
+@pytest.mark.parametrize('num_rows', (pytest.param(5, id='5 rows'), pytest.param(0, id='no rows')))
+def test_write_csv_batches(test_utils, tmp_path, batch_rows, columns, num_rows):
+    fail_msg_ls = []
+    func = test_utils.get_cdf_func()
+
+    test_df = pd.DataFrame({'time': [0.0, 1.5, None, 1e-07, 123456789.125][:num_rows],
+                            'event_id': ['loc-1', 'shot-1', 'spot,1', 'say "hi"', None][:num_rows],
+                            'event_type': pd.Categorical(['a', 'b', 'a', None, 'b'][:num_rows]),
+                            'level': pd.array([1, 2, None, 4, 5][:num_rows], dtype='Int32'),
+                            'start_entity': [True, False, True, True, False][:num_rows]})
+    exp_file_path = tmp_path / 'expected.csv'
+    test_df.to_csv(exp_file_path, columns=columns, index=False)
+
+    out_file_path = tmp_path / 'out.csv'
+    num_written = func.write_csv_batches(test_df, str(out_file_path), columns=columns, batch_rows=batch_rows)
+
+    if num_written != num_rows:
+        fail_msg_ls.append(f"write_csv_batches returned {num_written} rows but expected {num_rows}")
+    if out_file_path.read_bytes() != exp_file_path.read_bytes():
+        fail_msg_ls.append(f"write_csv_batches wrote {out_file_path.read_bytes()} but expected "
+                           f"{exp_file_path.read_bytes()}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize('compression', (pytest.param('gzip', id='gzip'), pytest.param('zstd', id='zstd')))
+@pytest.mark.parametrize('batch_rows', (pytest.param(1, id='1 row batches'), pytest.param(2, id='2 row batches'),
+                                        pytest.param(100000, id='single batch')))
+@pytest.mark.parametrize('num_rows', (pytest.param(5, id='5 rows'), pytest.param(0, id='no rows')))
+def test_write_csv_batches_compression(test_utils, tmp_path, compression, batch_rows, num_rows):
+    fail_msg_ls = []
+    func = test_utils.get_cdf_func()
+
+    test_df = pd.DataFrame({'time': [0.0, 1.5, None, 1e-07, 123456789.125][:num_rows],
+                            'event_id': ['loc-1', 'shot-1', 'spot,1', 'say "hi"', None][:num_rows],
+                            'level': pd.array([1, 2, None, 4, 5][:num_rows], dtype='Int32')})
+    exp_file_path = tmp_path / 'expected.csv'
+    test_df.to_csv(exp_file_path, index=False)
+
+    out_file_path = tmp_path / f"out.csv.{compression}"
+    num_written = func.write_csv_batches(test_df, str(out_file_path), batch_rows=batch_rows, compression=compression,
+                                         compression_threads=2)
+
+    if num_written != num_rows:
+        fail_msg_ls.append(f"write_csv_batches returned {num_written} rows but expected {num_rows}")
+    if compression == 'gzip':
+        out_bytes = gzip.decompress(out_file_path.read_bytes())
+    else:
+        pa = pytest.importorskip('pyarrow')
+        with pa.input_stream(str(out_file_path), compression='zstd') as out_file:
+            out_bytes = out_file.read()
+    if out_bytes != exp_file_path.read_bytes():
+        fail_msg_ls.append(f"write_csv_batches wrote {out_bytes} (decompressed) but expected "
+                          f"{exp_file_path.read_bytes()}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
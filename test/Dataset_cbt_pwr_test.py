@@ -0,0 +1,101 @@
+import pytest
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3'],
+            'affiliation': ['blue', 'blue', 'blue'],
+            'force': ['nato', 'nato', 'nato'],
+            'init_comps': [2, 2, 2],
+            'cbt_per_comp': [1.5, 1.5, 1.5]}
+
+loss_event_dict = {'event_type': 'loss',
+                   'uid': ['t-1', 't-3', 't-3'],
+                   'time': [3.0, 5.0, 6.0],
+                   'entity': ['t-2', 't-2', 't-2'],
+                   'detail_keys': [None],
+                   'detail_vals': [[None], [None], [None]]}
+
+
+@pytest.mark.parametrize(
+    'start_entity, add_time, exp_time_ls, exp_comps_ls, exp_event_ls',
+    (
+            pytest.param([True, True, True], [0.0, 0.0, 0.0],
+                         [0.0, 3.0, 5.0, 6.0],
+                         [6, 5, 4, 3],
+                         ['none', 'loss-1', 'loss-2', 'loss-3'], id='all start entities'),
+            pytest.param([True, True, False], [0.0, 0.0, 5.0],
+                         [0.0, 3.0, 5.0, 5.0, 6.0],
+                         [4, 3, 5, 4, 3],
+                         ['none', 'loss-1', 'entity added', 'loss-2', 'loss-3'], id='entity added at time 5'),
+            pytest.param([True, True, False], [0.0, 0.0, 0.0],
+                         [0.0, 3.0, 5.0, 6.0],
+                         [6, 5, 4, 3],
+                         ['none', 'loss-1', 'loss-2', 'loss-3'], id='non start entity added at time 0'),
+    )
+)
+def test_cbt_pwr_entity_added(test_utils, start_entity, add_time, exp_time_ls, exp_comps_ls, exp_event_ls):
+    """
+    Create a dataset instance with three entities in the same affiliation and force (parametrize start_entity and
+    add_time)
+    Add loss events and finalise the dataset instance
+    Confirm the affiliation and force timelines in the CDF combat power Dataframe include entities that were not
+    present at the start from their add_time
+    """
+    fail_msg_ls = []
+
+    test_dataset = test_utils.make_dataset(dataset_config={'output_location': 'Output/CbtPwrTest'})
+    test_utils.add_entities(dataset=test_dataset, ent_dict=dict(ent_dict, start_entity=start_entity,
+                                                                 add_time=add_time))
+    test_utils.add_single_events(dataset=test_dataset, event_dict=loss_event_dict)
+    test_dataset.finalise_data()
+
+    cbt_pwr_df = test_dataset.CDF_combat_power_DF
+    for item in ['blue', 'nato']:
+        item_df = cbt_pwr_df.loc[cbt_pwr_df[test_dataset.cbt_tbl_item_col_lbl] == item]
+        act_time_ls = item_df[test_dataset.cbt_tbl_time_col_lbl].to_list()
+        act_comps_ls = item_df[test_dataset.cbt_tbl_comp_col_lbl].to_list()
+        act_pwr_ls = item_df[test_dataset.cbt_tbl_pwr_col_lbl].to_list()
+        act_event_ls = item_df[test_dataset.cbt_tbl_event_col_lbl].to_list()
+        exp_pwr_ls = [comps * 1.5 for comps in exp_comps_ls]
+
+        if act_time_ls != exp_time_ls:
+            fail_msg_ls.append(f"{item} times {act_time_ls} - expected {exp_time_ls}")
+        if act_comps_ls != exp_comps_ls:
+            fail_msg_ls.append(f"{item} components {act_comps_ls} - expected {exp_comps_ls}")
+        if act_pwr_ls != exp_pwr_ls:
+            fail_msg_ls.append(f"{item} combat power {act_pwr_ls} - expected {exp_pwr_ls}")
+        if act_event_ls != exp_event_ls:
+            fail_msg_ls.append(f"{item} event ids {act_event_ls} - expected {exp_event_ls}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+def test_cbt_pwr_entity_table_order(test_utils):
+    """
+    Create a dataset instance with three entities in the same affiliation and force (one added at time 5), add loss
+    events and finalise the dataset instance
+    Reverse the order of the CDF entity table rows and set the start_entity column to strings and regenerate the CDF
+    combat power Dataframe
+    Confirm the CDF combat power Dataframe is unchanged (the entity table rows are matched to the entities by entity id
+    and the start_entity strings are not all read as True)
+    """
+    fail_msg_ls = []
+
+    test_dataset = test_utils.make_dataset(dataset_config={'output_location': 'Output/CbtPwrTest'})
+    test_utils.add_entities(dataset=test_dataset, ent_dict=dict(ent_dict, start_entity=[True, True, False],
+                                                                 add_time=[0.0, 0.0, 5.0]))
+    test_utils.add_single_events(dataset=test_dataset, event_dict=loss_event_dict)
+    test_dataset.finalise_data()
+    exp_cbt_pwr_df = test_dataset.CDF_combat_power_DF.drop(columns=[test_dataset.case_col_lbl,
+                                                                    test_dataset.rep_col_lbl])
+
+    ent_tbl_df = test_dataset.CDF_entity_table_df.iloc[::-1].reset_index(drop=True)
+    ent_tbl_df[test_dataset.ent_tbl_start_entity_col_lbl] = \
+        ent_tbl_df[test_dataset.ent_tbl_start_entity_col_lbl].map({True: "1", False: "False"})
+    test_dataset.CDF_entity_table_df = ent_tbl_df
+    test_dataset.generate_cdf_cbt_pwr_df()
+
+    if not test_dataset.CDF_combat_power_DF.equals(exp_cbt_pwr_df):
+        fail_msg_ls.append("CDF combat power Dataframe changed by the entity table order and start_entity strings")
+        fail_msg_ls.append(test_utils.get_dataframe_diff(df_act=test_dataset.CDF_combat_power_DF,
+                                                         df_exp=exp_cbt_pwr_df))
+
+    test_utils.check_fail_ls(fail_msg_ls)
@@ -0,0 +1,113 @@
+import gzip
+import pytest
+import yaml
+from os import path
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 3, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1', 't-4', 't-2'],
+                  'time': [0.0, 0.0, 1.0, 2.0, 2.0, 3.0],
+                  'x': [1.0, 2.0, 3.0, 4.5, 5.0, 6.0],
+                  'y': [5.0, 6.0, 7.0, 8.25, 9.0, 10.0],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3', 't-4'],
+                  'time': [3.0, 4.0, 2.0],
+                  'entity': ['t-3', None, None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle'], ['radio']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-2'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-3'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+output_location = path.join('Output', 'CsvCompressionTest')
+
+
+def read_compressed_file(file_path: str, csv_compression: str) -> bytes:
+    if csv_compression == 'gzip':
+        with gzip.open(file_path, "rb") as csv_file:
+            return csv_file.read()
+    if csv_compression == 'zstd':
+        pa = pytest.importorskip('pyarrow')
+        with pa.input_stream(file_path, compression='zstd') as csv_file:
+            return csv_file.read()
+    with open(file_path, "rb") as csv_file:
+        return csv_file.read()
+
+
+@pytest.mark.parametrize(
+    'csv_compression, exp_csv_compression, exp_file_ext',
+    (
+            pytest.param('gzip', 'gzip', ".csv.gz", id='gzip'),
+            pytest.param('ZSTD', 'zstd', ".csv.zst", id='zstd'),
+            pytest.param('none', 'none', ".csv", id='none'),
+            pytest.param('bz2', 'none', ".csv", id='unrecognised codec'),
+    )
+)
+@pytest.mark.parametrize(
+    'dataset_config',
+    (
+            pytest.param({}, id='default'),
+            pytest.param({'split_files_by_type': '1', 'normalised_events_export': '1', 'output_parquet': '1',
+                          'output_feather': '1'}, id='split files, normalised events, parquet and feather'),
+    )
+)
+def test_csv_compression(test_utils, csv_compression, exp_csv_compression, exp_file_ext, dataset_config):
+    """
+    Create a dataset instance with the csv_compression config option set (parametrize) and a second dataset instance
+    without the option
+    Add the same entities and events to both dataset instances, finalise them and export the data (with small csv
+    batches so each file is compressed in several blocks)
+    Confirm the codec and file extension are recorded in the metadata file, that the CDF file names have the file
+    extension, that the .parquet and .feather file names are unchanged and that the decompressed .csv files are the
+    same as the .csv files of the dataset instance without the option
+    """
+    fail_msg_ls = []
+
+    dataset_ls = []
+    for serial, compression_config in [('1', {'csv_compression': csv_compression}), ('2', {})]:
+        test_dataset = test_utils.make_dataset(dataset_config=dict(dataset_config, **compression_config, serial=serial,
+                                                                   output_location=output_location))
+        test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+        for event_dict in event_dict_ls:
+            test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+        test_dataset.csv_batch_rows = 2
+        test_dataset.finalise_data()
+        test_dataset.export_data()
+        dataset_ls.append(test_dataset)
+    test_dataset, default_dataset = dataset_ls
+
+    with open(test_dataset.metadata_file_path, "r") as metadata_file:
+        metadata_dict = yaml.safe_load(metadata_file)
+    for setting, exp_value in [('csv_compression', exp_csv_compression), ('csv_file_ext', exp_file_ext)]:
+        if metadata_dict.get(setting) != exp_value:
+            fail_msg_ls.append(f"metadata {setting} {metadata_dict.get(setting)} - expected {exp_value}")
+
+    for file_path, default_file_path in [(test_dataset.entity_file_path, default_dataset.entity_file_path),
+                                         (test_dataset.events_file_path, default_dataset.events_file_path),
+                                         (test_dataset.cbt_pwr_file_path, default_dataset.cbt_pwr_file_path)]:
+        if not file_path.endswith(exp_file_ext) or file_path.endswith(f"{exp_file_ext}{exp_file_ext}"):
+            fail_msg_ls.append(f"{file_path} file extension - expected {exp_file_ext}")
+        if not path.isfile(file_path):
+            fail_msg_ls.append(f"{file_path} not exported")
+            continue
+        if read_compressed_file(file_path, exp_csv_compression) != read_compressed_file(default_file_path, 'none'):
+            fail_msg_ls.append(f"{file_path} decompressed does not match the .csv file without compression")
+        for file_ext, output_set in [(".parquet", test_dataset.output_parquet),
+                                     (".feather", test_dataset.output_feather)]:
+            other_file_path = file_path[:-len(exp_file_ext)] + file_ext
+            if output_set and not path.isfile(other_file_path):
+                fail_msg_ls.append(f"{other_file_path} not exported")
+
+    test_utils.check_fail_ls(fail_msg_ls)
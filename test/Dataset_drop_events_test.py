@@ -82,3 +82,45 @@ def test_event_type_drop(test_utils, save_load, num_events,
         fail_msg_ls.append(f"expected {total_events_expected} events but CDF events Dataframe had {len(cdf_event_ls)}")
 
     test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize('drop_location_events', (pytest.param('0'), pytest.param('1', id='drop location')))
+def test_dropped_location_events_coordinates(test_utils, drop_location_events):
+    """
+    Create a dataset instance (parametrize drop_location_events)
+    Add location events and then shot and spot events for two entities
+    Finalise the dataset instance
+    Confirm that primary and secondary x / y for the shot and spot events come from the location events whether or
+    not the location events are dropped and that total events in the metadata include the dropped events
+    """
+    fail_msg_ls = []
+
+    config_dict = {'output_location': 'Output/DropEventsTest',
+                   'drop_location_events': drop_location_events}
+
+    test_dataset = test_utils.make_dataset(dataset_config=config_dict)
+    test_utils.add_entities(dataset=test_dataset, ent_dict={'uid': ['t-1', 't-2']})
+
+    test_dataset.add_location(uid='t-1', time=0.0, x=1.0, y=2.0, detail_keys=[None], detail_vals=[None])
+    test_dataset.add_location(uid='t-2', time=0.0, x=3.0, y=4.0, detail_keys=[None], detail_vals=[None])
+    test_dataset.add_location(uid='t-1', time=2.0, x=5.0, y=6.0, detail_keys=[None], detail_vals=[None])
+    test_dataset.add_shot(uid='t-1', time=1.0, detail_keys=[None], detail_vals=[None])
+    test_dataset.add_spot(uid='t-1', time=3.0, entity='t-2', detail_keys=[None], detail_vals=[None])
+
+    test_dataset.finalise_data()
+
+    events_df = test_dataset.CDF_events_df
+    exp_xy_dict = {test_dataset.shot_event_lbl: [1.0, 2.0, None, None],
+                   test_dataset.spot_event_lbl: [5.0, 6.0, 3.0, 4.0]}
+    for event_type, exp_xy_ls in exp_xy_dict.items():
+        event_row = events_df.loc[events_df[test_dataset.evn_tbl_event_type_col_lbl] == event_type].iloc[0]
+        act_xy_ls = [event_row[test_dataset.evn_tbl_prim_x_col_lbl], event_row[test_dataset.evn_tbl_prim_y_col_lbl],
+                     event_row[test_dataset.evn_tbl_sec_x_col_lbl], event_row[test_dataset.evn_tbl_sec_y_col_lbl]]
+        act_xy_ls = [None if xy != xy else xy for xy in act_xy_ls]
+        if act_xy_ls != exp_xy_ls:
+            fail_msg_ls.append(f"{event_type} event x / y values {act_xy_ls} - expected {exp_xy_ls}")
+
+    if test_dataset.metadata_dict['total_events'] != 5:
+        fail_msg_ls.append(f"total_events in metadata was {test_dataset.metadata_dict['total_events']} - expected 5")
+
+    test_utils.check_fail_ls(fail_msg_ls)
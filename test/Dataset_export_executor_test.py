@@ -0,0 +1,164 @@
+import logging
+import pytest
+from os import path
+from processor_core.CDF_Func import CDFfunc
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 3, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1', 't-4', 't-2'],
+                  'time': [0.0, 0.0, 1.0, 2.0, 2.0, 3.0],
+                  'x': [1.0, 2.0, 3.0, 4.5, 5.0, 6.0],
+                  'y': [5.0, 6.0, 7.0, 8.25, 9.0, 10.0],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3', 't-4'],
+                  'time': [3.0, 4.0, 2.0],
+                  'entity': ['t-3', None, None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle'], ['radio']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-2'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-3'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+output_location = path.join('Output', 'ExportExecutorTest')
+
+
+def make_test_dataset(test_utils, dataset_config):
+    test_dataset = test_utils.make_dataset(dataset_config=dict(dataset_config, output_location=output_location))
+    test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+    for event_dict in event_dict_ls:
+        test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+    test_dataset.finalise_data()
+    return test_dataset
+
+
+def get_exp_export_msg_ls(test_dataset) -> list:
+    # export log messages in the order they are expected
+    exp_msg_ls = [f"{test_dataset.metadata_file_path} exported"]
+    cdf_file_path_ls = [test_dataset.entity_file_path, test_dataset.events_file_path, test_dataset.cbt_pwr_file_path]
+    for output_set, file_ext, format_lbl in [(test_dataset.output_csv, ".csv", ".csv"),
+                                             (test_dataset.output_parquet, ".parquet", ".parquet"),
+                                             (test_dataset.output_feather, ".feather", ".feather (Arrow IPC)")]:
+        if output_set:
+            exp_msg_ls.append(f"Exporting CDF files in {format_lbl} format:")
+            exp_msg_ls += [f"{file_path.replace('.csv', file_ext)} exported" for file_path in cdf_file_path_ls]
+    return exp_msg_ls
+
+
+@pytest.mark.parametrize(
+    'export_executor, exp_export_executor',
+    (
+            pytest.param('thread', 'thread', id='thread'),
+            pytest.param('Serial', 'serial', id='serial (upper case)'),
+            pytest.param('process', 'thread', id='unrecognised executor'),
+    )
+)
+@pytest.mark.parametrize(
+    'dataset_config',
+    (
+            pytest.param({'serial': '1', 'output_parquet': '1', 'output_feather': '1'}, id='csv, parquet and feather'),
+            pytest.param({'serial': '3', 'output_parquet': '1', 'normalised_events_export': '1',
+                          'split_files_by_type': '1'}, id='csv and parquet - normalised events, split files'),
+            pytest.param({'serial': '5', 'output_csv': '0', 'output_feather': '1', 'memory_optimised_dtypes': '1'},
+                         id='feather - memory optimised'),
+    )
+)
+def test_export_executor(test_utils, caplog, export_executor, exp_export_executor, dataset_config):
+    """
+    Create a dataset instance with the export_executor config option set (parametrize) and a second dataset instance
+    with the option set to serial
+    Add the same entities and events to both dataset instances, finalise them and export the data
+    Confirm the executor is recorded in the metadata, that the exported log messages are in the same order as exporting
+    one file after another and that the exported CDF files are the same as the dataset instance exported in sequence
+    """
+    fail_msg_ls = []
+
+    dataset_ls = []
+    # each config has its own serials so files exported by other configs in the same second are not matched
+    for executor, serial in [(export_executor, dataset_config['serial']),
+                             ('serial', str(int(dataset_config['serial']) + 1))]:
+        test_dataset = make_test_dataset(test_utils, dict(dataset_config, export_executor=executor, serial=serial))
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger=test_dataset.logger.name):
+            test_dataset.export_data()
+        dataset_ls.append(test_dataset)
+        if executor == export_executor:
+            export_msg_ls = [record.getMessage() for record in caplog.records
+                             if record.getMessage().endswith('exported') or
+                             record.getMessage().startswith('Exporting CDF files')]
+            if export_msg_ls != get_exp_export_msg_ls(test_dataset):
+                fail_msg_ls.append(f"export log messages {export_msg_ls} - expected "
+                                   f"{get_exp_export_msg_ls(test_dataset)}")
+    test_dataset, serial_dataset = dataset_ls
+
+    if test_dataset.metadata_dict.get('export_executor') != exp_export_executor:
+        fail_msg_ls.append(f"metadata export_executor {test_dataset.metadata_dict.get('export_executor')} - expected "
+                           f"{exp_export_executor}")
+
+    for file_ext in [".csv", ".feather"]:
+        for file_path, serial_file_path in [(test_dataset.entity_file_path, serial_dataset.entity_file_path),
+                                            (test_dataset.events_file_path, serial_dataset.events_file_path),
+                                            (test_dataset.cbt_pwr_file_path, serial_dataset.cbt_pwr_file_path)]:
+            file_path = file_path.replace(".csv", file_ext)
+            serial_file_path = serial_file_path.replace(".csv", file_ext)
+            if path.isfile(file_path) != path.isfile(serial_file_path):
+                fail_msg_ls.append(f"{file_path} exported {path.isfile(file_path)} - expected "
+                                   f"{path.isfile(serial_file_path)}")
+            elif path.isfile(file_path):
+                with open(file_path, "rb") as export_file, open(serial_file_path, "rb") as serial_file:
+                    if export_file.read() != serial_file.read():
+                        fail_msg_ls.append(f"{file_path} does not match the file exported in sequence")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize('export_executor', (pytest.param('thread', id='thread'),
+                                             pytest.param('serial', id='serial')))
+def test_export_executor_failed_file(test_utils, caplog, monkeypatch, export_executor):
+    """
+    Create a dataset instance with the export_executor config option set (parametrize), add entities and events,
+    finalise it and export the data with the CDF events .csv file set to fail
+    Confirm the error is raised once the other files are exported, that the failure is logged for the CDF events .csv
+    file and that the other files are exported and logged
+    """
+    fail_msg_ls = []
+    write_csv_batches = CDFfunc.write_csv_batches
+
+    def fail_events_csv(output_df, file_path, **kwargs):
+        if file_path == test_dataset.events_file_path:
+            raise OSError("events file write failed (test)")
+        return write_csv_batches(output_df, file_path, **kwargs)
+
+    test_dataset = make_test_dataset(test_utils, {'output_parquet': '1', 'export_executor': export_executor})
+    monkeypatch.setattr(CDFfunc, 'write_csv_batches', fail_events_csv)
+    with caplog.at_level(logging.INFO, logger=test_dataset.logger.name):
+        with pytest.raises(OSError):
+            test_dataset.export_data()
+
+    error_msg_ls = [record.getMessage() for record in caplog.records if record.levelno == logging.ERROR]
+    if not any(error_msg.startswith(f"{test_dataset.events_file_path} export failed") for error_msg in error_msg_ls):
+        fail_msg_ls.append(f"no export failed error for {test_dataset.events_file_path} - errors {error_msg_ls}")
+    exp_msg_ls = [exp_msg for exp_msg in get_exp_export_msg_ls(test_dataset)
+                  if exp_msg != f"{test_dataset.events_file_path} exported"]
+    export_msg_ls = [record.getMessage() for record in caplog.records
+                     if record.getMessage().endswith('exported') or
+                     record.getMessage().startswith('Exporting CDF files')]
+    if export_msg_ls != exp_msg_ls:
+        fail_msg_ls.append(f"export log messages {export_msg_ls} - expected {exp_msg_ls}")
+    for file_path in [test_dataset.entity_file_path, test_dataset.cbt_pwr_file_path,
+                      test_dataset.events_file_path.replace(".csv", ".parquet")]:
+        if not path.isfile(file_path):
+            fail_msg_ls.append(f"{file_path} not exported")
+
+    test_utils.check_fail_ls(fail_msg_ls)
@@ -0,0 +1,120 @@
+import pytest
+import yaml
+import pandas as pd
+from os import path
+
+pa = pytest.importorskip('pyarrow')
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 3, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1', 't-4', 't-2'],
+                  'time': [0.0, 0.0, 1.0, 2.0, 2.0, 3.0],
+                  'x': [1.0, 2.0, 3.0, 4.5, 5.0, 6.0],
+                  'y': [5.0, 6.0, 7.0, 8.25, 9.0, 10.0],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3', 't-4'],
+                  'time': [3.0, 4.0, 2.0],
+                  'entity': ['t-3', None, None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle'], ['radio']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-2'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-3'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+
+@pytest.mark.parametrize(
+    'feather_compression, exp_feather_compression',
+    (
+            pytest.param(None, 'uncompressed', id='default'),
+            pytest.param('LZ4', 'lz4', id='lz4'),
+            pytest.param('zstd', 'zstd', id='zstd'),
+            pytest.param('gzip', 'uncompressed', id='unrecognised codec'),
+    )
+)
+@pytest.mark.parametrize(
+    'dataset_config',
+    (
+            pytest.param({'serial': '1'}, id='default'),
+            pytest.param({'serial': '2', 'split_files_by_type': '1', 'normalised_events_export': '1'},
+                         id='split files, normalised events'),
+            pytest.param({'serial': '3', 'memory_optimised_dtypes': '1', 'output_csv': '0'},
+                         id='memory optimised, no csv'),
+    )
+)
+def test_feather_export(test_utils, feather_compression, exp_feather_compression, dataset_config):
+    """
+    Create a dataset instance with the output_feather config option set and the feather_compression config option set
+    (parametrize), add entities and events, finalise it and export the data
+    Confirm the codec is recorded in the metadata file and that the .feather files are written next to the .csv file
+    paths (file names and split_files_by_type folders) and hold the exported CDF Dataframes
+    Confirm uncompressed .feather files are read from a memory map without copying the data
+    """
+    fail_msg_ls = []
+    output_location = path.join('Output', 'FeatherExportTest')
+    feather_config = dict(dataset_config, output_feather='1', output_location=output_location)
+    if feather_compression is not None:
+        feather_config['feather_compression'] = feather_compression
+    test_dataset = test_utils.make_dataset(dataset_config=feather_config)
+    test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+    for event_dict in event_dict_ls:
+        test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+    test_dataset.finalise_data()
+    test_dataset.export_data()
+
+    with open(test_dataset.metadata_file_path, "r") as metadata_file:
+        metadata_dict = yaml.safe_load(metadata_file)
+    if metadata_dict.get('feather_compression') != exp_feather_compression:
+        fail_msg_ls.append(f"metadata feather_compression {metadata_dict.get('feather_compression')} - expected "
+                           f"{exp_feather_compression}")
+
+    events_col_ls = [col_lbl for col_lbl in test_dataset.CDF_events_df.columns
+                     if not test_dataset.normalised_events_export or
+                     col_lbl not in test_dataset.evn_tbl_entity_detail_col_ls]
+    for df_lbl, cdf_df, csv_file_path, folder_name in [
+        ('entity table', test_dataset.CDF_entity_table_df, test_dataset.entity_file_path,
+         test_dataset.entity_folder_name),
+        ('events', test_dataset.CDF_events_df[events_col_ls], test_dataset.events_file_path,
+         test_dataset.events_folder_name),
+        ('combat power', test_dataset.CDF_combat_power_DF, test_dataset.cbt_pwr_file_path,
+         test_dataset.cbt_folder_name)]:
+        feather_file_path = csv_file_path.replace(".csv", ".feather")
+        exp_folder = path.join(output_location, folder_name) if test_dataset.split_files_by_type else output_location
+        if path.dirname(feather_file_path) != exp_folder:
+            fail_msg_ls.append(f"{df_lbl} .feather file in {path.dirname(feather_file_path)} - expected {exp_folder}")
+        if not path.isfile(feather_file_path):
+            fail_msg_ls.append(f"{df_lbl} .feather file {feather_file_path} not exported")
+            continue
+        if path.isfile(csv_file_path) != test_dataset.output_csv:
+            fail_msg_ls.append(f"{df_lbl} .csv file exported {path.isfile(csv_file_path)} - expected "
+                               f"{test_dataset.output_csv}")
+
+        # read the Arrow IPC file from a memory map
+        allocated_bytes = pa.total_allocated_bytes()
+        with pa.memory_map(feather_file_path, 'r') as feather_source:
+            feather_table = pa.ipc.open_file(feather_source).read_all()
+            if exp_feather_compression == 'uncompressed' and pa.total_allocated_bytes() != allocated_bytes:
+                fail_msg_ls.append(f"{df_lbl} .feather file not read from a memory map without copying")
+            read_df = feather_table.to_pandas()
+        del feather_table
+
+        # string columns are read back with the pyarrow string storage
+        if not read_df.astype(object).equals(cdf_df.reset_index(drop=True).astype(object)):
+            fail_msg_ls.append(f"{df_lbl} .feather file does not match the CDF Dataframe")
+            fail_msg_ls.append(test_utils.get_dataframe_diff(df_act=read_df, df_exp=cdf_df.reset_index(drop=True)))
+        if read_df.columns.to_list() != cdf_df.columns.to_list():
+            fail_msg_ls.append(f"{df_lbl} .feather file columns {read_df.columns.to_list()} - expected "
+                               f"{cdf_df.columns.to_list()}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
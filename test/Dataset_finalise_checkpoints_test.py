@@ -0,0 +1,144 @@
+import pytest
+from os import path
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 3, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1'],
+                  'time': [0.0, 0.0, 1.0, 2.0],
+                  'x': [1.0, 2.0, 3.0, 4.5],
+                  'y': [5.0, 6.0, 7.0, 8.25],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-3', None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-2'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-3'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+# test outputs are written beside the test file so they do not depend on the directory pytest is run from
+test_output_location = path.join(path.dirname(__file__), 'Output', 'FinaliseCheckpointsTest')
+
+
+def make_test_dataset(test_utils, dataset_config):
+    test_dataset = test_utils.make_dataset(dataset_config=dataset_config)
+    test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+    for event_dict in event_dict_ls:
+        test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+    return test_dataset
+
+
+def fail_stage():
+    raise MemoryError("finalise stage failed (test)")
+
+
+@pytest.mark.parametrize(
+    'fail_func, exp_resumed_stages',
+    (
+            pytest.param('generate_cdf_events_df', ['entity table'], id='events failed'),
+            pytest.param('generate_cdf_cbt_pwr_df', ['entity table', 'events'], id='combat power failed'),
+            pytest.param('add_case_and_rep_to_cdf_df', ['entity table', 'events', 'combat power'],
+                         id='after stages failed'),
+    )
+)
+@pytest.mark.parametrize(
+    'finalise_checkpoints, dataset_config',
+    (
+            pytest.param('parquet', {}, id='parquet'),
+            pytest.param('feather', {}, id='feather'),
+            pytest.param('Parquet', {'memory_optimised_dtypes': '1', 'drop_location_events': '1'},
+                         id='parquet (upper case) - memory optimised, drop location'),
+    )
+)
+def test_finalise_checkpoints(test_utils, monkeypatch, fail_func, exp_resumed_stages, finalise_checkpoints,
+                              dataset_config):
+    """
+    Create a dataset instance with the finalise_checkpoints config option set (parametrize), add entities and events
+    and finalise it with a finalise function set to fail (parametrize)
+    Create a second dataset instance with the same config, entities and events and finalise it
+    Confirm the second finalise resumes from the checkpoints saved before the failure, that the resumed stages are
+    recorded in the metadata and that the CDF Dataframes match a dataset instance without checkpoints
+    Export the second dataset instance and confirm the checkpoint folder is removed
+    """
+    fail_msg_ls = []
+    output_location = path.join(test_output_location, f"{finalise_checkpoints}_{fail_func}")
+    checkpoint_config = dict(dataset_config, finalise_checkpoints=finalise_checkpoints,
+                             output_location=output_location)
+
+    failed_dataset = make_test_dataset(test_utils, checkpoint_config)
+    failed_dataset.remove_finalise_checkpoint()
+    monkeypatch.setattr(failed_dataset, fail_func, lambda *args, **kwargs: fail_stage())
+    with pytest.raises(MemoryError):
+        failed_dataset.finalise_data()
+
+    test_dataset = make_test_dataset(test_utils, checkpoint_config)
+    test_dataset.finalise_data()
+    default_dataset = make_test_dataset(test_utils, dict(dataset_config, output_location=output_location))
+    default_dataset.finalise_data()
+
+    resumed_stages = test_dataset.metadata_dict.get('finalise_resumed_stages')
+    if resumed_stages != exp_resumed_stages:
+        fail_msg_ls.append(f"metadata finalise_resumed_stages {resumed_stages} - expected {exp_resumed_stages}")
+
+    for df_lbl, act_df, exp_df in [('entity table', test_dataset.CDF_entity_table_df,
+                                    default_dataset.CDF_entity_table_df),
+                                   ('events', test_dataset.CDF_events_df, default_dataset.CDF_events_df),
+                                   ('combat power', test_dataset.CDF_combat_power_DF,
+                                    default_dataset.CDF_combat_power_DF)]:
+        if not act_df.equals(exp_df) or not act_df.dtypes.equals(exp_df.dtypes):
+            fail_msg_ls.append(f"CDF {df_lbl} Dataframe does not match the dataset without checkpoints")
+            fail_msg_ls.append(test_utils.get_dataframe_diff(df_act=act_df, df_exp=exp_df))
+
+    for summary_key in ['total_events', 'first_event', 'last_event']:
+        if test_dataset.metadata_dict.get(summary_key) != default_dataset.metadata_dict.get(summary_key):
+            fail_msg_ls.append(f"metadata {summary_key} {test_dataset.metadata_dict.get(summary_key)} - expected "
+                               f"{default_dataset.metadata_dict.get(summary_key)}")
+
+    test_dataset.export_data()
+    if path.isdir(test_dataset.get_finalise_checkpoint_path()):
+        fail_msg_ls.append("finalise checkpoint folder not removed after export")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+def test_finalise_checkpoints_changed_dataset(test_utils):
+    """
+    Create a dataset instance with the finalise_checkpoints config option set, add entities and events and finalise it
+    Create a second dataset instance with the same config, entities and events plus an extra event and finalise it
+    Confirm the second finalise does not resume from the checkpoints saved for the first dataset state
+    """
+    fail_msg_ls = []
+    checkpoint_config = {'finalise_checkpoints': 'parquet',
+                         'output_location': path.join(test_output_location, 'changed_dataset')}
+
+    first_dataset = make_test_dataset(test_utils, checkpoint_config)
+    first_dataset.remove_finalise_checkpoint()
+    first_dataset.finalise_data()
+    if first_dataset.metadata_dict.get('finalise_resumed_stages') != []:
+        fail_msg_ls.append(f"first dataset metadata finalise_resumed_stages "
+                           f"{first_dataset.metadata_dict.get('finalise_resumed_stages')} - expected []")
+
+    test_dataset = make_test_dataset(test_utils, checkpoint_config)
+    test_dataset.add_shot(uid='t-2', time=5.0, detail_keys=[], detail_vals=[])
+    test_dataset.finalise_data()
+    if test_dataset.metadata_dict.get('finalise_resumed_stages') != []:
+        fail_msg_ls.append(f"changed dataset metadata finalise_resumed_stages "
+                           f"{test_dataset.metadata_dict.get('finalise_resumed_stages')} - expected []")
+    if 'shot-3' not in test_dataset.CDF_events_df['event_id'].to_list():
+        fail_msg_ls.append("event added to the changed dataset not in the CDF events Dataframe")
+
+    test_dataset.remove_finalise_checkpoint()
+    test_utils.check_fail_ls(fail_msg_ls)
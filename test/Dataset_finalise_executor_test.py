@@ -0,0 +1,103 @@
+import logging
+import pytest
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 1, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1'],
+                  'time': [0.0, 0.0, 1.0, 2.0],
+                  'x': [1.0, 2.0, 3.0, 4.5],
+                  'y': [5.0, 6.0, 7.0, 8.25],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3'],
+                  'time': [3.0, -4.0],
+                  'entity': ['t-3', None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-3'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-5'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+finalise_stage_ls = ['entity table', 'entity table check', 'events', 'events check', 'combat power',
+                     'combat power check']
+
+
+@pytest.mark.parametrize(
+    'finalise_executor, exp_finalise_executor',
+    (
+            pytest.param('serial', 'serial', id='serial'),
+            pytest.param('thread', 'thread', id='thread'),
+            pytest.param('process', 'serial', id='process (no longer an executor)'),
+            pytest.param('Thread', 'thread', id='thread (upper case)'),
+            pytest.param('pool', 'serial', id='unrecognised executor'),
+    )
+)
+@pytest.mark.parametrize('validation_level', (pytest.param('full'), pytest.param('off')))
+def test_finalise_executor(test_utils, caplog, finalise_executor, exp_finalise_executor, validation_level):
+    """
+    Create a dataset instance with the finalise_executor config option set (parametrize) and a second dataset instance
+    with the default executor
+    Add the same entities and events (with some issues for the CDF checks to log) to both dataset instances and
+    finalise them
+    Confirm the executor is recorded in the metadata, the finalise stage times are set and that the CDF Dataframes and
+    the finalise log entries (other than run times) match the default dataset instance
+    """
+    fail_msg_ls = []
+
+    dataset_ls = []
+    log_msg_ls_ls = []
+    for config_dict in [{'finalise_executor': finalise_executor}, {}]:
+        test_dataset = test_utils.make_dataset(dataset_config=dict(config_dict,
+                                                                   validation_level=validation_level,
+                                                                   output_location='Output/FinaliseExecutorTest'))
+        test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+        for event_dict in event_dict_ls:
+            test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+        caplog.clear()
+        with caplog.at_level(logging.DEBUG, logger=test_dataset.logger.name):
+            test_dataset.finalise_data()
+        # log entries with run times or memory use left out
+        log_msg_ls_ls.append([record.getMessage() for record in caplog.records
+                              if record.name == test_dataset.logger.name and
+                              not any(time_str in record.getMessage().lower()
+                                      for time_str in ['stage times', 'time saved', 'seconds saved', 'peak'])])
+        dataset_ls.append(test_dataset)
+    test_dataset, default_dataset = dataset_ls
+    test_log_msg_ls, default_log_msg_ls = log_msg_ls_ls
+
+    if test_dataset.metadata_dict.get('finalise_executor') != exp_finalise_executor:
+        fail_msg_ls.append(f"metadata finalise_executor {test_dataset.metadata_dict.get('finalise_executor')} - "
+                           f"expected {exp_finalise_executor}")
+
+    stage_times = test_dataset.finalise_stage_times
+    if not isinstance(stage_times, dict) or list(stage_times.keys()) != finalise_stage_ls:
+        fail_msg_ls.append(f"finalise_stage_times {stage_times} - expected times for stages {finalise_stage_ls}")
+    elif not all(type(stage_time) is float and stage_time >= 0 for stage_time in stage_times.values()):
+        fail_msg_ls.append(f"finalise_stage_times {stage_times} - expected floats >= 0")
+    if 'finalise_stage_times' in test_dataset.metadata_dict:
+        fail_msg_ls.append("finalise_stage_times in metadata dict - expected run times to be left out of metadata")
+
+    for df_lbl, act_df, exp_df in [('entity table', test_dataset.CDF_entity_table_df,
+                                    default_dataset.CDF_entity_table_df),
+                                   ('events', test_dataset.CDF_events_df, default_dataset.CDF_events_df),
+                                   ('combat power', test_dataset.CDF_combat_power_DF,
+                                    default_dataset.CDF_combat_power_DF)]:
+        if not act_df.equals(exp_df):
+            fail_msg_ls.append(f"CDF {df_lbl} Dataframe does not match the default finalise executor")
+
+    if len(test_log_msg_ls) == 0 or test_log_msg_ls != default_log_msg_ls:
+        fail_msg_ls.append(f"finalise log entries do not match the default finalise executor: {test_log_msg_ls} - "
+                           f"expected {default_log_msg_ls}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
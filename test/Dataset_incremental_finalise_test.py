@@ -0,0 +1,155 @@
+import logging
+import pytest
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 3, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1'],
+                  'time': [0.0, 0.0, 1.0, 2.0],
+                  'x': [1.0, 2.0, 3.0, 4.5],
+                  'y': [5.0, 6.0, 7.0, 8.25],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-3', None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-2'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-3'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+
+def change_events(dataset):
+    dataset.add_location(uid='t-3', time=3.5, x=9.0, y=9.5, detail_keys=[], detail_vals=[])
+    dataset.add_loss(uid='t-1', time=5.0, killer='t-3', detail_keys=[], detail_vals=[])
+
+
+def change_entity_data(dataset):
+    dataset.set_entity_data(uid='t-2', affiliation='green', force='other', unit_name='recce')
+
+
+def remove_event(dataset):
+    dataset.remove_event(remove_id='loss-1')
+
+
+def add_entity(dataset):
+    dataset.add_entity(uid='t-5')
+    dataset.set_entity_data(uid='t-5', affiliation='blue', force='nato', init_comps=2, cbt_per_comp=1.5,
+                            start_entity=False, add_time=2.0)
+    dataset.add_kill(uid='t-5', time=6.0, victim='t-3', detail_keys=[], detail_vals=[])
+
+
+def replace_entity(dataset):
+    # entity replaced without the Dataset functions (found by comparing entity states)
+    entity_dict = dataset.entities[0].export_entity_dict()
+    dataset.entities[0] = type(dataset.entities[0])(uid=entity_dict['uid'])
+    dataset.entities[0].import_entity_dict(dict(entity_dict, init_comps=5))
+
+
+def no_change(dataset):
+    pass
+
+
+@pytest.mark.parametrize(
+    'change_func',
+    (
+            pytest.param(change_events, id='events added'),
+            pytest.param(change_entity_data, id='entity data changed'),
+            pytest.param(remove_event, id='event removed'),
+            pytest.param(add_entity, id='entity added'),
+            pytest.param(replace_entity, id='entity replaced'),
+            pytest.param(no_change, id='no change'),
+    )
+)
+@pytest.mark.parametrize('drop_location_events', (pytest.param('0'), pytest.param('1', id='drop location')))
+@pytest.mark.parametrize('memory_optimised_dtypes', (pytest.param('0'), pytest.param('1', id='memory optimised')))
+def test_incremental_finalise(test_utils, change_func, drop_location_events, memory_optimised_dtypes):
+    """
+    Create two dataset instances, one with the incremental_finalise option set (parametrize drop_location_events and
+    memory_optimised_dtypes)
+    Add the same entities and events to both dataset instances and finalise them
+    Make the same change to both dataset instances (parametrize) and finalise them again
+    Confirm the second finalise of the incremental dataset instance is incremental, recorded in the metadata and that
+    the CDF Dataframes match the full finalise of the default dataset instance
+    """
+    fail_msg_ls = []
+
+    dataset_ls = []
+    for incremental_finalise in ['1', '0']:
+        test_dataset = test_utils.make_dataset(dataset_config={'output_location': 'Output/IncrementalFinaliseTest',
+                                                               'incremental_finalise': incremental_finalise,
+                                                               'drop_location_events': drop_location_events,
+                                                               'memory_optimised_dtypes': memory_optimised_dtypes})
+        test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+        for event_dict in event_dict_ls:
+            test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+        test_dataset.finalise_data()
+        change_func(test_dataset)
+        test_dataset.finalise_data()
+        dataset_ls.append(test_dataset)
+    test_dataset, default_dataset = dataset_ls
+
+    for dataset_lbl, dataset, exp_finalise_mode in [('incremental', test_dataset, 'incremental'),
+                                                    ('default', default_dataset, 'full')]:
+        if dataset.metadata_dict.get('finalise_mode') != exp_finalise_mode:
+            fail_msg_ls.append(f"{dataset_lbl} dataset metadata finalise_mode "
+                               f"{dataset.metadata_dict.get('finalise_mode')} - expected {exp_finalise_mode}")
+
+    for df_lbl, act_df, exp_df in [('entity table', test_dataset.CDF_entity_table_df,
+                                    default_dataset.CDF_entity_table_df),
+                                   ('events', test_dataset.CDF_events_df, default_dataset.CDF_events_df),
+                                   ('combat power', test_dataset.CDF_combat_power_DF,
+                                    default_dataset.CDF_combat_power_DF)]:
+        if not act_df.equals(exp_df):
+            fail_msg_ls.append(f"CDF {df_lbl} Dataframe does not match the full finalise")
+            fail_msg_ls.append(test_utils.get_dataframe_diff(df_act=act_df, df_exp=exp_df))
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize(
+    'change_func, exp_log_msg',
+    (
+            pytest.param(change_events, "CDF events rows of 2 changed entities spliced into the CDF events of the last "
+                                        "finalise - 6 rows removed, 8 rows inserted", id='events added'),
+            pytest.param(remove_event, "CDF events rows of 1 changed entities spliced into the CDF events of the last "
+                                       "finalise - 3 rows removed, 2 rows inserted", id='event removed'),
+            pytest.param(no_change, "No entity events changed since the last finalise, CDF events reused",
+                         id='no change'),
+    )
+)
+def test_incremental_finalise_events_spliced(test_utils, caplog, change_func, exp_log_msg):
+    """
+    Create a dataset instance with the incremental_finalise option set, add entities and events and finalise it
+    Make a change (parametrize) and finalise it again
+    Confirm only the CDF events rows of the entities with changed events are removed and inserted into the CDF events
+    of the first finalise
+    """
+    fail_msg_ls = []
+
+    test_dataset = test_utils.make_dataset(dataset_config={'output_location': 'Output/IncrementalFinaliseTest',
+                                                           'incremental_finalise': '1'})
+    test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+    for event_dict in event_dict_ls:
+        test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+    test_dataset.finalise_data()
+    change_func(test_dataset)
+    with caplog.at_level(logging.INFO, logger=test_dataset.logger.name):
+        test_dataset.finalise_data()
+
+    log_msg_ls = [record.getMessage() for record in caplog.records if record.name == test_dataset.logger.name]
+    if exp_log_msg not in log_msg_ls:
+        fail_msg_ls.append(f"log entry '{exp_log_msg}' not found")
+
+    test_utils.check_fail_ls(fail_msg_ls)
@@ -15,6 +15,8 @@ import pytest
             ('output_location', ['Output/init_test'], [r'Output\init_test']),
             ('output_csv', ['0', '1'], [False, True]),
             ('output_parquet', ['0', '1'], [False, True]),
+            ('output_feather', ['0', '1'], [False, True]),
+            ('output_partitioned', ['0', '1'], [False, True]),
             ('force_unique_unit_names', ['0', '1'], [False, True]),
             ('entity_data_from_table', ['0', '1'], [False, True]),
             ('split_files_by_type', ['0', '1'], [False, True]),
@@ -0,0 +1,68 @@
+import pytest
+import pandas as pd
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 3, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1'],
+                  'time': [0.0, 0.0, 1.0, 2.0],
+                  'x': [1.0, 2.0, 3.0, 4.5],
+                  'y': [5.0, 6.0, 7.0, 8.25],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-3', None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-2'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-3'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+
+@pytest.mark.parametrize('drop_location_events', (pytest.param('0'), pytest.param('1', id='drop location')))
+def test_memory_optimised_dtypes(test_utils, drop_location_events):
+    """
+    Create two dataset instances, one with the memory_optimised_dtypes option set
+    Add the same entities and events to both dataset instances and finalise them
+    Confirm the repeated value columns of the memory optimised CDF Dataframes are categorical and that the CDF
+    Dataframes give the same .csv output as the default dataset instance
+    """
+    fail_msg_ls = []
+
+    dataset_ls = []
+    for memory_optimised_dtypes in ['1', '0']:
+        test_dataset = test_utils.make_dataset(dataset_config={'output_location': 'Output/MemoryOptimisedDtypesTest',
+                                                               'memory_optimised_dtypes': memory_optimised_dtypes,
+                                                               'drop_location_events': drop_location_events})
+        test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+        for event_dict in event_dict_ls:
+            test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+        test_dataset.finalise_data()
+        dataset_ls.append(test_dataset)
+    test_dataset, default_dataset = dataset_ls
+
+    for df_lbl, act_df, exp_df in [('entity table', test_dataset.CDF_entity_table_df,
+                                    default_dataset.CDF_entity_table_df),
+                                   ('events', test_dataset.CDF_events_df, default_dataset.CDF_events_df),
+                                   ('combat power', test_dataset.CDF_combat_power_DF,
+                                    default_dataset.CDF_combat_power_DF)]:
+        for col_lbl in act_df.columns:
+            if col_lbl in test_dataset.cdf_category_col_ls and not isinstance(act_df[col_lbl].dtype,
+                                                                              pd.CategoricalDtype):
+                fail_msg_ls.append(f"CDF {df_lbl} column {col_lbl} has type {act_df[col_lbl].dtype} - "
+                                   f"expected category")
+        if act_df.to_csv(index=False) != exp_df.to_csv(index=False):
+            fail_msg_ls.append(f"CDF {df_lbl} .csv output does not match the default dtypes")
+
+    test_utils.check_fail_ls(fail_msg_ls)
@@ -240,3 +240,37 @@ def test_readonly_metadata(test_utils, save_load, replace):
                                        f"with existing key and replace False")
 
     test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize(
+    'memory_optimised_dtypes',
+    (
+        pytest.param('0', id=''),
+        pytest.param('1', id='memory optimised dtypes'),
+    )
+)
+def test_peak_memory_metadata(test_utils, memory_optimised_dtypes):
+    """
+    Create a Dataset instance, add entities and events and finalise the Dataset instance
+    Check that the peak process memory has been recorded in the metadata dict (a positive value in MB, or None where
+    it cannot be read on the operating system)
+    """
+    fail_msg_ls = []
+    test_dataset = test_utils.make_dataset(dataset_config={'output_location': 'Output/MetaTest',
+                                                           'memory_optimised_dtypes': memory_optimised_dtypes})
+    test_utils.add_entities(dataset=test_dataset, ent_dict={'uid': ['t-1', 't-2']})
+    test_utils.add_single_events(dataset=test_dataset, event_dict={'event_type': 'shot',
+                                                                   'uid': ['t-1', 't-2'],
+                                                                   'time': [1.0, 2.0],
+                                                                   'detail_keys': [None],
+                                                                   'detail_vals': [[None], [None]]})
+    test_dataset.finalise_data()
+
+    if 'peak_memory_mb' not in test_dataset.metadata_dict.keys():
+        fail_msg_ls.append("peak_memory_mb not in metadata dict after finalise")
+    else:
+        peak_memory_mb = test_dataset.metadata_dict['peak_memory_mb']
+        if peak_memory_mb is not None and (type(peak_memory_mb) is not float or peak_memory_mb <= 0):
+            fail_msg_ls.append(f"peak_memory_mb {peak_memory_mb} in metadata dict - expected a value > 0 or None")
+
+    test_utils.check_fail_ls(fail_msg_ls)
@@ -0,0 +1,93 @@
+import pytest
+import pandas as pd
+from datetime import datetime
+from os import path
+test_date_time_str = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3'],
+            'unit_name': ['tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red'],
+            'force': ['nato', 'nato', 'opfor'],
+            'commander': ['t-3', 't-3', None],
+            'init_comps': [2, 2, 1],
+            'cbt_per_comp': [1.5, 1.5, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3'],
+                  'time': [0.0, 0.0, 1.0],
+                  'x': [1.0, 2.0, 3.0],
+                  'y': [5.0, 6.0, 7.0],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-3', None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3'],
+                  'time': [3.0],
+                  'entity': ['t-1'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None]]}]
+
+
+@pytest.mark.parametrize(
+    'output_format',
+    (
+        pytest.param('csv', id='csv format'),
+        pytest.param('parquet', id='pq format'),
+    )
+)
+def test_normalised_events_export(test_utils, output_format):
+    """
+    Create two dataset instances with the same entities and events, one with the normalised_events_export option set
+    Finalise and export both dataset instances (parametrize output format)
+    Confirm the metadata records the events file layout, the normalised CDF events file has no entity detail columns
+    and that the CDFfunc denormalise_cdf_events function rebuilds the denormalised CDF events file from the normalised
+    CDF events file and the CDF entity table file
+    """
+    fail_msg_ls = []
+
+    dataset_dict = {}
+    for layout, normalised_events_export in [('normalised', '1'), ('denormalised', '0')]:
+        config_dict = {'output_location': path.join('Output', 'NormalisedEventsTest', test_date_time_str,
+                                                    output_format, layout),
+                       'output_csv': '1' if output_format == 'csv' else '0',
+                       'output_parquet': '1' if output_format == 'parquet' else '0',
+                       'normalised_events_export': normalised_events_export}
+        test_dataset = test_utils.make_dataset(dataset_config=config_dict)
+        test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+        for event_dict in event_dict_ls:
+            test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+        test_dataset.finalise_data()
+        test_dataset.export_data()
+        dataset_dict[layout] = test_dataset
+
+        if test_dataset.metadata_dict.get('events_file_layout') != layout:
+            fail_msg_ls.append(f"metadata events_file_layout {test_dataset.metadata_dict.get('events_file_layout')}"
+                               f" - expected {layout}")
+
+    def read_cdf_file(file_path):
+        if output_format == 'csv':
+            return pd.read_csv(file_path)
+        return pd.read_parquet(file_path.replace('.csv', '.parquet'))
+
+    norm_dataset = dataset_dict['normalised']
+    norm_events_df = read_cdf_file(norm_dataset.events_file_path)
+    entity_df = read_cdf_file(norm_dataset.entity_file_path)
+    denorm_events_df = read_cdf_file(dataset_dict['denormalised'].events_file_path)
+
+    detail_col_ls = [col_lbl for col_lbl in norm_events_df.columns
+                     if col_lbl in norm_dataset.evn_tbl_entity_detail_col_ls]
+    if detail_col_ls:
+        fail_msg_ls.append(f"normalised CDF events file has entity detail columns {detail_col_ls}")
+
+    func = test_utils.get_cdf_func()
+    act_events_df = func.denormalise_cdf_events(events_df=norm_events_df, entity_df=entity_df)
+    if act_events_df.to_csv(index=False) != denorm_events_df.to_csv(index=False):
+        fail_msg_ls.append(f"denormalised CDF events do not match the denormalised CDF events file, differences: "
+                           f"\n {test_utils.get_dataframe_diff(df_exp=denorm_events_df, df_act=act_events_df)}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
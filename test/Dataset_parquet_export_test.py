@@ -0,0 +1,139 @@
+import pytest
+import yaml
+import pandas as pd
+from os import path
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 3, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1', 't-4', 't-2'],
+                  'time': [0.0, 0.0, 1.0, 2.0, 2.0, 3.0],
+                  'x': [1.0, 2.0, 3.0, 4.5, 5.0, 6.0],
+                  'y': [5.0, 6.0, 7.0, 8.25, 9.0, 10.0],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3', 't-4'],
+                  'time': [3.0, 4.0, 2.0],
+                  'entity': ['t-3', None, None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle'], ['radio']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-2'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-3'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+
+@pytest.mark.parametrize(
+    'parquet_config, exp_settings_dict, exp_codec',
+    (
+            pytest.param({}, {'compression': 'snappy', 'compression_level': None, 'row_group_rows': None,
+                              'dictionary_columns': 'all', 'statistics': True}, 'SNAPPY', id='default'),
+            pytest.param({'parquet_compression': 'ZSTD', 'parquet_compression_level': '9',
+                          'parquet_row_group_rows': '4', 'parquet_dictionary_columns': 'event_type; primary_entity_id',
+                          'parquet_statistics': '1'},
+                         {'compression': 'zstd', 'compression_level': 9, 'row_group_rows': 4,
+                          'dictionary_columns': ['event_type', 'primary_entity_id'], 'statistics': True}, 'ZSTD',
+                         id='zstd, row groups, dictionary columns'),
+            pytest.param({'parquet_compression': 'none', 'parquet_row_group_rows': '3',
+                          'parquet_dictionary_columns': 'None', 'parquet_statistics': '0'},
+                         {'compression': 'none', 'compression_level': None, 'row_group_rows': 3,
+                          'dictionary_columns': 'none', 'statistics': False}, 'UNCOMPRESSED',
+                         id='uncompressed, no dictionary, no statistics'),
+            pytest.param({'parquet_compression': 'lzma', 'parquet_compression_level': '30',
+                          'parquet_row_group_rows': '-2'},
+                         {'compression': 'snappy', 'compression_level': None, 'row_group_rows': None,
+                          'dictionary_columns': 'all', 'statistics': True}, 'SNAPPY', id='unrecognised settings'),
+            pytest.param({'parquet_compression_level': '5'},
+                         {'compression': 'snappy', 'compression_level': None, 'row_group_rows': None,
+                          'dictionary_columns': 'all', 'statistics': True}, 'SNAPPY', id='level without zstd'),
+    )
+)
+@pytest.mark.parametrize('memory_optimised_dtypes', (pytest.param('0', id=''),
+                                                     pytest.param('1', id='memory optimised')))
+def test_parquet_export(test_utils, parquet_config, exp_settings_dict, exp_codec, memory_optimised_dtypes):
+    """
+    Create a dataset instance with the parquet export config options set (parametrize), add entities and events,
+    finalise it and export the data in .parquet format
+    Confirm the settings are recorded in the metadata file and that the .parquet files are written with the
+    compression codec, row groups, dictionary encoding and statistics set and hold the CDF Dataframes
+    """
+    fail_msg_ls = []
+    output_location = path.join('Output', 'ParquetExportTest')
+    test_dataset = test_utils.make_dataset(dataset_config=dict(parquet_config, output_parquet='1', output_csv='0',
+                                                               memory_optimised_dtypes=memory_optimised_dtypes,
+                                                               output_location=output_location))
+    test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+    for event_dict in event_dict_ls:
+        test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+    test_dataset.finalise_data()
+    test_dataset.export_data()
+
+    with open(test_dataset.metadata_file_path, "r") as metadata_file:
+        metadata_dict = yaml.safe_load(metadata_file)
+    if metadata_dict.get('parquet_settings') != exp_settings_dict:
+        fail_msg_ls.append(f"metadata parquet_settings {metadata_dict.get('parquet_settings')} - expected "
+                           f"{exp_settings_dict}")
+
+    for df_lbl, cdf_df, csv_file_path in [('entity table', test_dataset.CDF_entity_table_df,
+                                           test_dataset.entity_file_path),
+                                          ('events', test_dataset.CDF_events_df, test_dataset.events_file_path),
+                                          ('combat power', test_dataset.CDF_combat_power_DF,
+                                           test_dataset.cbt_pwr_file_path)]:
+        pq_file = pq.ParquetFile(csv_file_path.replace(".csv", ".parquet"))
+        pq_metadata = pq_file.metadata
+        row_group_rows = exp_settings_dict['row_group_rows'] or len(cdf_df)
+        exp_row_groups = max(1, -(-len(cdf_df) // row_group_rows))
+        if pq_metadata.num_row_groups != exp_row_groups:
+            fail_msg_ls.append(f"{df_lbl} .parquet file has {pq_metadata.num_row_groups} row groups - expected "
+                               f"{exp_row_groups}")
+        for col_idx, col_lbl in enumerate(pq_file.schema_arrow.names):
+            col_meta = pq_metadata.row_group(0).column(col_idx)
+            if col_meta.compression != exp_codec:
+                fail_msg_ls.append(f"{df_lbl} .parquet column {col_lbl} compression {col_meta.compression} - "
+                                   f"expected {exp_codec}")
+            if col_meta.is_stats_set != exp_settings_dict['statistics']:
+                fail_msg_ls.append(f"{df_lbl} .parquet column {col_lbl} statistics set {col_meta.is_stats_set} - "
+                                   f"expected {exp_settings_dict['statistics']}")
+            dictionary_encoded = col_meta.has_dictionary_page
+            exp_dictionary_cols = exp_settings_dict['dictionary_columns']
+            if exp_dictionary_cols == 'all':
+                exp_dictionary_encoded = True
+            elif exp_dictionary_cols == 'none':
+                exp_dictionary_encoded = False
+            else:
+                exp_dictionary_encoded = col_lbl in exp_dictionary_cols
+            # categorical columns are always dictionary encoded and bool columns never are
+            if isinstance(cdf_df[col_lbl].dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(cdf_df[col_lbl]):
+                exp_dictionary_encoded = dictionary_encoded
+            if dictionary_encoded != exp_dictionary_encoded:
+                fail_msg_ls.append(f"{df_lbl} .parquet column {col_lbl} dictionary encoded {dictionary_encoded} - "
+                                   f"expected {exp_dictionary_encoded}")
+
+        # string columns are read back with the pyarrow string storage
+        read_df = pd.read_parquet(csv_file_path.replace(".csv", ".parquet"))
+        if not read_df.astype(object).equals(cdf_df.reset_index(drop=True).astype(object)):
+            fail_msg_ls.append(f"{df_lbl} .parquet file does not match the CDF Dataframe")
+            fail_msg_ls.append(test_utils.get_dataframe_diff(df_act=read_df, df_exp=cdf_df.reset_index(drop=True)))
+
+    if exp_settings_dict['statistics'] and exp_settings_dict['row_group_rows'] is not None:
+        # row group time statistics are in time order
+        pq_metadata = pq.ParquetFile(test_dataset.events_file_path.replace(".csv", ".parquet")).metadata
+        time_col_idx = pq_metadata.schema.names.index('time')
+        time_range_ls = [(pq_metadata.row_group(idx).column(time_col_idx).statistics.min,
+                          pq_metadata.row_group(idx).column(time_col_idx).statistics.max)
+                         for idx in range(pq_metadata.num_row_groups)]
+        if any(time_range_ls[idx][1] > time_range_ls[idx + 1][0] for idx in range(len(time_range_ls) - 1)):
+            fail_msg_ls.append(f"events .parquet row group time ranges {time_range_ls} not in time order")
+
+    test_utils.check_fail_ls(fail_msg_ls)
@@ -0,0 +1,194 @@
+import logging
+import pytest
+import shutil
+from os import path
+from glob import glob
+from processor_core.CDF_Func import CDFfunc
+
+pa = pytest.importorskip('pyarrow')
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq'],
+            'affiliation': ['blue', 'blue', 'red', 'red'],
+            'force': ['nato', 'nato', 'opfor', 'opfor'],
+            'commander': ['t-4', 't-4', 't-4', None],
+            'init_comps': [2, 2, 3, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0]}
+
+event_dict_ls = [{'event_type': 'location',
+                  'uid': ['t-1', 't-2', 't-3', 't-1', 't-4', 't-2'],
+                  'time': [0.0, 0.0, 1.0, 2.0, 2.0, 3.0],
+                  'x': [1.0, 2.0, 3.0, 4.5, 5.0, 6.0],
+                  'y': [5.0, 6.0, 7.0, 8.25, 9.0, 10.0],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None], [None], [None], [None], [None]]},
+                 {'event_type': 'shot',
+                  'uid': ['t-1', 't-3', 't-4'],
+                  'time': [3.0, 4.0, 2.0],
+                  'entity': ['t-3', None, None],
+                  'detail_keys': ['weapon'],
+                  'detail_vals': [['gun'], ['rifle'], ['radio']]},
+                 {'event_type': 'loss',
+                  'uid': ['t-3', 't-2'],
+                  'time': [3.0, 4.0],
+                  'entity': ['t-1', 't-3'],
+                  'detail_keys': [None],
+                  'detail_vals': [[None], [None]]}]
+
+output_location = path.join('Output', 'PartitionedDatasetTest')
+
+
+def make_test_dataset(test_utils, dataset_config, event_dict_ls_in):
+    test_dataset = test_utils.make_dataset(dataset_config=dict(dataset_config, output_location=output_location))
+    test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+    for event_dict in event_dict_ls_in:
+        test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+    test_dataset.finalise_data()
+    test_dataset.export_data()
+    return test_dataset
+
+
+@pytest.mark.parametrize(
+    'partition_by, exp_partition_by',
+    (
+            pytest.param(None, 'case_rep', id='default'),
+            pytest.param('Event_Type', 'event_type', id='event type'),
+            pytest.param('time', 'case_rep', id='unrecognised partitions'),
+    )
+)
+@pytest.mark.parametrize(
+    'dataset_config',
+    (
+            pytest.param({}, id='default'),
+            pytest.param({'output_csv': '0', 'normalised_events_export': '1', 'split_files_by_type': '1',
+                          'parquet_compression': 'zstd'}, id='no csv, normalised events, split files, zstd'),
+    )
+)
+def test_partitioned_dataset(test_utils, partition_by, exp_partition_by, dataset_config):
+    """
+    Create dataset instances with the output_partitioned config option set and the partition_by config option set
+    (parametrize) for two replications of a case (with and without memory_optimised_dtypes) and a replication of a
+    second case, add entities and events, finalise them and export the data into the same partitioned dataset
+    Re-run the first replication with fewer events
+    Confirm the partitions are recorded in the metadata, that each CDF output is read back from the partitioned dataset
+    as the CDF Dataframes of the dataset instances (with the re-run replication replaced, not added to) and that
+    filters on the partition columns only read the matching partitions
+    """
+    fail_msg_ls = []
+    partitioned_location = path.join(output_location, f"CDF_Dataset_{exp_partition_by}_{len(dataset_config)}")
+    shutil.rmtree(partitioned_location, ignore_errors=True)
+    partitioned_config = dict(dataset_config, output_partitioned='1', partitioned_location=partitioned_location)
+    if partition_by is not None:
+        partitioned_config['partition_by'] = partition_by
+
+    dataset_dict = {}
+    for case, replication, serial, memory_optimised_dtypes, run_event_dict_ls in [
+            ('exp case', '1', '1', '0', event_dict_ls),
+            ('exp case', '2', '2', '1', event_dict_ls),
+            ('base case #2', '1', '3', '0', event_dict_ls),
+            ('exp case', '1', '4', '1', event_dict_ls[1:])]:
+        dataset_dict[(case, replication)] = make_test_dataset(
+            test_utils, dict(partitioned_config, case=case, replication=replication, serial=serial,
+                             memory_optimised_dtypes=memory_optimised_dtypes), run_event_dict_ls)
+    test_dataset = dataset_dict[('exp case', '1')]
+
+    if test_dataset.metadata_dict.get('partition_by') != exp_partition_by:
+        fail_msg_ls.append(f"metadata partition_by {test_dataset.metadata_dict.get('partition_by')} - expected "
+                           f"{exp_partition_by}")
+    if test_dataset.partitioned_location != partitioned_location:
+        fail_msg_ls.append(f"partitioned_location {test_dataset.partitioned_location} - expected "
+                           f"{partitioned_location}")
+
+    for df_lbl, cdf_df_attr, folder_name in [('entity table', 'CDF_entity_table_df', test_dataset.entity_folder_name),
+                                             ('events', 'CDF_events_df', test_dataset.events_folder_name),
+                                             ('combat power', 'CDF_combat_power_DF', test_dataset.cbt_folder_name)]:
+        partition_path_ls = glob(path.join(partitioned_location, folder_name, '**', 'rep=*'), recursive=True)
+        exp_partitions = len(dataset_dict)
+        if folder_name == test_dataset.events_folder_name and exp_partition_by == 'event_type':
+            exp_partitions = sum(dataset.CDF_events_df['event_type'].nunique() for dataset in dataset_dict.values())
+        if len(partition_path_ls) != exp_partitions:
+            fail_msg_ls.append(f"{df_lbl} partitioned dataset has {len(partition_path_ls)} partitions - expected "
+                               f"{exp_partitions}")
+
+        read_df = CDFfunc.read_cdf_dataset(path.join(partitioned_location, folder_name))
+        for (case, replication), dataset in dataset_dict.items():
+            cdf_df = getattr(dataset, cdf_df_attr).reset_index(drop=True)
+            if folder_name == test_dataset.events_folder_name and dataset.normalised_events_export:
+                cdf_df = cdf_df[[col_lbl for col_lbl in cdf_df.columns
+                                 if col_lbl not in dataset.evn_tbl_entity_detail_col_ls]]
+            case_rep_df = read_df[(read_df['case'] == case) & (read_df['rep'] == replication)]
+            # events partitioned by event type are read back in event type order
+            sort_col_ls = ['event_id'] if folder_name == test_dataset.events_folder_name else []
+            case_rep_df = case_rep_df.sort_values(sort_col_ls, kind='stable').reset_index(drop=True)
+            cdf_df = cdf_df.sort_values(sort_col_ls, kind='stable').reset_index(drop=True)
+            # string columns are read back with the pyarrow string storage
+            if not case_rep_df.astype(object).equals(cdf_df.astype(object)):
+                fail_msg_ls.append(f"{df_lbl} {case} {replication} rows in the partitioned dataset do not match the "
+                                   f"CDF Dataframe")
+                fail_msg_ls.append(test_utils.get_dataframe_diff(df_act=case_rep_df, df_exp=cdf_df))
+
+        filter_df = CDFfunc.read_cdf_dataset(path.join(partitioned_location, folder_name),
+                                             filters={'case': 'exp case', 'rep': [2]})
+        exp_rows = len(getattr(dataset_dict[('exp case', '2')], cdf_df_attr))
+        if len(filter_df) != exp_rows or set(filter_df['rep']) != {'2'}:
+            fail_msg_ls.append(f"{df_lbl} partitioned dataset filtered to exp case 2 has {len(filter_df)} rows of "
+                               f"reps {set(filter_df['rep'])} - expected {exp_rows} rows of rep 2")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+def test_partitioned_location_default(test_utils):
+    """
+    Create a dataset instance with the output_partitioned config option set and no partitioned_location
+    Confirm the partitioned dataset is in the CDF_Dataset folder of the output location
+    """
+    fail_msg_ls = []
+    test_dataset = test_utils.make_dataset(dataset_config={'output_partitioned': '1',
+                                                           'output_location': output_location})
+    exp_partitioned_location = path.join(output_location, "CDF_Dataset")
+    if test_dataset.partitioned_location != exp_partitioned_location:
+        fail_msg_ls.append(f"partitioned_location {test_dataset.partitioned_location} - expected "
+                           f"{exp_partitioned_location}")
+    if test_dataset.metadata_dict.get('partitioned_location') != exp_partitioned_location:
+        fail_msg_ls.append(f"metadata partitioned_location {test_dataset.metadata_dict.get('partitioned_location')} - "
+                           f"expected {exp_partitioned_location}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize('partition_by', (pytest.param('case_rep', id='case_rep'),
+                                          pytest.param('event_type', id='event type')))
+def test_partitioned_dataset_export_log(test_utils, caplog, partition_by):
+    """
+    Create a dataset instance with the output_partitioned config option set and the partition_by config option set
+    (parametrize), add entities and events, finalise it and export the data
+    Confirm a partition is logged as exported for each CDF output (and each event type if partitioned by event type)
+    and that each logged partition is a folder of the partitioned dataset holding a .parquet file
+    """
+    fail_msg_ls = []
+    partitioned_location = path.join(output_location, f"CDF_Dataset_log_{partition_by}")
+    shutil.rmtree(partitioned_location, ignore_errors=True)
+    test_dataset = test_utils.make_dataset(dataset_config={'output_partitioned': '1', 'output_csv': '0',
+                                                           'partition_by': partition_by, 'serial': '5',
+                                                           'partitioned_location': partitioned_location,
+                                                           'output_location': output_location})
+    test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+    for event_dict in event_dict_ls:
+        test_utils.add_single_events(dataset=test_dataset, event_dict=event_dict)
+    test_dataset.finalise_data()
+    with caplog.at_level(logging.INFO, logger=test_dataset.logger.name):
+        test_dataset.export_data()
+
+    partition_path_ls = [record.getMessage()[:-len(" exported")] for record in caplog.records
+                         if record.getMessage().startswith(partitioned_location) and
+                         record.getMessage().endswith(" exported")]
+    exp_partitions = 3
+    if partition_by == 'event_type':
+        exp_partitions = 2 + test_dataset.CDF_events_df['event_type'].nunique()
+    if len(partition_path_ls) != exp_partitions:
+        fail_msg_ls.append(f"{len(partition_path_ls)} partitions logged as exported - expected {exp_partitions}")
+    for partition_path in partition_path_ls:
+        if not path.isfile(path.join(partition_path, "part-0.parquet")):
+            fail_msg_ls.append(f"logged partition {partition_path} has no .parquet file")
+
+    test_utils.check_fail_ls(fail_msg_ls)
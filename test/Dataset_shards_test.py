@@ -0,0 +1,209 @@
+import pytest
+import pandas as pd
+from os import path, listdir
+from processor_core.Dataset import DataSet
+from processor_core.CDF_Func import CDFfunc
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3', 't-4', 't-5'],
+            'unit_name': ['tank', 'tank', 'inf', 'hq', 'recce'],
+            'affiliation': ['blue', 'blue', 'red', 'red', 'blue'],
+            'force': ['nato', 'nato', 'opfor', 'opfor', 'nato'],
+            'commander': ['t-4', 't-4', 't-4', None, 't-1'],
+            'init_comps': [2, 2, 3, 1, 1],
+            'cbt_per_comp': [1.5, 1.5, 2.0, 1.0, 0.5]}
+
+output_location = path.join('Output', 'ShardsTest')
+
+
+def build_test_dataset(process_config: dict) -> DataSet:
+    # add the entities and events in the way a model processor would - entity data and event lists for each entity
+    # and then single events in time order across the entities
+    test_dataset = DataSet(dataset_config=process_config, log_stream=False, log_file=False)
+    for idx, uid in enumerate(ent_dict['uid']):
+        test_dataset.add_entity(uid)
+        test_dataset.set_entity_data(uid, unit_name=ent_dict['unit_name'][idx],
+                                     affiliation=ent_dict['affiliation'][idx], force=ent_dict['force'][idx],
+                                     commander=ent_dict['commander'][idx], init_comps=ent_dict['init_comps'][idx],
+                                     cbt_per_comp=ent_dict['cbt_per_comp'][idx])
+    for idx, entity in enumerate(test_dataset.entities):
+        test_dataset.append_to_list(uid=entity.uid, target_list='location_time', data_list=[0.0, 2.0 + idx])
+        test_dataset.append_to_list(uid=entity.uid, target_list='location_x', data_list=[float(idx), idx + 0.5])
+        test_dataset.append_to_list(uid=entity.uid, target_list='location_y', data_list=[5.0, 6.0 - idx])
+        test_dataset.append_to_list(uid=entity.uid, target_list='location_detail', data_list=[None, None])
+    for idx, entity in enumerate(test_dataset.entities):
+        test_dataset.append_to_list(uid=entity.uid, target_list='spot_time', data_list=[1.0 + idx])
+        test_dataset.append_to_list(uid=entity.uid, target_list='spot_entity',
+                                    data_list=[ent_dict['uid'][(idx + 2) % len(ent_dict['uid'])]])
+        test_dataset.append_to_list(uid=entity.uid, target_list='spot_detail', data_list=[None])
+    test_dataset.add_shot(uid='t-1', time=3.0, detail_keys=['weapon'], detail_vals=['gun'])
+    test_dataset.add_shot(uid='t-3', time=3.5, detail_keys=['weapon'], detail_vals=['rifle'])
+    test_dataset.add_loss(uid='t-3', time=4.0, killer='t-1', detail_keys=[], detail_vals=[])
+    # positional arguments (the secondary entity is read from the argument after time by the shard run wrapper)
+    test_dataset.add_kill('t-1', 4.0, 't-3', [], [])
+    test_dataset.add_location(uid='t-2', time=4.5, x=9.0, y=9.5, detail_keys=[], detail_vals=[])
+    test_dataset.add_shot(uid='t-2', time=5.0, detail_keys=['weapon'], detail_vals=['gun'])
+    test_dataset.add_loss(uid='t-2', time=6.0, killer='t-4', detail_keys=[], detail_vals=[])
+    test_dataset.add_status(uid='t-5', time=6.5, detail_keys=['status'], detail_vals=['withdraw'])
+    test_dataset.remove_event('shot-2')
+    return test_dataset
+
+
+def shard_test_processor(process_config: dict) -> str:
+    test_dataset = build_test_dataset(process_config)
+    test_dataset.finalise_data()
+    test_dataset.export_data()
+    return "complete"
+
+
+@pytest.mark.parametrize('shards', (pytest.param(2, id='2 shards'), pytest.param(3, id='3 shards'),
+                                    pytest.param(6, id='more shards than entities')))
+@pytest.mark.parametrize(
+    'dataset_config',
+    (
+            pytest.param({}, id='default'),
+            pytest.param({'drop_location_events': '1', 'memory_optimised_dtypes': '1'},
+                         id='drop location, memory optimised'),
+    )
+)
+def test_shards(test_utils, shards, dataset_config):
+    """
+    Add the same entities and events to a dataset instance for each shard (shards config option set (parametrize)
+    and shard_index set for each shard) and finalise them, then merge the shards into a new dataset instance
+    Add the same entities and events to a dataset instance without the option and finalise it
+    Confirm each shard generates the CDF entity table and events rows of its own entities only, that the shard files
+    are removed and that the last event numbers, summary metadata and CDF Dataframes of the merged dataset instance
+    match the dataset instance without the option
+    """
+    fail_msg_ls = []
+    process_config = dict(dataset_config, output_location=output_location, serial='shard_test')
+
+    for shard_index in range(shards):
+        shard_dataset = build_test_dataset(dict(process_config, shards=str(shards), shard_index=str(shard_index)))
+        shard_dataset.finalise_data()
+        exp_uid_ls = ent_dict['uid'][shard_index::shards]
+        ent_id_ser = shard_dataset.CDF_entity_table_df[shard_dataset.ent_tbl_id_col_lbl].astype(str)
+        act_uid_ls = ent_id_ser[~ent_id_ser.isin(shard_dataset.shard_foreign_uid_set)].to_list()
+        if act_uid_ls != exp_uid_ls:
+            fail_msg_ls.append(f"shard {shard_index} entities {act_uid_ls} - expected {exp_uid_ls}")
+        event_uid_set = set(shard_dataset.CDF_events_df[shard_dataset.evn_tbl_prim_id_col_lbl].astype(str))
+        if not event_uid_set <= set(exp_uid_ls):
+            fail_msg_ls.append(f"shard {shard_index} CDF events rows of entities {sorted(event_uid_set)} - expected "
+                               f"rows of {exp_uid_ls} only")
+    test_dataset = test_utils.make_dataset(dataset_config=dict(process_config, shards=str(shards)))
+    if not test_dataset.merge_dataset_shards():
+        fail_msg_ls.append("shards not merged")
+    default_dataset = build_test_dataset(process_config)
+    default_dataset.finalise_data()
+
+    shard_file_ls = [file_name for file_name in listdir(output_location)
+                     if file_name.startswith(test_dataset.shard_file_prefix)]
+    if len(shard_file_ls) > 0:
+        fail_msg_ls.append(f"shard files {shard_file_ls} not removed after merge")
+
+    if test_dataset.metadata_dict.get('shards') != shards:
+        fail_msg_ls.append(f"metadata shards {test_dataset.metadata_dict.get('shards')} - expected {shards}")
+    for meta_key in list(test_dataset.event_last_ser_dict.values()) + ['total_entities',
+                                                                        'total_forces_and_affiliations',
+                                                                        'total_events', 'first_event', 'last_event']:
+        if test_dataset.metadata_dict.get(meta_key) != default_dataset.metadata_dict.get(meta_key):
+            fail_msg_ls.append(f"metadata {meta_key} {test_dataset.metadata_dict.get(meta_key)} - expected "
+                               f"{default_dataset.metadata_dict.get(meta_key)}")
+
+    for df_lbl, act_df, exp_df in [('entity table', test_dataset.CDF_entity_table_df,
+                                    default_dataset.CDF_entity_table_df),
+                                   ('events', test_dataset.CDF_events_df, default_dataset.CDF_events_df),
+                                   ('combat power', test_dataset.CDF_combat_power_DF,
+                                    default_dataset.CDF_combat_power_DF)]:
+        if not act_df.equals(exp_df) or not act_df.dtypes.equals(exp_df.dtypes):
+            fail_msg_ls.append(f"CDF {df_lbl} Dataframe does not match the dataset without shards")
+            fail_msg_ls.append(test_utils.get_dataframe_diff(df_act=act_df, df_exp=exp_df))
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+def test_shards_missing_shard(test_utils):
+    """
+    Add entities and events to a dataset instance for the first of two shards and finalise it
+    Confirm a new dataset instance with the shards config option set does not merge the shards
+    """
+    fail_msg_ls = []
+    process_config = {'output_location': output_location, 'serial': 'missing_shard_test', 'shards': '2'}
+
+    shard_test_processor(dict(process_config, shard_index='0'))
+    test_dataset = test_utils.make_dataset(dataset_config=process_config)
+    if test_dataset.merge_dataset_shards():
+        fail_msg_ls.append("shards merged with a shard file missing")
+    if test_dataset.get_num_entities() != 0:
+        fail_msg_ls.append(f"{test_dataset.get_num_entities()} entities added to the dataset - expected 0")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+@pytest.mark.parametrize(
+    'shards, shard_index, exp_shards, exp_shard_index',
+    (
+            pytest.param('2', '1', 2, 1, id='shard run'),
+            pytest.param('2.0', '0.0', 2, 0, id='shard run (float strings)'),
+            pytest.param('1', '-1', 1, -1, id='not sharded'),
+            pytest.param('two', '-1', 1, -1, id='unrecognised shards'),
+            pytest.param('0', '-1', 1, -1, id='zero shards'),
+            pytest.param('2', '2', 2, -1, id='shard index out of range'),
+            pytest.param('2', 'first', 2, -1, id='unrecognised shard index'),
+    )
+)
+def test_shards_config(test_utils, shards, shard_index, exp_shards, exp_shard_index):
+    """
+    Create a dataset instance with the shards and shard_index config options set (parametrize)
+    Confirm the values (or defaults for unrecognised values) are recorded in the metadata and set the shard run
+    """
+    fail_msg_ls = []
+
+    test_dataset = test_utils.make_dataset(dataset_config={'shards': shards, 'shard_index': shard_index,
+                                                           'output_location': output_location})
+    for setting, exp_value in [('shards', exp_shards), ('shard_index', exp_shard_index)]:
+        if test_dataset.metadata_dict.get(setting) != exp_value:
+            fail_msg_ls.append(f"metadata {setting} {test_dataset.metadata_dict.get(setting)} - expected {exp_value}")
+    if test_dataset.shard_run != (exp_shards > 1 and exp_shard_index >= 0):
+        fail_msg_ls.append(f"shard run {test_dataset.shard_run} - expected {not test_dataset.shard_run}")
+
+    test_utils.check_fail_ls(fail_msg_ls)
+
+
+def test_shards_batch_run(test_utils, monkeypatch):
+    """
+    Write a configuration file with a line with the shards config option set and a line without it and run it with
+    batch_run_processor (in sequence)
+    Confirm the CDF files exported for the two lines are the same
+    """
+    fail_msg_ls = []
+    batch_location = path.abspath(path.join(output_location, 'batch_run'))
+    config_df = pd.DataFrame({'serial': ['sharded', 'single'], 'case': ['shard_case', 'shard_case'],
+                              'replication': [1, 1], 'process': [1, 1],
+                              'output_location': ['sharded', 'single'], 'shards': [3, None]})
+    config_file = path.join(batch_location, 'shards_config.csv')
+    if not path.isdir(batch_location):
+        test_utils.make_dataset(dataset_config={'output_location': batch_location})
+    with open(config_file, "w") as config:
+        config.write("Batch settings" + "," * (len(config_df.columns) - 1) + "\n")
+    config_df.to_csv(config_file, mode='a', index=False)
+    monkeypatch.chdir(batch_location)
+
+    CDFfunc.batch_run_processor(model_processor=shard_test_processor, config_file='shards_config.csv',
+                                multiprocess=False)
+
+    for file_type in ['EntityTable', 'Events', 'Cbt_Pwr']:
+        cdf_df_ls = []
+        for cdf_location in ['sharded', 'single']:
+            # most recent file for the line (file names include the date and time)
+            cdf_file_ls = sorted([file_name for file_name in listdir(cdf_location)
+                                  if file_name.startswith(f"CDF_{file_type}_") and file_name.endswith('.csv')],
+                                 key=lambda file_name: path.getmtime(path.join(cdf_location, file_name)))
+            if len(cdf_file_ls) == 0:
+                fail_msg_ls.append(f"no {file_type} file exported to {cdf_location}")
+            else:
+                cdf_df_ls.append(pd.read_csv(path.join(cdf_location, cdf_file_ls[-1])))
+        if len(cdf_df_ls) == 2 and not cdf_df_ls[0].equals(cdf_df_ls[1]):
+            fail_msg_ls.append(f"CDF {file_type} file for the sharded line does not match the line without shards")
+            fail_msg_ls.append(test_utils.get_dataframe_diff(df_act=cdf_df_ls[0], df_exp=cdf_df_ls[1]))
+
+    test_utils.check_fail_ls(fail_msg_ls)
@@ -0,0 +1,81 @@
+import pytest
+
+ent_dict = {'uid': ['t-1', 't-2', 't-3'],
+            'init_comps': [2, 2, 2],
+            'cbt_per_comp': [1.5, 1.5, 1.5]}
+
+shot_event_dict = {'event_type': 'shot',
+                   'uid': ['t-1', 't-2', 't-1', 't-2', 't-1', 't-2'],
+                   'time': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+                   'detail_keys': [None],
+                   'detail_vals': [[None], [None], [None], [None], [None], [None]]}
+
+loss_event_dict = {'event_type': 'loss',
+                   'uid': ['t-3', 't-3'],
+                   'time': [5.0, 6.0],
+                   'entity': ['t-1', 't-2'],
+                   'detail_keys': [None],
+                   'detail_vals': [[None], [None]]}
+
+
+@pytest.mark.parametrize(
+    'validation_level, exp_validation_level',
+    (
+            pytest.param('full', 'full', id='full'),
+            pytest.param('sampled', 'sampled', id='sampled'),
+            pytest.param('off', 'off', id='off'),
+            pytest.param('Sampled', 'sampled', id='sampled (upper case)'),
+            pytest.param('partial', 'full', id='unrecognised level'),
+    )
+)
+def test_validation_level(test_utils, validation_level, exp_validation_level):
+    """
+    Create a dataset instance with the validation_level config option set (parametrize) and a second dataset instance
+    with the default validation level
+    Add the same entities and events to both dataset instances and finalise them
+    Confirm the validation level and time saved (not measured for validation off) are recorded in the metadata and the
+    CDF outputs match the default dataset instance
+    """
+    fail_msg_ls = []
+
+    dataset_ls = []
+    for config_dict in [{'validation_level': validation_level}, {}]:
+        test_dataset = test_utils.make_dataset(dataset_config=dict(config_dict,
+                                                                   output_location='Output/ValidationLevelTest'))
+        # small sample size so that the sampled checks skip rows
+        test_dataset.validation_sample_size = 2
+        test_utils.add_entities(dataset=test_dataset, ent_dict=ent_dict)
+        test_utils.add_single_events(dataset=test_dataset, event_dict=shot_event_dict)
+        test_utils.add_single_events(dataset=test_dataset, event_dict=loss_event_dict)
+        test_dataset.finalise_data()
+        dataset_ls.append(test_dataset)
+    test_dataset, default_dataset = dataset_ls
+
+    if test_dataset.validation_level != exp_validation_level:
+        fail_msg_ls.append(f"validation_level {test_dataset.validation_level} - expected {exp_validation_level}")
+    if test_dataset.metadata_dict.get('validation_level') != exp_validation_level:
+        fail_msg_ls.append(f"metadata validation_level {test_dataset.metadata_dict.get('validation_level')} - "
+                           f"expected {exp_validation_level}")
+    if default_dataset.metadata_dict.get('validation_level') != 'full':
+        fail_msg_ls.append(f"default metadata validation_level {default_dataset.metadata_dict.get('validation_level')}"
+                           f" - expected full")
+
+    time_saved = test_dataset.metadata_dict.get('validation_time_saved')
+    if exp_validation_level == 'off':
+        if time_saved is not None:
+            fail_msg_ls.append(f"metadata validation_time_saved {time_saved} - expected None (not measured) for "
+                               f"validation off")
+    elif type(time_saved) is not float or time_saved < 0:
+        fail_msg_ls.append(f"metadata validation_time_saved {time_saved} - expected a float >= 0")
+    elif exp_validation_level == 'full' and time_saved != 0:
+        fail_msg_ls.append(f"metadata validation_time_saved {time_saved} - expected 0 for full validation")
+
+    for df_lbl, act_df, exp_df in [('entity table', test_dataset.CDF_entity_table_df,
+                                    default_dataset.CDF_entity_table_df),
+                                   ('events', test_dataset.CDF_events_df, default_dataset.CDF_events_df),
+                                   ('combat power', test_dataset.CDF_combat_power_DF,
+                                    default_dataset.CDF_combat_power_DF)]:
+        if not act_df.equals(exp_df):
+            fail_msg_ls.append(f"CDF {df_lbl} Dataframe does not match the default validation level")
+
+    test_utils.check_fail_ls(fail_msg_ls)